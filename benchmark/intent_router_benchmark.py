@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+
+# Add project root to system path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from chatbot.intent_chatbot import IntentChatbot
+
+SAMPLE_INPUTS = [
+    "tell me about the history of perfume",
+    "any brand information?",
+    "who are you",
+    "good morning",
+    "tell me a joke",
+    "what time is it",
+    "i'm really happy today",
+    "i'm in a terrible mood tonight",
+    "i am so angry and annoyed",
+    "i'm an aquarius, any suggestions?",
+    "my sign is capricorn",
+    "something nice for the weekend",
+    "qwerty uiop",
+]
+
+
+def legacy_generate_response(bot: IntentChatbot, user_input: str) -> str:
+    """The routing chain as it was before the compiled router: sequential keyword scans and up to three VADER calls."""
+    user_input = user_input.lower()
+    for intent, keywords in bot.INTENT_KEYWORDS:
+        if any(k in user_input for k in keywords):
+            return getattr(bot, intent)()
+    if bot.analyzer.polarity_scores(user_input)['compound'] > 0.5 or any(k in user_input for k in bot.HAPPY_KEYWORDS):
+        return bot.respond_happy_confirmation()
+    if bot.analyzer.polarity_scores(user_input)['compound'] < -0.3 or any(k in user_input for k in bot.UPSET_KEYWORDS):
+        return bot.respond_upset_confirmation()
+    if bot.analyzer.polarity_scores(user_input)['compound'] < -0.5 or any(k in user_input for k in bot.ANGRY_KEYWORDS):
+        return bot.respond_angry_confirmation()
+    for zodiac in bot.zodiac_perfume_map:
+        if zodiac in user_input:
+            return bot.recommend_perfume_based_on_zodiac(zodiac)
+    return bot.default_response() + "\n" + bot.with_guidance()
+
+
+def uncached(bot: IntentChatbot) -> None:
+    bot._last_sentiment = None
+    bot.route_cache.clear()
+
+
+def time_per_turn(respond, inputs: list[str], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in inputs:
+            respond(text)
+    return (time.perf_counter() - start) / (repeat * len(inputs))
+
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    bot = IntentChatbot(name="Benchmark")
+    bot.warmup()
+
+    print(f"{'input':40} {'before (us)':>12} {'after (us)':>12}")
+    for text in SAMPLE_INPUTS:
+        before = time_per_turn(lambda t: legacy_generate_response(bot, t), [text], repeat)
+        # Turns never repeat text back to back in practice, so defeat the sentiment memo and the route cache.
+        after = time_per_turn(lambda t: (uncached(bot), bot.generate_response(t)), [text], repeat)
+        print(f"{text[:40]:40} {before * 1e6:12.1f} {after * 1e6:12.1f}")
+
+    before = time_per_turn(lambda t: legacy_generate_response(bot, t), SAMPLE_INPUTS, repeat)
+    after = time_per_turn(lambda t: (uncached(bot), bot.generate_response(t)), SAMPLE_INPUTS, repeat)
+    print(f"{'mean per turn':40} {before * 1e6:12.1f} {after * 1e6:12.1f}")
@@ -0,0 +1,323 @@
+"""
+End-to-end benchmark for the chatbot against the real dataset and synthetic catalogs scaled up from it.
+
+For every scale it reports, as JSON:
+    artifact_build_seconds   parsing the CSV and building the artifact cache
+    cold_start               import, artifact load, sentiment analyzer warmup and first response, in a fresh process
+    latency                  process_input p50/p99/mean (microseconds) per route: scent, zodiac, sentiment,
+                             small_talk, default; repeated texts may be answered from the caches
+    latency_uncached         the same with every cache cleared before each call, as no two turns repeated
+    peak_rss_mb              peak resident memory of the measuring process
+    batch                    run_batch throughput over a mixed query stream, once the workers are warm, and the
+                             seconds it took to start and warm them
+
+Usage:
+    python benchmark/perfumer_benchmark.py --output results.json
+    python benchmark/perfumer_benchmark.py --scales 1 10 --baseline results.json --tolerance 0.15
+
+With --baseline the run is compared metric by metric and the script exits with status 1 if anything regressed by
+more than the tolerance, so it can gate changes.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from functools import partial
+
+import numpy as np
+
+# Add project root to system path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from chatbot.artifacts import build_artifacts, read_dataset
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+DATASET_PATH = os.path.join(DATA_DIR, "perfume_dataset.csv")
+KEYWORDS_PATH = os.path.join(DATA_DIR, "scent_keywords.json")
+
+ZODIAC_TEMPLATES = ["i am a {}, any suggestions?", "my sign is {}", "what would suit a {}?"]
+SENTIMENT_INPUTS = [
+    "i am so happy today", "feeling wonderful and excited", "i am really frustrated", "this is terrible",
+    "i am so angry", "i'm furious right now", "what a lovely day", "i feel awful tonight",
+]
+SMALL_TALK_INPUTS = [
+    "hello", "good morning", "who are you", "tell me a joke", "what time is it", "tell me about the history of perfume",
+    "any brand information?", "can you help me", "what about the other one",
+]
+DEFAULT_INPUTS = ["qwerty uiop", "something nice for the weekend", "maybe later", "ok"]
+
+
+def write_scaled_dataset(csv_path: str, factor: int, target: str) -> str:
+    """
+    Write a synthetic catalog with `factor` copies of every perfume: each copy gets a numbered name and its notes
+    shuffled, so the note vocabulary and its distribution match the real data. Description and Image URL are left
+    out because the chatbot never reads them.
+    """
+    dataset = read_dataset(csv_path)[["Name", "Brand", "Notes"]].fillna("")
+    notes = [[note.strip() for note in text.split(",") if note.strip()] for text in dataset["Notes"]]
+    rng = np.random.default_rng(factor)
+    frames = [dataset]
+    for copy in range(1, factor):
+        frame = dataset.copy()
+        frame["Name"] = frame["Name"] + f" ({copy})"
+        frame["Notes"] = [", ".join(rng.permutation(row)) if row else "" for row in notes]
+        frames.append(frame)
+    import pandas as pd
+
+    pd.concat(frames, ignore_index=True).to_csv(target, index=False, encoding="ISO-8859-1", errors="replace")
+    return target
+
+
+def make_queries(scent_keywords: dict, zodiac_signs: list[str], count: int, seed: int) -> list[str]:
+    """
+    A shuffled mix of queries for every route; scent queries are mostly distinct so that caching does not hide
+    the scoring cost.
+    """
+    rng = random.Random(seed)
+    words = [word for keywords in scent_keywords.values() for word in keywords]
+    per_route = max(count // 5, 1)
+    queries = [f"i like {' and '.join(rng.sample(words, rng.randint(1, 3)))}" for _ in range(per_route * 2)]
+    queries += [rng.choice(ZODIAC_TEMPLATES).format(rng.choice(zodiac_signs)) for _ in range(per_route)]
+    queries += [rng.choice(SENTIMENT_INPUTS) for _ in range(per_route)]
+    queries += [rng.choice(SMALL_TALK_INPUTS + DEFAULT_INPUTS) for _ in range(per_route)]
+    rng.shuffle(queries)
+    return queries
+
+
+def classify(bot, text: str) -> str:
+    """
+    The route process_input takes for `text`, grouped the way latency is reported.
+    """
+    if bot.detect_scents(text).categories:
+        return "scent"
+    route = bot.intent_chatbot.route(text.lower())
+    if route in bot.intent_chatbot.zodiac_perfume_map:
+        return "zodiac"
+    if route.endswith("_confirmation"):
+        return "sentiment"
+    if route == "default":
+        return "default"
+    return "small_talk"
+
+
+def clear_caches(bot) -> None:
+    """
+    Forget every cached ranking, route, sentiment score, spelling correction and parsed query.
+    """
+    bot.candidate_cache.clear()
+    bot.intent_chatbot.route_cache.clear()
+    bot.intent_chatbot._last_sentiment = None
+    bot.spelling_corrector().cache.clear()
+    bot.note_matrix.note_ids.cache_clear()
+    if bot.mode == "semantic" and bot.semantic_retriever is not None:
+        bot.semantic_retriever.query_cache.clear()
+
+
+def time_routes(bot, queries: list[str], uncached: bool) -> dict[str, list[int]]:
+    """
+    process_input latency samples (nanoseconds) by route; with `uncached`, the caches are cleared before each call.
+    """
+    samples: dict[str, list[int]] = {}
+    for text in queries:
+        if uncached:
+            clear_caches(bot)
+        begin = time.perf_counter_ns()
+        bot.process_input(text)
+        elapsed = time.perf_counter_ns() - begin
+        # Classified afterwards so the lookup does not warm the route cache for the timed call
+        samples.setdefault(classify(bot, text), []).append(elapsed)
+    return samples
+
+
+def summarize(samples_ns: list[int]) -> dict:
+    micros = np.asarray(samples_ns, dtype=np.float64) / 1e3
+    return {
+        "count": len(samples_ns),
+        "p50_us": round(float(np.percentile(micros, 50)), 2),
+        "p99_us": round(float(np.percentile(micros, 99)), 2),
+        "mean_us": round(float(micros.mean()), 2),
+    }
+
+
+def peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+
+def measure_process(config: dict) -> dict:
+    """
+    Runs in a fresh interpreter so that cold start and peak memory are not flattered by the parent.
+    """
+    start = time.perf_counter()
+    from chatbot.batch import run_batch
+    from chatbot.perfume_chatbot import PerfumeChatbot
+    imported = time.perf_counter()
+
+    factory = partial(PerfumeChatbot.from_files, csv_path=config["csv"], keywords_path=config["keywords"],
+                      artifact_root=config["artifacts"], mode=config["mode"])
+    bot = factory()
+    len(bot.catalog)
+    loaded = time.perf_counter()
+    bot.warmup()
+    warmed = time.perf_counter()
+    bot.process_input("i like rose and vanilla")
+    answered = time.perf_counter()
+
+    random.seed(config["seed"])
+    queries = make_queries(bot.scent_keywords, list(bot.intent_chatbot.zodiac_perfume_map), config["queries"],
+                           config["seed"])
+    samples = time_routes(bot, queries, uncached=False)
+    uncached_samples = time_routes(bot, queries, uncached=True)
+
+    records = [{"line": line, "id": None, "query": text} for line, text in
+               enumerate(make_queries(bot.scent_keywords, list(bot.intent_chatbot.zodiac_perfume_map),
+                                      config["batch_queries"], config["seed"] + 1), 1)]
+    stats = run_batch(records, io.StringIO(), factory, workers=config["workers"], seed=config["seed"], report=None)
+
+    return {
+        "rows": len(bot.catalog),
+        "cold_start": {
+            "import_seconds": round(imported - start, 4),
+            "catalog_load_seconds": round(loaded - imported, 4),
+            "warmup_seconds": round(warmed - loaded, 4),
+            "first_response_seconds": round(answered - warmed, 4),
+            "total_seconds": round(answered - start, 4),
+        },
+        "latency": {route: summarize(values) for route, values in sorted(samples.items())},
+        "latency_uncached": {route: summarize(values) for route, values in sorted(uncached_samples.items())},
+        "peak_rss_mb": peak_rss_mb(),
+        "batch": {"queries": stats.queries, "workers": config["workers"],
+                  "queries_per_second": round(stats.queries_per_second, 1),
+                  "startup_seconds": round(stats.startup_seconds, 4)},
+    }
+
+
+def run_scale(factor: int, args: argparse.Namespace, workdir: str) -> dict:
+    csv_path = args.csv
+    if factor > 1:
+        csv_path = write_scaled_dataset(args.csv, factor, os.path.join(workdir, f"perfumes_x{factor}.csv"))
+    artifact_root = os.path.join(workdir, f"artifacts_x{factor}")
+
+    start = time.perf_counter()
+    build_artifacts(csv_path, args.keywords, artifact_root)
+    build_seconds = time.perf_counter() - start
+
+    config = {"csv": csv_path, "keywords": args.keywords, "artifacts": artifact_root, "mode": args.mode,
+              "queries": args.queries, "batch_queries": args.batch_queries, "workers": args.workers, "seed": args.seed}
+    child = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", json.dumps(config)],
+                           capture_output=True, text=True, check=True)
+    result = json.loads(child.stdout.strip().splitlines()[-1])
+    return {"artifact_build_seconds": round(build_seconds, 4), **result}
+
+
+def flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    metrics = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            metrics.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[name] = value
+    return metrics
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> dict:
+    """
+    Compare every timing, memory and throughput metric present in both runs. Throughput regresses when it drops,
+    everything else when it grows, by more than `tolerance` (a fraction).
+    """
+    ignored = ("rows", ".count", ".queries", ".workers")
+    now, before = flatten(current["results"]), flatten(baseline["results"])
+    rows, regressions = [], []
+    for name in sorted(now.keys() & before.keys()):
+        if name.endswith(ignored) or not before[name]:
+            continue
+        ratio = now[name] / before[name]
+        higher_is_better = name.endswith("per_second")
+        regressed = ratio < 1 - tolerance if higher_is_better else ratio > 1 + tolerance
+        rows.append({"metric": name, "baseline": before[name], "current": now[name], "ratio": round(ratio, 3),
+                     "regressed": regressed})
+        if regressed:
+            regressions.append(name)
+    return {"tolerance": tolerance, "metrics": rows, "regressions": regressions}
+
+
+def print_comparison(comparison: dict, stream) -> None:
+    stream.write(f"{'metric':55} {'baseline':>12} {'current':>12} {'ratio':>7}\n")
+    for row in comparison["metrics"]:
+        flag = "  REGRESSED" if row["regressed"] else ""
+        stream.write(f"{row['metric'][:55]:55} {row['baseline']:12.2f} {row['current']:12.2f} {row['ratio']:7.3f}{flag}\n")
+    stream.write(f"{len(comparison['regressions'])} regression(s) beyond {comparison['tolerance']:.0%}\n")
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark start-up, per-route latency, memory and throughput.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100], help="catalog size multipliers")
+    parser.add_argument("--csv", default=DATASET_PATH, help="perfume dataset CSV")
+    parser.add_argument("--keywords", default=KEYWORDS_PATH, help="scent keyword JSON")
+    parser.add_argument("--mode", choices=("keyword", "tfidf", "semantic"), default="keyword", help="recommendation scorer")
+    parser.add_argument("--queries", type=int, default=2000, help="timed process_input calls per scale")
+    parser.add_argument("--batch-queries", type=int, default=5000, help="queries replayed through run_batch")
+    parser.add_argument("--workers", type=int, default=1, help="batch worker processes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="-", help="result JSON file, or - for stdout")
+    parser.add_argument("--baseline", help="earlier result JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative slowdown before failing")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(measure_process(json.loads(args.child))))
+        return 0
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "mode": args.mode,
+            "queries": args.queries,
+            "batch_queries": args.batch_queries,
+            "seed": args.seed,
+        },
+        "results": {},
+    }
+    workdir = tempfile.mkdtemp(prefix="perfumer-bench-")
+    try:
+        for factor in args.scales:
+            sys.stderr.write(f"Benchmarking {factor}x catalog...\n")
+            report["results"][f"{factor}x"] = run_scale(factor, args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f), args.tolerance)
+        print_comparison(report["comparison"], sys.stderr)
+        status = 1 if report["comparison"]["regressions"] else 0
+
+    text = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
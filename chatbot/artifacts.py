@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import TYPE_CHECKING, Iterable
+
+import numpy as np
+
+from chatbot.catalog import PerfumeCatalog, load_array
+from chatbot.ingest import IngestReport, read_catalog, read_chunks
+from chatbot.note_index import NoteIndex
+from chatbot.note_matrix import NoteMatrix, NoteParser, keyword_phrases
+from chatbot.retrieval import TfidfQueryEncoder
+from chatbot.updates import read_updates
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from scipy.sparse import csr_matrix
+
+# Bump whenever the on-disk layout or the way any array is derived changes.
+ARTIFACT_VERSION = 4
+
+
+class ArtifactBundle:
+    """
+    Everything PerfumeChatbot needs at start-up, loaded from one artifact directory.
+    """
+
+    def __init__(self, path: str, key: str, catalog: PerfumeCatalog, scent_keywords: dict,
+                 vectorizer: TfidfQueryEncoder, tfidf_matrix: csr_matrix, note_index: NoteIndex,
+                 note_matrix: NoteMatrix) -> None:
+        self.path = path
+        self.key = key
+        self.catalog = catalog
+        self.scent_keywords = scent_keywords
+        self.vectorizer = vectorizer
+        self.tfidf_matrix = tfidf_matrix
+        self.note_index = note_index
+        self.note_matrix = note_matrix
+
+    def __len__(self) -> int:
+        return len(self.catalog)
+
+
+def artifact_key(csv_path: str, keywords_path: str, updates_path: str = None) -> str:
+    """
+    Hash of the format version, both source files and the update journal if there is one; any change yields a new
+    artifact directory.
+    """
+    digest = hashlib.sha256(f"perfumer-artifacts-v{ARTIFACT_VERSION}".encode("utf-8"))
+    paths = [csv_path, keywords_path]
+    if updates_path and os.path.exists(updates_path):
+        paths.append(updates_path)
+    for path in paths:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def read_dataset(csv_path: str, extra_columns: Iterable[str] = ()) -> pd.DataFrame:
+    """
+    The perfumes of a CSV file as ingested for the catalog (see chatbot.ingest.read_chunks), as one DataFrame of
+    Name, Brand, Notes and `extra_columns`.
+    """
+    import pandas as pd
+
+    chunks = [pd.DataFrame(chunk) for chunk in read_chunks(csv_path, extra_columns)]
+    columns = list(dict.fromkeys(("Name", "Brand", "Notes", *extra_columns)))
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=columns)
+
+
+def build_artifacts(csv_path: str, keywords_path: str, root: str, key: str = None, updates_path: str = None,
+                    report: IngestReport = None) -> str:
+    """
+    Stream the dataset into a catalog, replay the update journal at `updates_path` onto it, fit TF-IDF, the note
+    index and the note matrix, and publish them atomically under root/<key>, including the canonical note
+    vocabulary (note_vocabulary.json). What ingestion did is counted in `report` and recorded in meta.json.
+    Returns the artifact directory.
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    key = key or artifact_key(csv_path, keywords_path, updates_path)
+    target = os.path.join(root, key[:16])
+    os.makedirs(root, exist_ok=True)
+
+    report = report if report is not None else IngestReport()
+    catalog = read_catalog(csv_path, read_updates(updates_path), report=report)
+    vectorizer = TfidfVectorizer()
+    matrix = vectorizer.fit_transform(f"{name} {notes}" for name, notes in zip(catalog.names, catalog.notes)).tocsr()
+    note_index = NoteIndex(catalog.notes)
+    with open(keywords_path, "r", encoding="utf-8") as f:
+        note_matrix = NoteMatrix.fit(catalog, keyword_phrases(json.load(f)))
+
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=root)
+    try:
+        catalog.save(staging)
+        shutil.copyfile(keywords_path, os.path.join(staging, "scent_keywords.json"))
+
+        vocabulary = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+        with open(os.path.join(staging, "tfidf_vocabulary.json"), "w", encoding="utf-8") as f:
+            json.dump(vocabulary, f)
+        np.save(os.path.join(staging, "tfidf_idf.npy"), vectorizer.idf_)
+        np.save(os.path.join(staging, "tfidf_data.npy"), matrix.data)
+        # scipy copies mixed index dtypes on load, so indices and indptr share one dtype.
+        index_dtype = np.int32 if matrix.nnz < np.iinfo(np.int32).max else np.int64
+        np.save(os.path.join(staging, "tfidf_indices.npy"), matrix.indices.astype(index_dtype))
+        np.save(os.path.join(staging, "tfidf_indptr.npy"), matrix.indptr.astype(index_dtype))
+
+        tokens = list(note_index.postings)
+        offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+        np.cumsum([len(note_index.postings[token]) for token in tokens], out=offsets[1:])
+        postings = np.concatenate([note_index.postings[token] for token in tokens]) if tokens else np.empty(0, np.int32)
+        with open(os.path.join(staging, "notes_tokens.json"), "w", encoding="utf-8") as f:
+            json.dump(tokens, f)
+        np.save(os.path.join(staging, "notes_postings.npy"), postings.astype(np.int32))
+        np.save(os.path.join(staging, "notes_offsets.npy"), offsets)
+
+        # Canonical notes in id order with the number of perfumes having each, then the note x perfume matrix
+        frequencies = note_matrix.document_frequencies().tolist()
+        with open(os.path.join(staging, "note_vocabulary.json"), "w", encoding="utf-8") as f:
+            json.dump([[term, count] for term, count in zip(note_matrix.terms, frequencies)], f, ensure_ascii=False)
+        for name, sparse in (("note_matrix", note_matrix.matrix), ("note_by_perfume", note_matrix.by_perfume),
+                             ("note_folding", note_matrix.folding)):
+            index_dtype = np.int32 if sparse.nnz < np.iinfo(np.int32).max else np.int64
+            np.save(os.path.join(staging, f"{name}_indices.npy"), sparse.indices.astype(index_dtype))
+            np.save(os.path.join(staging, f"{name}_indptr.npy"), sparse.indptr.astype(index_dtype))
+
+        # meta.json is written last: a directory without it is never treated as valid.
+        with open(os.path.join(staging, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"version": ARTIFACT_VERSION, "key": key, "rows": len(catalog), "shape": list(matrix.shape),
+                       "ingest": report.as_dict()}, f)
+
+        os.chmod(staging, 0o755)
+        try:
+            os.rename(staging, target)
+        except OSError:
+            # Another process published the same key first; its copy is identical.
+            shutil.rmtree(staging, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    _prune_stale(root, keep=os.path.basename(target))
+    return target
+
+
+def load_artifacts(path: str) -> ArtifactBundle:
+    """
+    Open an artifact directory with every array memory-mapped read-only.
+    """
+    from scipy.sparse import csr_matrix
+
+    with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("version") != ARTIFACT_VERSION:
+        raise ValueError(f"Artifact at {path} has version {meta.get('version')}, expected {ARTIFACT_VERSION}")
+
+    catalog = PerfumeCatalog.load(path)
+    with open(os.path.join(path, "scent_keywords.json"), "r", encoding="utf-8") as f:
+        scent_keywords = json.load(f)
+
+    with open(os.path.join(path, "tfidf_vocabulary.json"), "r", encoding="utf-8") as f:
+        vocabulary = json.load(f)
+    vectorizer = TfidfQueryEncoder({term: i for i, term in enumerate(vocabulary)}, load_array(path, "tfidf_idf.npy"))
+    matrix = csr_matrix(
+        (load_array(path, "tfidf_data.npy"), load_array(path, "tfidf_indices.npy"), load_array(path, "tfidf_indptr.npy")),
+        shape=tuple(meta["shape"]),
+        copy=False,
+    )
+
+    with open(os.path.join(path, "notes_tokens.json"), "r", encoding="utf-8") as f:
+        tokens = json.load(f)
+    note_index = NoteIndex.from_postings(
+        catalog.notes, tokens, load_array(path, "notes_postings.npy"), load_array(path, "notes_offsets.npy")
+    )
+
+    with open(os.path.join(path, "note_vocabulary.json"), "r", encoding="utf-8") as f:
+        terms = [term for term, _ in json.load(f)]
+
+    def binary_matrix(name: str, shape: tuple[int, int]) -> csr_matrix:
+        # Every stored weight is 1
+        indices = load_array(path, f"{name}_indices.npy")
+        return csr_matrix((np.ones(len(indices), dtype=np.float32), indices, load_array(path, f"{name}_indptr.npy")),
+                          shape=shape, copy=False)
+
+    note_matrix = NoteMatrix(terms, binary_matrix("note_matrix", (len(terms), len(catalog))),
+                             binary_matrix("note_by_perfume", (len(catalog), len(terms))),
+                             binary_matrix("note_folding", (len(catalog.note_vocabulary), len(terms))),
+                             NoteParser(keyword_phrases(scent_keywords)))
+
+    return ArtifactBundle(path, meta["key"], catalog, scent_keywords, vectorizer, matrix, note_index, note_matrix)
+
+
+def load_or_build(csv_path: str, keywords_path: str, root: str, updates_path: str = None) -> ArtifactBundle:
+    """
+    Load the artifact matching the current sources, rebuilding it first if it is missing or stale.
+    """
+    key = artifact_key(csv_path, keywords_path, updates_path)
+    path = os.path.join(root, key[:16])
+    if os.path.exists(os.path.join(path, "meta.json")):
+        try:
+            bundle = load_artifacts(path)
+            if bundle.key == key:
+                return bundle
+        except (OSError, ValueError):
+            pass
+        shutil.rmtree(path, ignore_errors=True)
+    return load_artifacts(build_artifacts(csv_path, keywords_path, root, key, updates_path))
+
+
+def _prune_stale(root: str, keep: str) -> None:
+    for entry in os.listdir(root):
+        if entry != keep and not entry.startswith("."):
+            shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
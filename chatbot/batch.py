@@ -0,0 +1,144 @@
+import json
+import multiprocessing
+import queue
+import random
+import sys
+import time
+import traceback
+from collections import deque
+from itertools import islice
+from typing import Callable, Iterable, Iterator, NamedTuple, TextIO
+
+# Per-process chatbot, created once by the pool initializer
+_worker_bot = None
+# Seconds to wait for every worker to load its chatbot before giving up
+STARTUP_TIMEOUT = 600
+
+
+class BatchStats(NamedTuple):
+    """
+    Queries answered and the seconds spent answering them; creating and warming up the workers before the first
+    query is timed separately as `startup_seconds`, so throughput reflects answering alone.
+    """
+    queries: int
+    seconds: float
+    startup_seconds: float = 0.0
+
+    @property
+    def queries_per_second(self) -> float:
+        return self.queries / self.seconds if self.seconds > 0 else 0.0
+
+
+def read_queries(stream: TextIO) -> Iterator[dict]:
+    """
+    Lazily yield one query record per non-blank line.
+    JSON object lines must carry the text under "query" (or "text") and may carry an "id"; any other line is the query text itself.
+    """
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        record = None
+        if line.startswith("{"):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                record = None
+        if isinstance(record, dict):
+            query = record.get("query", record.get("text", ""))
+            yield {"line": line_number, "id": record.get("id"), "query": str(query)}
+        else:
+            yield {"line": line_number, "id": None, "query": line}
+
+
+def answer(bot, record: dict, seed: int = None) -> dict:
+    """
+    Answer a single query statelessly. With a seed, the bot draws its response templates from its own RNG seeded
+    per line, so the output does not depend on how queries were split between workers.
+    """
+    if seed is not None:
+        bot.rng = random.Random(f"{seed}:{record['line']}")
+    result = {"line": record["line"], "query": record["query"], "response": bot.process_input(record["query"])}
+    if record.get("id") is not None:
+        result["id"] = record["id"]
+    return result
+
+
+def _init_worker(bot_factory: Callable, ready=None) -> None:
+    # Reports to `ready` once the chatbot is warm, or with the traceback when it could not be created
+    global _worker_bot
+    try:
+        _worker_bot = bot_factory()
+        if hasattr(_worker_bot, "warmup"):
+            _worker_bot.warmup()
+    except BaseException:
+        if ready is not None:
+            ready.put(traceback.format_exc())
+        raise
+    if ready is not None:
+        ready.put(None)
+
+
+def _answer_chunk(chunk: list[dict], seed: int) -> list[dict]:
+    return [answer(_worker_bot, record, seed) for record in chunk]
+
+
+def _chunks(records: Iterable[dict], size: int) -> Iterator[list[dict]]:
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run_batch(records: Iterable[dict], output: TextIO, bot_factory: Callable, workers: int = 1, seed: int = None,
+              chunk_size: int = 64, report: TextIO = sys.stderr,
+              startup_timeout: float = STARTUP_TIMEOUT) -> BatchStats:
+    """
+    Answer every record and write one JSON line per answer, in input order.
+    Input is consumed lazily: at most `workers * 4` chunks are in flight, so memory stays bounded for any input size.
+    The clock for throughput starts once every worker has loaded and warmed up its chatbot; a worker failing to
+    do so, or not done within `startup_timeout` seconds, raises RuntimeError.
+    """
+    begin = time.perf_counter()
+    count = 0
+
+    def write(results: list[dict]) -> None:
+        nonlocal count
+        for result in results:
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+        count += len(results)
+
+    if workers <= 1:
+        _init_worker(bot_factory)
+        start = time.perf_counter()
+        for chunk in _chunks(records, chunk_size):
+            write(_answer_chunk(chunk, seed))
+    else:
+        max_pending = workers * 4
+        ready = multiprocessing.Queue()
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(bot_factory, ready)) as pool:
+            for _ in range(workers):
+                try:
+                    error = ready.get(timeout=startup_timeout)
+                except queue.Empty:
+                    raise RuntimeError(f"Batch workers did not start within {startup_timeout}s") from None
+                if error is not None:
+                    raise RuntimeError(f"A batch worker failed to create its chatbot:\n{error}")
+            start = time.perf_counter()
+            pending = deque()
+            for chunk in _chunks(records, chunk_size):
+                pending.append(pool.apply_async(_answer_chunk, (chunk, seed)))
+                if len(pending) >= max_pending:
+                    write(pending.popleft().get())
+            while pending:
+                write(pending.popleft().get())
+    output.flush()
+
+    stats = BatchStats(count, time.perf_counter() - start, start - begin)
+    if report is not None:
+        report.write(f"Processed {stats.queries} queries in {stats.seconds:.2f}s "
+                     f"({stats.queries_per_second:.1f} queries/sec) with {max(workers, 1)} worker(s), "
+                     f"after {stats.startup_seconds:.2f}s start-up\n")
+    return stats
@@ -0,0 +1,71 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class LRUCache:
+    """
+    Thread-safe mapping bounded to `maxsize` entries with least-recently-used eviction and hit/miss counters.
+    Entries belong to a `version` (e.g. the catalog they were computed from); moving to a new version drops them all.
+    """
+
+    def __init__(self, maxsize: int = 1024, version: Hashable = None) -> None:
+        self.maxsize = maxsize
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, version: Hashable = None, default: Any = None) -> Any:
+        """
+        Return the cached value, or `default` on a miss; a `version` different from the cache's invalidates it first.
+        """
+        with self._lock:
+            if version is not None and version != self.version:
+                self._invalidate(version)
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, version: Hashable = None) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if version is not None and version != self.version:
+                self._invalidate(version)
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _invalidate(self, version: Hashable) -> None:
+        if self.version is not None:
+            self.invalidations += 1
+        self._entries.clear()
+        self.version = version
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
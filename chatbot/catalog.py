@@ -0,0 +1,272 @@
+import json
+import os
+import sys
+from typing import Iterable, NamedTuple
+
+import numpy as np
+
+class Perfume(NamedTuple):
+    Name: str
+    Brand: str
+    Notes: str
+
+
+class StringColumn:
+    """
+    Read-only column of strings stored as one UTF-8 buffer plus row offsets, decoded on access.
+    Both arrays can be memory-mapped, so the column costs no private memory until rows are read.
+    """
+
+    def __init__(self, buffer: np.ndarray, offsets: np.ndarray) -> None:
+        self.buffer = buffer
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, values) -> "StringColumn":
+        encoded = [str(value).encode("utf-8") for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        buffer = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(buffer, offsets)
+
+    def extend(self, values) -> "StringColumn":
+        """
+        Return a new column with `values` appended; this one is left unchanged.
+        """
+        tail = StringColumn.from_strings(values)
+        offsets = np.concatenate([self.offsets, tail.offsets[1:] + self.offsets[-1]])
+        return StringColumn(np.concatenate([self.buffer, tail.buffer]), offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        return self.buffer[self.offsets[row]:self.offsets[row + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    def save(self, directory: str, name: str) -> None:
+        np.save(os.path.join(directory, f"{name}.buffer.npy"), self.buffer)
+        np.save(os.path.join(directory, f"{name}.offsets.npy"), self.offsets)
+
+    @classmethod
+    def load(cls, directory: str, name: str) -> "StringColumn":
+        return cls(load_array(directory, f"{name}.buffer.npy"), load_array(directory, f"{name}.offsets.npy"))
+
+
+class PerfumeCatalog:
+    """
+    Immutable, preprocessed view of the perfume dataset, built once and shared by every request.
+    Names and notes are packed string columns, brands are interned and stored as one code per row, and each
+    perfume's notes are parsed into note ids (`note_ids[note_offsets[row]:note_offsets[row + 1]]` into
+    `note_vocabulary`). All arrays are read-only.
+    """
+
+    def __init__(self, names: StringColumn, notes: StringColumn, brands: tuple[str, ...], brand_codes: np.ndarray,
+                 note_vocabulary: tuple[str, ...], note_ids: np.ndarray, note_offsets: np.ndarray,
+                 extra_columns: dict[str, StringColumn] = None) -> None:
+        self.names = names
+        self.notes = notes
+        self.brands = brands
+        self.brand_codes = _read_only(brand_codes)
+        self.note_vocabulary = note_vocabulary
+        self.note_ids = _read_only(note_ids)
+        self.note_offsets = _read_only(note_offsets)
+        self.extra_columns = dict(extra_columns or {})
+
+    @classmethod
+    def from_columns(cls, names: Iterable[str], brands: Iterable[str], notes: Iterable[str],
+                     extra_columns: dict[str, Iterable[str]] = None) -> "PerfumeCatalog":
+        builder = CatalogBuilder(extra_columns or ())
+        builder.add({"Name": names, "Brand": brands, "Notes": notes, **(extra_columns or {})})
+        return builder.build()
+
+    @classmethod
+    def from_frame(cls, dataset, extra_columns: Iterable[str] = ()) -> "PerfumeCatalog":
+        """
+        Build a catalog from a DataFrame without modifying it; missing values become empty strings.
+        Only Name, Brand and Notes are kept, plus any `extra_columns` (e.g. "Description", "Image URL") asked for.
+        """
+        def column(name: str):
+            return dataset[name].fillna('').astype(str) if name in dataset else [''] * len(dataset)
+
+        return cls.from_columns(
+            column('Name'), column('Brand'), column('Notes'),
+            {name: column(name) for name in extra_columns},
+        )
+
+    def extend(self, records: list[dict]) -> "PerfumeCatalog":
+        """
+        Return a new catalog with one row appended per record (a dict with Name, Brand, Notes and optionally the
+        kept extra columns). Existing rows keep their positions, brand codes and note ids; this catalog is unchanged.
+        """
+        def values(column: str) -> list[str]:
+            return [str(record.get(column) or '') for record in records]
+
+        brand_codes_by_name = {brand: code for code, brand in enumerate(self.brands)}
+        codes = [brand_codes_by_name.setdefault(sys.intern(brand), len(brand_codes_by_name)) for brand in values('Brand')]
+
+        note_id_by_name = {note: i for i, note in enumerate(self.note_vocabulary)}
+        note_ids: list[int] = []
+        note_offsets = np.zeros(len(records), dtype=np.int64)
+        for row, text in enumerate(values('Notes')):
+            for note in parse_notes(text):
+                note_ids.append(note_id_by_name.setdefault(note, len(note_id_by_name)))
+            note_offsets[row] = len(note_ids)
+
+        return PerfumeCatalog(
+            self.names.extend(values('Name')),
+            self.notes.extend(values('Notes')),
+            tuple(brand_codes_by_name),
+            np.concatenate([self.brand_codes, np.asarray(codes, dtype=np.int32)]),
+            tuple(note_id_by_name),
+            np.concatenate([self.note_ids, np.asarray(note_ids, dtype=np.int32)]),
+            np.concatenate([self.note_offsets, note_offsets + self.note_offsets[-1]]),
+            {name: column.extend(values(name)) for name, column in self.extra_columns.items()},
+        )
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def perfume(self, row: int) -> Perfume:
+        return Perfume(self.names[row], self.brands[self.brand_codes[row]], self.notes[row])
+
+    def record(self, row: int) -> dict[str, str]:
+        """
+        One row as a dict of every kept column, in the shape accepted by extend().
+        """
+        return {**self.perfume(row)._asdict(), **{name: column[row] for name, column in self.extra_columns.items()}}
+
+    def note_names(self, row: int) -> list[str]:
+        return [self.note_vocabulary[i] for i in self.note_ids[self.note_offsets[row]:self.note_offsets[row + 1]]]
+
+    def column(self, name: str) -> StringColumn:
+        """
+        Return a requested extra column such as "Description"; core columns are read through perfume().
+        """
+        try:
+            return self.extra_columns[name]
+        except KeyError:
+            raise KeyError(f"Column {name!r} was not kept in the catalog") from None
+
+    def save(self, directory: str) -> None:
+        self.names.save(directory, "Name")
+        self.notes.save(directory, "Notes")
+        for name, values in self.extra_columns.items():
+            values.save(directory, name)
+        np.save(os.path.join(directory, "brand_codes.npy"), self.brand_codes)
+        np.save(os.path.join(directory, "note_ids.npy"), self.note_ids)
+        np.save(os.path.join(directory, "note_offsets.npy"), self.note_offsets)
+        with open(os.path.join(directory, "catalog.json"), "w", encoding="utf-8") as f:
+            json.dump({"brands": self.brands, "note_vocabulary": self.note_vocabulary,
+                       "extra_columns": list(self.extra_columns)}, f)
+
+    @classmethod
+    def load(cls, directory: str) -> "PerfumeCatalog":
+        with open(os.path.join(directory, "catalog.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(
+            StringColumn.load(directory, "Name"),
+            StringColumn.load(directory, "Notes"),
+            tuple(sys.intern(brand) for brand in meta["brands"]),
+            load_array(directory, "brand_codes.npy"),
+            tuple(meta["note_vocabulary"]),
+            load_array(directory, "note_ids.npy"),
+            load_array(directory, "note_offsets.npy"),
+            {name: StringColumn.load(directory, name) for name in meta["extra_columns"]},
+        )
+
+
+class CatalogBuilder:
+    """
+    Builds a PerfumeCatalog from column chunks added one after the other. Between chunks only the packed UTF-8
+    columns, brand codes and note ids are kept, so a catalog can be built from a stream while holding the Python
+    strings of a single chunk.
+    """
+
+    def __init__(self, extra_columns: Iterable[str] = ()) -> None:
+        self.extra_columns = tuple(extra_columns)
+        self.rows = 0
+        self._brand_codes_by_name: dict[str, int] = {}
+        self._note_id_by_name: dict[str, int] = {}
+        self._buffers: dict[str, list[bytes]] = {name: [] for name in ("Name", "Notes", *self.extra_columns)}
+        self._lengths: dict[str, list[np.ndarray]] = {name: [] for name in self._buffers}
+        self._brand_codes: list[np.ndarray] = []
+        self._note_ids: list[np.ndarray] = []
+        self._note_counts: list[np.ndarray] = []
+
+    def add(self, chunk: dict[str, Iterable[str]]) -> None:
+        """
+        Append the rows of `chunk`, a dict of equally long columns (Name, Brand, Notes and the extra columns).
+        """
+        notes = [str(text) for text in chunk["Notes"]]
+        self._pack("Notes", notes)
+        self._pack("Name", chunk["Name"])
+        for name in self.extra_columns:
+            self._pack(name, chunk[name])
+
+        brand_codes_by_name = self._brand_codes_by_name
+        self._brand_codes.append(np.asarray(
+            [brand_codes_by_name.setdefault(sys.intern(str(brand)), len(brand_codes_by_name)) for brand in chunk["Brand"]],
+            dtype=np.int32))
+
+        note_id_by_name = self._note_id_by_name
+        note_ids: list[int] = []
+        counts = np.zeros(len(notes), dtype=np.int64)
+        for row, text in enumerate(notes):
+            ids = [note_id_by_name.setdefault(note, len(note_id_by_name)) for note in parse_notes(text)]
+            note_ids.extend(ids)
+            counts[row] = len(ids)
+        self._note_ids.append(np.asarray(note_ids, dtype=np.int32))
+        self._note_counts.append(counts)
+        self.rows += len(notes)
+
+    def build(self) -> "PerfumeCatalog":
+        columns = {name: self._column(name) for name in self._buffers}
+        note_offsets = np.zeros(self.rows + 1, dtype=np.int64)
+        np.cumsum(np.concatenate(self._note_counts or [np.empty(0, np.int64)]), out=note_offsets[1:])
+        return PerfumeCatalog(
+            columns.pop("Name"),
+            columns.pop("Notes"),
+            tuple(self._brand_codes_by_name),
+            np.concatenate(self._brand_codes or [np.empty(0, np.int32)]),
+            tuple(self._note_id_by_name),
+            np.concatenate(self._note_ids or [np.empty(0, np.int32)]),
+            note_offsets,
+            columns,
+        )
+
+    def _pack(self, name: str, values: Iterable[str]) -> None:
+        encoded = [str(value).encode("utf-8") for value in values]
+        self._buffers[name].append(b"".join(encoded))
+        self._lengths[name].append(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)))
+
+    def _column(self, name: str) -> StringColumn:
+        offsets = np.zeros(self.rows + 1, dtype=np.int64)
+        np.cumsum(np.concatenate(self._lengths[name] or [np.empty(0, np.int64)]), out=offsets[1:])
+        return StringColumn(np.frombuffer(b"".join(self._buffers[name]), dtype=np.uint8), offsets)
+
+
+def parse_notes(text: str) -> list[str]:
+    """
+    Split a comma-separated notes string into distinct lowercase note names, in order of appearance.
+    """
+    notes = (note.strip().lower() for note in text.split(","))
+    return list(dict.fromkeys(note for note in notes if note))
+
+
+def _read_only(array: np.ndarray) -> np.ndarray:
+    if array.flags.writeable:
+        array.flags.writeable = False
+    return array
+
+
+def load_array(directory: str, filename: str) -> np.ndarray:
+    path = os.path.join(directory, filename)
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:
+        # Zero-length arrays cannot be memory-mapped.
+        return np.load(path)
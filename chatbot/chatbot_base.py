@@ -1,12 +1,26 @@
+from chatbot.instrumentation import NULL_INSTRUMENTATION, attach
+
+
 class ChatbotBase:
     """
     Base class defining the structure and interface for all chatbot implementations.
     """
 
+    # Methods timed as named stages, and methods that each make up one turn, once instrument() is called
+    INSTRUMENTED_STAGES: dict[str, str] = {}
+    INSTRUMENTED_TURNS: tuple[str, ...] = ("process_input",)
+    instrumentation = NULL_INSTRUMENTATION
+
     def __init__(self, name: str = "Chatbot") -> None:
         self.name = name
         self.conversation_is_active = True
 
+    def instrument(self, instrumentation) -> None:
+        """
+        Record per-stage timings and counters of every turn into `instrumentation`; None turns it off again.
+        """
+        attach(self, instrumentation, self.INSTRUMENTED_STAGES, self.INSTRUMENTED_TURNS)
+
     def greeting(self) -> None:
         print(f'Hello I am {self.name}')
 
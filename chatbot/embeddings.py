@@ -0,0 +1,316 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from chatbot.cache import LRUCache
+from chatbot.catalog import load_array
+from chatbot.note_index import NoteIndex
+
+# Bump whenever the on-disk layout or the document text fed to the model changes.
+EMBEDDING_VERSION = 2
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+DTYPES = ("float16", "int8")
+
+
+def load_encoder(model: str = DEFAULT_MODEL):
+    """
+    Load a sentence-transformers model from the local cache (or a local directory); never touches the network.
+    """
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model, local_files_only=True)
+
+
+def perfume_document(name: str, notes: str, description: str) -> str:
+    """
+    Text embedded for one perfume: the prose description carries mood and season, the notes the accords.
+    """
+    return f"{name}. Notes: {notes}. {description}".strip()
+
+
+def encode(encoder, texts: list[str], batch_size: int = 64) -> np.ndarray:
+    """
+    L2-normalized float32 embeddings, encoded `batch_size` texts at a time.
+    """
+    vectors = encoder.encode(texts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True)
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Compress float32 rows to float16, or to int8 with one float32 scale per row (value ~= code * scale).
+    """
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"Unknown embedding dtype: {dtype!r}")
+
+
+def embedding_key(csv_path: str, model: str, dtype: str, updates_path: str = None) -> str:
+    digest = hashlib.sha256(f"perfumer-embeddings-v{EMBEDDING_VERSION}:{model}:{dtype}".encode("utf-8"))
+    paths = [csv_path]
+    if updates_path and os.path.exists(updates_path):
+        paths.append(updates_path)
+    for path in paths:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+class BruteForceIndex:
+    """
+    Exact inner-product search with BLAS over a compressed matrix. Matrices whose float32 form fits in
+    `max_decoded_bytes` are decoded once and kept; larger ones are decoded `block_size` rows at a time per search,
+    so the float32 working set stays bounded.
+    """
+
+    def __init__(self, vectors: np.ndarray, scales: np.ndarray = None, block_size: int = 16384,
+                 max_decoded_bytes: int = 64 << 20) -> None:
+        self.vectors = vectors
+        self.scales = scales
+        self.block_size = block_size
+        self.decoded = None
+        if vectors.size * 4 <= max_decoded_bytes:
+            self.decoded = self.decode()
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def decode(self, rows=slice(None)) -> np.ndarray:
+        block = np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.scales is not None:
+            block *= self.scales[rows][:, None]
+        return block
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        if self.decoded is not None:
+            return queries @ self.decoded.T
+        scores = np.empty((len(queries), len(self.vectors)), dtype=np.float32)
+        for start in range(0, len(self.vectors), self.block_size):
+            stop = min(start + self.block_size, len(self.vectors))
+            scores[:, start:stop] = queries @ self.decode(slice(start, stop)).T
+        return scores
+
+    def search(self, queries: np.ndarray, k: int, mask: np.ndarray = None) -> list[tuple[np.ndarray, np.ndarray]]:
+        """
+        Return (rows, scores) per query, best first; rows outside `mask` are never returned.
+        """
+        scores = self.scores(queries)
+        if mask is not None:
+            scores[:, ~mask] = -np.inf
+        return [top_k(np.arange(len(self.vectors)), row_scores, k) for row_scores in scores]
+
+
+class IVFIndex(BruteForceIndex):
+    """
+    Inverted-file approximate search: rows are clustered around `centroids` offline, and a query only scores the
+    rows of its `n_probe` closest clusters. Meant for catalogs in the 100k range, where exact search dominates.
+    """
+
+    def __init__(self, vectors: np.ndarray, scales: np.ndarray, centroids: np.ndarray, list_offsets: np.ndarray,
+                 list_rows: np.ndarray, n_probe: int = 8) -> None:
+        # Probed rows are decoded on the fly, so the full matrix is never kept decoded
+        super().__init__(vectors, scales, max_decoded_bytes=0)
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        self.n_probe = n_probe
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, scales: np.ndarray, n_lists: int, iterations: int = 10,
+              seed: int = 0) -> "IVFIndex":
+        """
+        Spherical k-means over the decoded rows, then one inverted list of row ids per centroid.
+        """
+        data = BruteForceIndex(vectors, scales, max_decoded_bytes=0).decode()
+        n_lists = max(1, min(n_lists, len(data)))
+        rng = np.random.default_rng(seed)
+        centroids = data[rng.choice(len(data), n_lists, replace=False)]
+        for _ in range(iterations):
+            assignment = _nearest(data, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, data)
+            empty = np.bincount(assignment, minlength=n_lists) == 0
+            # Restart empty clusters from random rows so that every list stays in use
+            sums[empty] = data[rng.choice(len(data), int(empty.sum()))]
+            centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+        assignment = _nearest(data, centroids)
+        order = np.argsort(assignment, kind="stable")
+        list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=n_lists), out=list_offsets[1:])
+        return cls(vectors, scales, centroids.astype(np.float32), list_offsets, order.astype(np.int32))
+
+    def search(self, queries: np.ndarray, k: int, mask: np.ndarray = None) -> list[tuple[np.ndarray, np.ndarray]]:
+        n_probe = min(self.n_probe, len(self.centroids))
+        probes = np.argpartition(-(queries @ self.centroids.T), n_probe - 1, axis=1)[:, :n_probe]
+        results = []
+        for query, lists in zip(queries, probes):
+            rows = np.concatenate([self.list_rows[self.list_offsets[i]:self.list_offsets[i + 1]] for i in lists])
+            if mask is not None:
+                rows = rows[mask[rows]]
+            rows.sort()
+            results.append(top_k(rows, self.decode(rows) @ query, k))
+        return results
+
+
+class SemanticRetriever:
+    """
+    Top-k perfumes by embedding similarity to a free-text query, with the same interface as TfidfRetriever.
+    Query embeddings are cached by normalized text, and cache misses in a batch are encoded together.
+    """
+
+    def __init__(self, encoder, index: BruteForceIndex, note_index: NoteIndex = None, min_score: float = 0.3,
+                 cache_size: int = 1024, batch_size: int = 64) -> None:
+        self.encoder = encoder
+        self.index = index
+        self.note_index = note_index
+        self.min_score = min_score
+        self.batch_size = batch_size
+        self.query_cache = LRUCache(cache_size)
+        self.category_masks: dict[str, np.ndarray] = {}
+
+    def category_mask(self, scent_category: str) -> np.ndarray:
+        if not scent_category or self.note_index is None:
+            return None
+        mask = self.category_masks.get(scent_category)
+        if mask is None:
+            mask = np.zeros(len(self.index), dtype=bool)
+            mask[self.note_index.filter_rows(scent_category)] = True
+            self.category_masks[scent_category] = mask
+        return mask
+
+    def embed(self, queries: list[str]) -> np.ndarray:
+        keys = [" ".join(query.lower().split()) for query in queries]
+        vectors = [self.query_cache.get(key) for key in keys]
+        missing = sorted({key for key, vector in zip(keys, vectors) if vector is None})
+        if missing:
+            encoded = dict(zip(missing, encode(self.encoder, missing, self.batch_size)))
+            for key, vector in encoded.items():
+                self.query_cache.put(key, vector)
+            vectors = [encoded[key] if vector is None else vector for key, vector in zip(keys, vectors)]
+        return np.vstack(vectors)
+
+    def search(self, query: str, k: int = 5, scent_category: str = None) -> list[tuple[int, float]]:
+        """
+        Return up to k (row, similarity) pairs scoring at least `min_score`, best first.
+        """
+        return self.search_batch([query], k, scent_category)[0]
+
+    def search_batch(self, queries: list[str], k: int = 5, scent_category: str = None) -> list[list[tuple[int, float]]]:
+        if not queries:
+            return []
+        hits = self.index.search(self.embed(queries), k, self.category_mask(scent_category))
+        return [[(int(row), float(score)) for row, score in zip(rows, scores) if score >= self.min_score]
+                for rows, scores in hits]
+
+
+def top_k(rows: np.ndarray, scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The k best (rows, scores), ties broken on the lower row; masked-out (-inf) rows are dropped.
+    """
+    if k <= 0 or not len(scores):
+        return rows[:0], scores[:0]
+    top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    top = top[np.lexsort((rows[top], -scores[top]))]
+    top = top[np.isfinite(scores[top])]
+    return rows[top], scores[top]
+
+
+def _nearest(data: np.ndarray, centroids: np.ndarray, block_size: int = 16384) -> np.ndarray:
+    assignment = np.empty(len(data), dtype=np.int64)
+    for start in range(0, len(data), block_size):
+        assignment[start:start + block_size] = np.argmax(data[start:start + block_size] @ centroids.T, axis=1)
+    return assignment
+
+
+def build_embeddings(csv_path: str, root: str, model: str = DEFAULT_MODEL, dtype: str = "float16",
+                     ivf_lists: int = 0, encoder=None, batch_size: int = 64, updates_path: str = None) -> str:
+    """
+    Embed every perfume's name, notes and description once and publish the compressed matrix (plus an IVF index
+    when `ivf_lists` > 0) atomically under root/<key>. Rows follow the dataset order with the update journal
+    replayed, as in the artifact catalog.
+    """
+    from chatbot.ingest import read_chunks
+    from chatbot.updates import read_updates, replay_journal
+
+    if dtype not in DTYPES:
+        raise ValueError(f"Unknown embedding dtype: {dtype!r}")
+    key = embedding_key(csv_path, model, dtype, updates_path)
+    target = os.path.join(root, key[:16])
+    os.makedirs(root, exist_ok=True)
+
+    chunks = replay_journal(read_chunks(csv_path, ("Description",)), read_updates(updates_path), ("Description",))
+    documents = [perfume_document(name, notes, description) for chunk in chunks
+                 for name, notes, description in zip(chunk["Name"], chunk["Notes"], chunk["Description"])]
+    vectors, scales = quantize(encode(encoder or load_encoder(model), documents, batch_size), dtype)
+
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=root)
+    try:
+        np.save(os.path.join(staging, "vectors.npy"), vectors)
+        if scales is not None:
+            np.save(os.path.join(staging, "scales.npy"), scales)
+        if ivf_lists > 0:
+            ivf = IVFIndex.build(vectors, scales, ivf_lists)
+            np.save(os.path.join(staging, "ivf_centroids.npy"), ivf.centroids)
+            np.save(os.path.join(staging, "ivf_offsets.npy"), ivf.list_offsets)
+            np.save(os.path.join(staging, "ivf_rows.npy"), ivf.list_rows)
+        # meta.json is written last: a directory without it is never treated as valid.
+        with open(os.path.join(staging, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"version": EMBEDDING_VERSION, "key": key, "model": model, "dtype": dtype,
+                       "rows": len(vectors), "dim": int(vectors.shape[1]), "ivf_lists": ivf_lists}, f)
+        os.chmod(staging, 0o755)
+        if os.path.exists(target):
+            shutil.rmtree(target, ignore_errors=True)
+        try:
+            os.rename(staging, target)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return target
+
+
+def load_index(path: str, approximate: bool = True, n_probe: int = 8) -> BruteForceIndex:
+    """
+    Open an embedding directory memory-mapped; the IVF index is used when present and `approximate` is set.
+    """
+    with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("version") != EMBEDDING_VERSION:
+        raise ValueError(f"Embeddings at {path} have version {meta.get('version')}, expected {EMBEDDING_VERSION}")
+    vectors = load_array(path, "vectors.npy")
+    scales = load_array(path, "scales.npy") if meta["dtype"] == "int8" else None
+    if approximate and meta.get("ivf_lists"):
+        return IVFIndex(vectors, scales, load_array(path, "ivf_centroids.npy"), load_array(path, "ivf_offsets.npy"),
+                        load_array(path, "ivf_rows.npy"), n_probe)
+    return BruteForceIndex(vectors, scales)
+
+
+def load_semantic_retriever(csv_path: str, root: str, note_index: NoteIndex = None, model: str = DEFAULT_MODEL,
+                            dtype: str = "float16", encoder=None, updates_path: str = None) -> SemanticRetriever:
+    """
+    Load the embeddings for the current dataset, update journal and model, building them first if they are
+    missing or stale.
+    """
+    key = embedding_key(csv_path, model, dtype, updates_path)
+    path = os.path.join(root, key[:16])
+    encoder = encoder or load_encoder(model)
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        build_embeddings(csv_path, root, model, dtype, encoder=encoder, updates_path=updates_path)
+    return SemanticRetriever(encoder, load_index(path), note_index)
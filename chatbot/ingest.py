@@ -0,0 +1,175 @@
+import codecs
+import csv
+import re
+import unicodedata
+from typing import Iterable, Iterator
+
+from chatbot.catalog import CatalogBuilder, PerfumeCatalog
+from chatbot.updates import replay_journal
+
+# Columns every catalog row has; Name and Notes must be in the header, Brand may be missing
+CORE_COLUMNS = ("Name", "Brand", "Notes")
+# Single-byte encoding of legacy exports, and of stray non-UTF-8 bytes in an otherwise UTF-8 file
+LEGACY_ENCODING = "cp1252"
+# Bytes read to detect a file's encoding
+SAMPLE_SIZE = 1 << 20
+# Largest field accepted, well above any description
+MAX_FIELD_SIZE = 1 << 24
+UTF8_SEQUENCE = re.compile(rb"[\xc2-\xdf][\x80-\xbf]|[\xe0-\xef][\x80-\xbf]{2}|[\xf0-\xf4][\x80-\xbf]{3}")
+
+
+class IngestReport:
+    """
+    What ingestion did with the rows of one or more CSV files: the encoding detected for each file, the rows kept,
+    and the rows dropped as duplicates of an earlier (Name, Brand), skipped as unusable (too many fields, no name)
+    or repaired (missing trailing fields, or text that had to be decoded as LEGACY_ENCODING).
+    """
+
+    def __init__(self) -> None:
+        self.encodings: dict[str, str] = {}
+        self.rows = 0
+        self.duplicates = 0
+        self.skipped = 0
+        self.repaired = 0
+
+    def as_dict(self) -> dict:
+        return {"encodings": dict(self.encodings), "rows": self.rows, "duplicates": self.duplicates,
+                "skipped": self.skipped, "repaired": self.repaired}
+
+    def __str__(self) -> str:
+        encodings = ", ".join(f"{path}: {encoding}" for path, encoding in self.encodings.items())
+        return (f"{self.rows} rows kept, {self.duplicates} duplicates, {self.skipped} skipped, "
+                f"{self.repaired} repaired ({encodings})")
+
+
+def detect_encoding(path: str, sample_size: int = SAMPLE_SIZE) -> str:
+    """
+    Encoding of a CSV file from its first `sample_size` bytes: "utf-8-sig" with a byte order mark, "utf-8" when
+    the sample is valid UTF-8 or mixes UTF-8 text with stray legacy bytes (which are then repaired per field), and
+    LEGACY_ENCODING when it has non-ASCII bytes but no UTF-8 sequence at all.
+    """
+    with open(path, "rb") as f:
+        sample = f.read(sample_size)
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # A sequence cut at the end of the sample is not an error
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "utf-8" if UTF8_SEQUENCE.search(sample) else LEGACY_ENCODING
+
+
+def read_chunks(path: str, extra_columns: Iterable[str] = (), chunk_size: int = 10000,
+                report: IngestReport = None) -> Iterator[dict[str, list[str]]]:
+    """
+    Stream the perfumes of a CSV file as chunks of at most `chunk_size` rows, each a dict of columns (Name, Brand,
+    Notes and the `extra_columns`); other columns are parsed past but never decoded or kept, so memory is bounded
+    by one chunk however large the file is. Values are NFC-normalized with runs of whitespace collapsed, rows
+    without a name are skipped, and only the first row of each (Name, Brand) is kept. Counts go to `report`.
+    """
+    report = report if report is not None else IngestReport()
+    encoding = detect_encoding(path)
+    report.encodings[path] = encoding
+    csv.field_size_limit(max(csv.field_size_limit(), MAX_FIELD_SIZE))
+
+    # Latin-1 maps every byte to one character, so fields are split on the raw bytes and only the kept ones are
+    # decoded, each on its own
+    with open(path, "r", encoding="latin-1", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        if header and encoding == "utf-8-sig":
+            header[0] = header[0][len(codecs.BOM_UTF8):]
+        header = [_decode(field, encoding)[0].strip() for field in header]
+        columns = list(dict.fromkeys((*CORE_COLUMNS, *extra_columns)))
+        for required in ("Name", "Notes"):
+            if required not in header:
+                raise ValueError(f"{path} has no {required!r} column")
+        positions = [header.index(column) if column in header else None for column in columns]
+
+        seen: set[tuple[str, str]] = set()
+        chunk: dict[str, list[str]] = {column: [] for column in columns}
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                break
+            except csv.Error:
+                report.skipped += 1
+                continue
+            if not row:
+                continue
+            if len(row) > len(header):
+                # A stray delimiter shifted the fields; which value belongs to which column is unknowable
+                report.skipped += 1
+                continue
+            repaired = len(row) < len(header)
+            values = []
+            for position in positions:
+                if position is None or position >= len(row):
+                    values.append("")
+                    continue
+                value, fallback = _decode(row[position], encoding)
+                values.append(value)
+                repaired |= fallback
+            name, brand = values[0], values[1]
+            if not name:
+                report.skipped += 1
+                continue
+            if (name, brand) in seen:
+                report.duplicates += 1
+                continue
+            seen.add((name, brand))
+            report.repaired += repaired
+            report.rows += 1
+            for column, value in zip(columns, values):
+                chunk[column].append(value)
+            if len(chunk["Name"]) >= chunk_size:
+                yield chunk
+                chunk = {column: [] for column in columns}
+        if chunk["Name"]:
+            yield chunk
+
+
+def _decode(field: str, encoding: str) -> tuple[str, bool]:
+    """
+    Decode a field read as Latin-1 and normalize it; also returns whether legacy bytes had to be repaired.
+    """
+    fallback = False
+    if not field.isascii():
+        raw = field.encode("latin-1")
+        if encoding == LEGACY_ENCODING:
+            field = raw.decode(LEGACY_ENCODING, errors="perfumer-latin-1")
+        else:
+            try:
+                field = raw.decode("utf-8")
+            except UnicodeDecodeError:
+                field = raw.decode("utf-8", errors="perfumer-legacy")
+                fallback = True
+        field = unicodedata.normalize("NFC", field)
+    return " ".join(field.split()), fallback
+
+
+def _legacy_bytes(error: UnicodeDecodeError) -> tuple[str, int]:
+    # Bytes that are not UTF-8 are read as LEGACY_ENCODING, and the few it leaves undefined as Latin-1
+    raw = error.object[error.start:error.end]
+    return raw.decode(LEGACY_ENCODING, errors="perfumer-latin-1"), error.end
+
+
+def _latin_1_bytes(error: UnicodeDecodeError) -> tuple[str, int]:
+    return error.object[error.start:error.end].decode("latin-1"), error.end
+
+
+codecs.register_error("perfumer-legacy", _legacy_bytes)
+codecs.register_error("perfumer-latin-1", _latin_1_bytes)
+
+
+def read_catalog(path: str, updates: list[dict] = (), extra_columns: Iterable[str] = (), chunk_size: int = 10000,
+                 report: IngestReport = None) -> PerfumeCatalog:
+    """
+    Build the catalog of a CSV file chunk by chunk, with the journal `updates` replayed onto it.
+    """
+    builder = CatalogBuilder(extra_columns)
+    for chunk in replay_journal(read_chunks(path, extra_columns, chunk_size, report), updates, extra_columns):
+        builder.add(chunk)
+    return builder.build()
@@ -0,0 +1,287 @@
+import json
+import sys
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Callable, TextIO
+
+# Upper bounds (seconds) of the latency histogram buckets, Prometheus style
+DEFAULT_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0)
+
+
+class TurnRecord:
+    """
+    Everything measured while answering one input: seconds per stage, counters and labels such as the route taken.
+    """
+
+    __slots__ = ("stages", "counters", "labels", "started")
+
+    def __init__(self) -> None:
+        self.stages: dict[str, float] = {}
+        self.counters: dict[str, int] = {}
+        self.labels: dict[str, str] = {}
+        self.started = time.perf_counter()
+
+    def as_dict(self) -> dict:
+        return {
+            "stages_ms": {stage: round(seconds * 1e3, 4) for stage, seconds in self.stages.items()},
+            "counters": dict(self.counters),
+            **self.labels,
+        }
+
+
+class _NullContext:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc_info) -> bool:
+        return False
+
+
+_NULL_CONTEXT = _NullContext()
+
+
+class NullInstrumentation:
+    """
+    The default: counters and labels are no-ops and no stage wrappers are attached, so an uninstrumented turn
+    only pays for a few empty method calls.
+    """
+
+    enabled = False
+
+    def turn(self) -> _NullContext:
+        return _NULL_CONTEXT
+
+    def stage(self, name: str) -> _NullContext:
+        return _NULL_CONTEXT
+
+    def count(self, name: str, value: int = 1) -> None:
+        pass
+
+    def label(self, name: str, value: str) -> None:
+        pass
+
+
+NULL_INSTRUMENTATION = NullInstrumentation()
+
+
+class _Stage:
+    __slots__ = ("instrumentation", "name", "started")
+
+    def __init__(self, instrumentation: "Instrumentation", name: str) -> None:
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> bool:
+        record = self.instrumentation.current()
+        if record is not None:
+            # Re-entered stages (e.g. a fallback) accumulate
+            record.stages[self.name] = record.stages.get(self.name, 0.0) + time.perf_counter() - self.started
+        return False
+
+
+class _Turn:
+    __slots__ = ("instrumentation", "outer")
+
+    def __init__(self, instrumentation: "Instrumentation") -> None:
+        self.instrumentation = instrumentation
+
+    def __enter__(self) -> TurnRecord:
+        local = self.instrumentation._local
+        self.outer = getattr(local, "record", None)
+        if self.outer is not None:
+            # Nested turn (PerfumeChatbot delegating to IntentChatbot): keep filling the outer record
+            return self.outer
+        local.record = TurnRecord()
+        return local.record
+
+    def __exit__(self, *exc_info) -> bool:
+        if self.outer is None:
+            local = self.instrumentation._local
+            record, local.record = local.record, None
+            record.stages["turn"] = time.perf_counter() - record.started
+            self.instrumentation.emit(record)
+        return False
+
+
+class Instrumentation(NullInstrumentation):
+    """
+    Collects per-stage timings, counters and labels for each turn and hands the finished TurnRecord to every sink.
+    Turns are tracked per thread, so one instance can be shared by a threaded server.
+
+    Usage:
+        bot.instrument(Instrumentation([HistogramSink()]))
+    """
+
+    enabled = True
+
+    def __init__(self, sinks: list = ()) -> None:
+        self.sinks = list(sinks)
+        self._local = threading.local()
+
+    def current(self) -> TurnRecord:
+        return getattr(self._local, "record", None)
+
+    def turn(self) -> _Turn:
+        return _Turn(self)
+
+    def stage(self, name: str) -> _Stage:
+        return _Stage(self, name)
+
+    def count(self, name: str, value: int = 1) -> None:
+        record = self.current()
+        if record is not None:
+            record.counters[name] = record.counters.get(name, 0) + value
+
+    def label(self, name: str, value: str) -> None:
+        record = self.current()
+        if record is not None:
+            record.labels[name] = value
+
+    def emit(self, record: TurnRecord) -> None:
+        for sink in self.sinks:
+            sink.emit(record)
+
+    def timed(self, name: str, function: Callable) -> Callable:
+        stage = self.stage
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+
+    def per_turn(self, function: Callable) -> Callable:
+        turn = self.turn
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with turn():
+                return function(*args, **kwargs)
+        return wrapper
+
+
+def attach(target, instrumentation: NullInstrumentation, stages: dict[str, str], turn_methods: tuple[str, ...]) -> None:
+    """
+    Shadow `target`'s methods with timed wrappers: each method named in `stages` records its stage, and each of
+    `turn_methods` opens a turn. A disabled (or None) instrumentation removes the wrappers again, leaving the
+    plain class methods on the hot path.
+    """
+    instrumentation = instrumentation or NULL_INSTRUMENTATION
+    target.instrumentation = instrumentation
+    for method in (*stages, *turn_methods):
+        target.__dict__.pop(method, None)
+    if not instrumentation.enabled:
+        return
+    for method, stage in stages.items():
+        setattr(target, method, instrumentation.timed(stage, getattr(target, method)))
+    for method in turn_methods:
+        setattr(target, method, instrumentation.per_turn(getattr(target, method)))
+
+
+class HistogramSink:
+    """
+    In-memory aggregation: a latency histogram per stage, counter totals, and turn counts per route.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        self.histograms: dict[str, list[int]] = {}
+        self.sums: dict[str, float] = {}
+        self.counters: dict[str, int] = {}
+        self.turns: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def emit(self, record: TurnRecord) -> None:
+        with self._lock:
+            for stage, seconds in record.stages.items():
+                counts = self.histograms.get(stage)
+                if counts is None:
+                    # One extra bucket for +Inf
+                    counts = self.histograms[stage] = [0] * (len(self.buckets) + 1)
+                counts[bisect_left(self.buckets, seconds)] += 1
+                self.sums[stage] = self.sums.get(stage, 0.0) + seconds
+            for name, value in record.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            route = record.labels.get("route", "unknown")
+            self.turns[route] = self.turns.get(route, 0) + 1
+
+    def quantile(self, stage: str, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-quantile (inf if it falls beyond the last bucket).
+        """
+        counts = self.histograms.get(stage)
+        if not counts:
+            return 0.0
+        rank = q * sum(counts)
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def summary(self) -> dict:
+        return {
+            "stages": {
+                stage: {
+                    "count": sum(counts),
+                    "mean_ms": round(self.sums[stage] / sum(counts) * 1e3, 4),
+                    "p50_ms": self.quantile(stage, 0.5) * 1e3,
+                    "p99_ms": self.quantile(stage, 0.99) * 1e3,
+                }
+                for stage, counts in self.histograms.items()
+            },
+            "counters": dict(self.counters),
+            "turns": dict(self.turns),
+        }
+
+
+class PrometheusSink(HistogramSink):
+    """
+    HistogramSink that renders its aggregates in the Prometheus text exposition format.
+    """
+
+    def __init__(self, prefix: str = "perfumer", buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        super().__init__(buckets)
+        self.prefix = prefix
+
+    def render(self) -> str:
+        lines = [f"# TYPE {self.prefix}_stage_seconds histogram"]
+        with self._lock:
+            for stage, counts in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{self.prefix}_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'{self.prefix}_stage_seconds_sum{{stage="{stage}"}} {self.sums[stage]!r}')
+                lines.append(f'{self.prefix}_stage_seconds_count{{stage="{stage}"}} {cumulative}')
+            lines.append(f"# TYPE {self.prefix}_events_total counter")
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'{self.prefix}_events_total{{event="{name}"}} {value}')
+            lines.append(f"# TYPE {self.prefix}_turns_total counter")
+            for route, value in sorted(self.turns.items()):
+                lines.append(f'{self.prefix}_turns_total{{route="{route}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+class JsonLogSink:
+    """
+    Writes one JSON line per turn, for log shipping or offline analysis.
+    """
+
+    def __init__(self, stream: TextIO = sys.stderr) -> None:
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def emit(self, record: TurnRecord) -> None:
+        line = json.dumps(record.as_dict(), ensure_ascii=False)
+        with self._lock:
+            self.stream.write(line + "\n")
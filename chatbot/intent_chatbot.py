@@ -1,11 +1,28 @@
+import os
 import re
 import random
-import nltk
+import threading
 from datetime import datetime
-from nltk.sentiment import SentimentIntensityAnalyzer
 
-# Initialize sentiment lexicon used for sentiment scoring
-nltk.download('vader_lexicon')
+from chatbot.cache import LRUCache
+from chatbot.instrumentation import NULL_INSTRUMENTATION, attach
+from chatbot.keyword_matcher import PriorityMatcher
+
+# The VADER lexicon ships with the project, so sentiment scoring never needs a download
+NLTK_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "nltk_data")
+VADER_LEXICON = "sentiment/vader_lexicon/vader_lexicon.txt"
+
+
+def load_sentiment_analyzer():
+    """
+    Build a VADER analyzer from the bundled lexicon; nltk is imported here rather than at module import.
+    """
+    import nltk.data
+    from nltk.sentiment import SentimentIntensityAnalyzer
+
+    if NLTK_DATA_DIR not in nltk.data.path:
+        nltk.data.path.insert(0, NLTK_DATA_DIR)
+    return SentimentIntensityAnalyzer(lexicon_file=VADER_LEXICON)
 
 
 class IntentChatbot:
@@ -14,11 +31,35 @@ class IntentChatbot:
     Provides responses based on user emotions, perfume brand knowledge, zodiac-based suggestions, and general small talk.
     """
 
-    def __init__(self, name: str = "Chatbot") -> None:
-        """Initialize chatbot with name and sentiment analyzer."""
+    # Keyword intents in routing priority, each named after the method that answers it
+    INTENT_KEYWORDS = (
+        ("get_perfume_history", ["perfume history", "history of perfume", "origin of perfume", "history"]),
+        ("get_perfume_brand_info", ["perfume brands", "brand information", "perfume brand information", "brand"]),
+        ("get_chatbot_info", ["who are you", "what do you do", "introduce yourself"]),
+        ("respond_small_talk", ["hello", "hi", "bro", "small talk", "good morning", "good afternoon", "good evening"]),
+        ("get_joke", ["joke", "make fun"]),
+        ("help", ["help", "assist", "aid"]),
+        ("get_time", ["what time is it", "current time", "time", "when"]),
+        ("ask_follow_up_question", ["next", "other"]),
+    )
+    # Intents whose keywords whole_word_intent() only counts as whole words: greetings as short as "hi" hide in
+    # ordinary words ("this", "something")
+    WHOLE_WORD_INTENTS = ("respond_small_talk",)
+    HAPPY_KEYWORDS = ["happy", "joyful", "excited", "pleased", "cheerful", "delighted", "elated"]
+    UPSET_KEYWORDS = ["Irritated", "Frustrated", "Agitated", "Upset", "Displeased", "Infuriated"]
+    ANGRY_KEYWORDS = ["angry", "mad", "furious", "annoyed", "fuck", "pissed", "shit"]
+    INSTRUMENTED_STAGES = {"route": "route", "sentiment_score": "sentiment"}
+    INSTRUMENTED_TURNS = ("generate_response",)
+    instrumentation = NULL_INSTRUMENTATION
+    # Draws the response templates; a seeded random.Random makes a run's answers reproducible
+    rng = random
+
+    def __init__(self, name: str = "Chatbot", cache_size: int = 1024) -> None:
+        """Initialize chatbot with name; the sentiment analyzer is loaded on first use or by warmup()."""
         self.name = name
         self.conversation_is_active = True
-        self.analyzer = SentimentIntensityAnalyzer()
+        self._analyzer = None
+        self._analyzer_lock = threading.Lock()
 
         # Mapping zodiac signs to personalized scent styles
         self.zodiac_perfume_map = {
@@ -36,8 +77,44 @@ class IntentChatbot:
             "pisces": "Dreamy and floral perfumes, with hints of lily and jasmine"
         }
 
+        # Keyword intents and zodiac signs compiled into one matcher; zodiac signs rank after every intent
+        self.intent_router = PriorityMatcher(
+            list(self.INTENT_KEYWORDS) + [(zodiac, [zodiac]) for zodiac in self.zodiac_perfume_map]
+        )
+        self.whole_word_router = PriorityMatcher(
+            [(intent, keywords) for intent, keywords in self.INTENT_KEYWORDS if intent in self.WHOLE_WORD_INTENTS],
+            whole_word_labels=self.WHOLE_WORD_INTENTS,
+        )
+        self._last_sentiment = None
+        # Routing decisions by lowercased input; responses are still drawn fresh each turn
+        self.route_cache = LRUCache(cache_size)
+
+    @property
+    def analyzer(self):
+        if self._analyzer is None:
+            with self._analyzer_lock:
+                if self._analyzer is None:
+                    self._analyzer = load_sentiment_analyzer()
+        return self._analyzer
+
+    @analyzer.setter
+    def analyzer(self, analyzer) -> None:
+        self._analyzer = analyzer
+        # Cached routes depend on the old analyzer's sentiment scores
+        self.route_cache.clear()
+
+    def instrument(self, instrumentation) -> None:
+        """
+        Record per-stage timings and counters of every turn into `instrumentation`; None turns it off again.
+        """
+        attach(self, instrumentation, self.INSTRUMENTED_STAGES, self.INSTRUMENTED_TURNS)
+
+    def warmup(self) -> None:
+        """Load the sentiment analyzer now instead of on the first emotional message."""
+        self.analyzer
+
     def respond_happy_confirmation(self) -> str:
-        return random.choice([
+        return self.rng.choice([
             "It makes me happy to see you happy. Ongoing you continue to serve.",
             "Since you are so happy, remember to give me a good review.",
             "Remember to be so happy every day. Continuing you continue to serve.",
@@ -45,14 +122,14 @@ class IntentChatbot:
         ])
 
     def respond_upset_confirmation(self) -> str:
-        return random.choice([
+        return self.rng.choice([
             "Don't be sad about the little things. Do you want me to tell you a joke?",
             "Life is full of setbacks, may you get out of it soon. Shall I tell you a joke to cheer you up?",
             "Please stop being frustrated! I can recommend a perfume for you, it might bring you joy."
         ])
 
     def respond_angry_confirmation(self) -> str:
-        return random.choice([
+        return self.rng.choice([
             "Please turn your grief into strength. Shall I tell you a joke to cheer you up?",
             "Anger harms the body. Why don't you let me tell you a joke?",
             "If venting your anger at me makes you feel better, then go ahead."
@@ -72,7 +149,7 @@ class IntentChatbot:
         return f"The time is {now.strftime('%H:%M:%S')}. \nDo you have any other questions? Continuing to serve you."
 
     def help(self) -> str:
-        return random.choice([
+        return self.rng.choice([
             "I'm here to help with anything you need! Whether it's jokes, advice, or a friendly chat, just ask!",
             "Need assistance or a good laugh? I’m here for both! Ask me anything!",
             "I’m your friendly chatbot, ready to help, share a joke, or just have a conversation. What’s on your mind?",
@@ -82,7 +159,7 @@ class IntentChatbot:
         ])
 
     def get_joke(self) -> str:
-        return random.choice([
+        return self.rng.choice([
             "My friend opened a perfume shop specializing in failed scent combinations. He says every time someone leaves, it's a huge relief.",
             "Why are perfume bottles always so nervous? Because they might get sprayed.",
             "Why can’t perfume keep a secret? Because it always gets out.",
@@ -97,7 +174,7 @@ class IntentChatbot:
         return self.respond_small_talk()
 
     def get_perfume_history(self) -> str:
-        return random.choice([
+        return self.rng.choice([
             "Perfume dates back to ancient Egypt, where it was used in religious rituals and for personal adornment.",
             "The word 'perfume' comes from the Latin word perfumare, meaning 'to smoke through,' as incense was often used in early fragrance-making.",
             "The first modern perfume factory was established in the 16th century in Italy, making it more accessible to the elite.",
@@ -108,7 +185,7 @@ class IntentChatbot:
         ])
 
     def get_perfume_brand_info(self) -> str:
-        return random.choice([
+        return self.rng.choice([
             "Chanel: Classic elegance and timeless luxury. Chanel No. 5, launched in 1921, is one of the best-selling perfumes in history, known for its floral aldehyde scent.",
             "Dior: Bold and elegant fragrances that reflect French refinement. Dior perfumes are often known for their rich, complex compositions.",
             "Guerlain: Being one of the oldest perfume houses (established in 1828). Guerlain is known for creating rich, opulent scents with a focus on floral, oriental, and powdery notes.",
@@ -122,32 +199,44 @@ class IntentChatbot:
         ])
 
     def get_chatbot_info(self) -> str:
-        return random.choice([
+        return self.rng.choice([
             "Regarding why I'm called ‘perfumer’, it's because I know a lot about perfume and I'd love to share that knowledge with you! \nPlease go ahead and ask me questions.",
             "I am ‘perfumer’, besides perfume, I have many other functions, such as checking the time, telling jokes, comforting your mood and so on. \nPlease go ahead and ask me questions.",
             "I'm ‘perfumer’, you can just call me by my first name, and I'm happy to bring you perfume knowledge and emotional value. \nPlease go ahead and ask me questions."
         ])
 
-    def user_is_happy(self, input_str: str) -> bool:
-        """Detect whether the user is expressing happiness."""
+    def sentiment_score(self, input_str: str) -> float:
+        """Compound VADER score, memoized for the most recent input so a turn scores its text only once."""
+        last = self._last_sentiment
+        if last is not None and last[0] is self._analyzer and last[1] == input_str:
+            return last[2]
         score = self.analyzer.polarity_scores(input_str)['compound']
-        return score > 0.5 or any(k in input_str.lower() for k in ["happy", "joyful", "excited", "pleased", "cheerful", "delighted", "elated"])
+        self._last_sentiment = (self._analyzer, input_str, score)
+        return score
+
+    def user_is_happy(self, input_str: str, score: float = None) -> bool:
+        """Detect whether the user is expressing happiness."""
+        if score is None:
+            score = self.sentiment_score(input_str)
+        return score > 0.5 or any(k in input_str.lower() for k in self.HAPPY_KEYWORDS)
 
-    def user_is_upset(self, input_str: str) -> bool:
+    def user_is_upset(self, input_str: str, score: float = None) -> bool:
         """Detect whether the user is expressing frustration or sadness."""
-        score = self.analyzer.polarity_scores(input_str)['compound']
-        return score < -0.3 or any(k in input_str.lower() for k in ["Irritated", "Frustrated", "Agitated", "Upset", "Displeased", "Infuriated"])
+        if score is None:
+            score = self.sentiment_score(input_str)
+        return score < -0.3 or any(k in input_str.lower() for k in self.UPSET_KEYWORDS)
 
-    def user_is_angry(self, input_str: str) -> bool:
+    def user_is_angry(self, input_str: str, score: float = None) -> bool:
         """Detect whether the user is expressing anger."""
-        score = self.analyzer.polarity_scores(input_str)['compound']
-        return score < -0.5 or any(k in input_str.lower() for k in ["angry", "mad", "furious", "annoyed", "fuck", "pissed", "shit"])
+        if score is None:
+            score = self.sentiment_score(input_str)
+        return score < -0.5 or any(k in input_str.lower() for k in self.ANGRY_KEYWORDS)
 
     def recommend_perfume_based_on_zodiac(self, zodiac_sign: str) -> str:
         return self.zodiac_perfume_map.get(zodiac_sign.lower(), "Sorry, I don't have a perfume suggestion for that sign.")
 
     def default_response(self) -> str:
-        return random.choice([
+        return self.rng.choice([
             "Sorry, I didn't quite catch that.", 
             "Hmm, I didn’t understand that.", 
             "Oops, I didn’t quite catch that.", 
@@ -167,43 +256,53 @@ class IntentChatbot:
     def generate_response(self, user_input: str) -> str:
         """Main routing logic that analyzes input and returns a response."""
         user_input = user_input.lower()
+        route = self.route(user_input)
+        self.instrumentation.label("route", "zodiac" if route in self.zodiac_perfume_map else route)
+
+        if route in self.zodiac_perfume_map:
+            zodiac = route
+            suggestion = self.recommend_perfume_based_on_zodiac(zodiac)
+            return f"Based on your zodiac sign ({zodiac}), I suggest a perfume with: {suggestion}. Of course, you don't have to pay attention to my advice if you have a favourite scent, it's most important to pursue what you like! \nAre you satisfied with the answer? You can keep asking me questions."
+
+        if route == "default":
+            return self.default_response() + "\n" + self.with_guidance()
+
+        return getattr(self, route)()
+
+    def route(self, user_input: str) -> str:
+        """
+        Decide how to answer the (lowercased) input: the name of the responding method, a zodiac sign, or "default".
+        """
+        route = self.route_cache.get(user_input)
+        if route is None:
+            self.instrumentation.count("route_cache_misses")
+            route = self._route(user_input)
+            self.route_cache.put(user_input, route)
+        else:
+            self.instrumentation.count("route_cache_hits")
+        return route
+
+    def whole_word_intent(self, user_input: str) -> str:
+        """
+        The highest-priority WHOLE_WORD_INTENTS intent whose keywords the (lowercased) input has as whole words, or
+        None: route() also matches them inside words, so "something" routes to small talk but greets nobody.
+        """
+        return self.whole_word_router.first_match(user_input)
+
+    def _route(self, user_input: str) -> str:
+        # One scan finds the highest-priority keyword intent, or failing that the first zodiac sign mentioned
+        match = self.intent_router.first_match(user_input)
+        if match is not None and match not in self.zodiac_perfume_map:
+            return match
+
+        score = self.sentiment_score(user_input)
+        if self.user_is_happy(user_input, score):
+            return "respond_happy_confirmation"
+
+        if self.user_is_upset(user_input, score):
+            return "respond_upset_confirmation"
+
+        if self.user_is_angry(user_input, score):
+            return "respond_angry_confirmation"
 
-        if any(k in user_input for k in ["perfume history", "history of perfume", "origin of perfume", "history"]):
-            return self.get_perfume_history()
-        
-        if any(k in user_input for k in ["perfume brands", "brand information", "perfume brand information", "brand"]):
-            return self.get_perfume_brand_info()
-        
-        if any(k in user_input for k in ["who are you", "what do you do", "introduce yourself"]):
-            return self.get_chatbot_info()
-        
-        if any(k in user_input for k in ["hello", "hi", "bro", "small talk", "good morning", "good afternoon", "good evening"]):
-            return self.respond_small_talk()
-        
-        if any(k in user_input for k in ["joke", "make fun"]):
-            return self.get_joke()
-        
-        if any(k in user_input for k in ["help", "assist", "aid"]):
-            return self.help()
-        
-        if any(k in user_input for k in ["what time is it", "current time", "time", "when"]):
-            return self.get_time()
-        
-        if any(k in user_input for k in ["next", "other"]):
-            return self.ask_follow_up_question()
-        
-        if self.user_is_happy(user_input):
-            return self.respond_happy_confirmation()
-        
-        if self.user_is_upset(user_input):
-            return self.respond_upset_confirmation()
-        
-        if self.user_is_angry(user_input):
-            return self.respond_angry_confirmation()
-
-        for zodiac in self.zodiac_perfume_map:
-            if zodiac in user_input:
-                suggestion = self.recommend_perfume_based_on_zodiac(zodiac)
-                return f"Based on your zodiac sign ({zodiac}), I suggest a perfume with: {suggestion}. Of course, you don't have to pay attention to my advice if you have a favourite scent, it's most important to pursue what you like! \nAre you satisfied with the answer? You can keep asking me questions."
-
-        return self.default_response() + "\n" + self.with_guidance()
\ No newline at end of file
+        return match or "default"
\ No newline at end of file
@@ -0,0 +1,110 @@
+from collections import deque
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over a fixed keyword list, compiled into a transition table.
+    Scanning a text visits each character once and reports every keyword occurrence, overlapping ones included.
+    """
+
+    def __init__(self, keywords: list[str]) -> None:
+        self.keywords = list(dict.fromkeys(keywords))
+        goto: list[dict[str, int]] = [{}]
+        outputs: list[list[int]] = [[]]
+        for keyword_id, keyword in enumerate(self.keywords):
+            state = 0
+            for char in keyword:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    outputs.append([])
+                state = next_state
+            outputs[state].append(keyword_id)
+
+        # Breadth-first pass: failure links, inherited outputs, and a full transition table so that scanning
+        # never has to follow failure links.
+        fail = [0] * len(goto)
+        transitions: list[dict[str, int]] = [dict(goto[0])]
+        transitions.extend({} for _ in range(len(goto) - 1))
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            outputs[state] = outputs[state] + outputs[fail[state]]
+            transitions[state] = dict(transitions[fail[state]])
+            for char, next_state in goto[state].items():
+                fail[next_state] = transitions[fail[state]].get(char, 0) if state else 0
+                transitions[state][char] = next_state
+                queue.append(next_state)
+        self.transitions = transitions
+        self.outputs = outputs
+
+    def iter_matches(self, text: str):
+        """
+        Yield (start, end, keyword_id) for every keyword occurrence in `text`.
+        """
+        transitions, outputs, keywords = self.transitions, self.outputs, self.keywords
+        state = 0
+        for end, char in enumerate(text, 1):
+            state = transitions[state].get(char, 0)
+            for keyword_id in outputs[state]:
+                yield end - len(keywords[keyword_id]), end, keyword_id
+
+
+class PriorityMatcher:
+    """
+    Ordered (label, keywords) groups compiled into one automaton.
+    first_match() returns the earliest-listed label with a keyword anywhere in the text, in one pass over the text;
+    keywords match as plain substrings, exactly like `any(k in text for k in keywords)` checked group by group,
+    except those of the `whole_word_labels` groups, which only match as whole words ("hi" not in "this").
+    """
+
+    def __init__(self, groups: list[tuple[str, list[str]]], whole_word_labels=()) -> None:
+        self.labels = [label for label, _ in groups]
+        whole_word_labels = frozenset(whole_word_labels)
+        priority_of: dict[str, int] = {}
+        whole_words: set[str] = set()
+        for priority, (label, keywords) in enumerate(groups):
+            for keyword in keywords:
+                if keyword not in priority_of:
+                    priority_of[keyword] = priority
+                    if label in whole_word_labels:
+                        whole_words.add(keyword)
+        self.automaton = KeywordAutomaton(list(priority_of))
+        unmatched = len(self.labels)
+        # Best (lowest) priority reported by each automaton state, and the (priority, length) of the whole-word
+        # keywords ending there, which still need their boundaries checked
+        self.state_priority = []
+        self.state_words = []
+        for output in self.automaton.outputs:
+            keywords = [self.automaton.keywords[k] for k in output]
+            self.state_priority.append(min((priority_of[k] for k in keywords if k not in whole_words),
+                                           default=unmatched))
+            self.state_words.append(sorted((priority_of[k], len(k)) for k in keywords if k in whole_words) or None)
+
+    def first_match(self, text: str) -> str:
+        """
+        Return the highest-priority label matched in `text`, or None.
+        """
+        transitions, state_priority, state_words = self.automaton.transitions, self.state_priority, self.state_words
+        best = len(self.labels)
+        state = 0
+        for end, char in enumerate(text, 1):
+            state = transitions[state].get(char, 0)
+            if state_priority[state] < best:
+                best = state_priority[state]
+                if best == 0:
+                    break
+            words = state_words[state]
+            if words is not None:
+                for priority, length in words:
+                    if priority >= best:
+                        break
+                    start = end - length
+                    if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                        best = priority
+                        break
+                if best == 0:
+                    break
+        return self.labels[best] if best < len(self.labels) else None
@@ -0,0 +1,107 @@
+import re
+from functools import lru_cache
+from typing import Iterable
+
+import numpy as np
+
+
+class NoteIndex:
+    """
+    Inverted index over perfume notes: note token -> sorted array of row positions.
+    Built once so that category filtering becomes posting-list operations instead of per-row string scans; keyword
+    scoring is done on whole notes by NoteMatrix.
+    """
+
+    # Keywords and category names are runs of ASCII letters, so any substring hit lies inside one such run of the notes text.
+    TOKEN_PATTERN = re.compile(r'[a-zA-Z]+')
+    LETTERS_ONLY = re.compile(r'[a-zA-Z]+\Z')
+
+    def __init__(self, notes: Iterable[str], cache_size: int = 4096, postings: dict[str, np.ndarray] = None,
+                 folded_postings: dict[str, np.ndarray] = None) -> None:
+        """
+        Tokenize `notes`, or adopt prebuilt `postings` (e.g. memory-mapped from an artifact) without re-scanning them.
+        """
+        if postings is None:
+            self.notes = [str(text) for text in notes]
+            rows_by_token: dict[str, list[int]] = {}
+            for row, text in enumerate(self.notes):
+                for token in set(self.TOKEN_PATTERN.findall(text)):
+                    rows_by_token.setdefault(token, []).append(row)
+            postings = {token: np.asarray(rows, dtype=np.int32) for token, rows in rows_by_token.items()}
+        else:
+            self.notes = notes
+        self.size = len(self.notes)
+        self.postings = postings
+        self.cache_size = cache_size
+
+        if folded_postings is None:
+            folded: dict[str, list[np.ndarray]] = {}
+            for token, rows in self.postings.items():
+                folded.setdefault(token.lower(), []).append(rows)
+            folded_postings = {
+                token: rows[0] if len(rows) == 1 else np.unique(np.concatenate(rows)) for token, rows in folded.items()
+            }
+        self.folded_postings = folded_postings
+
+        self.all_rows = np.arange(self.size, dtype=np.int32)
+        self.rows_containing = lru_cache(maxsize=cache_size)(self._rows_containing)
+
+    @classmethod
+    def from_postings(cls, notes, tokens: list[str], flat_postings: np.ndarray, offsets: np.ndarray, cache_size: int = 4096) -> "NoteIndex":
+        """
+        Rebuild an index from postings concatenated in `tokens` order, with `offsets` delimiting each token's rows.
+        """
+        postings = {token: flat_postings[offsets[i]:offsets[i + 1]] for i, token in enumerate(tokens)}
+        return cls(notes, cache_size, postings)
+
+    def extend(self, notes) -> "NoteIndex":
+        """
+        Return an index over `notes`, whose first `size` rows must be the ones indexed here. Only the new rows are
+        tokenized; posting arrays of tokens they do not mention are shared with this index, which is unchanged.
+        """
+        rows_by_token: dict[str, list[int]] = {}
+        for row in range(self.size, len(notes)):
+            for token in set(self.TOKEN_PATTERN.findall(str(notes[row]))):
+                rows_by_token.setdefault(token, []).append(row)
+        postings = dict(self.postings)
+        folded_rows: dict[str, set[int]] = {}
+        for token, rows in rows_by_token.items():
+            folded_rows.setdefault(token.lower(), set()).update(rows)
+            rows = np.asarray(rows, dtype=np.int32)
+            # New rows come after every existing one, so appending keeps the postings sorted
+            postings[token] = np.concatenate([postings[token], rows]) if token in postings else rows
+        folded_postings = dict(self.folded_postings)
+        for token, rows in folded_rows.items():
+            rows = np.asarray(sorted(rows), dtype=np.int32)
+            folded_postings[token] = np.concatenate([folded_postings[token], rows]) if token in folded_postings else rows
+        return type(self)(notes, self.cache_size, postings, folded_postings)
+
+    def _rows_containing(self, text: str, case_sensitive: bool = True) -> np.ndarray:
+        """
+        Return the sorted row positions whose notes contain `text` as a substring.
+        """
+        if not text:
+            return self.all_rows
+        if not self.LETTERS_ONLY.match(text):
+            # Anything spanning separators cannot be answered from tokens; fall back to a scan.
+            pattern = re.compile(re.escape(text) if case_sensitive else text, 0 if case_sensitive else re.IGNORECASE)
+            return np.asarray([row for row, notes in enumerate(self.notes) if pattern.search(notes)], dtype=np.int32)
+
+        if case_sensitive:
+            postings, needle = self.postings, text
+        else:
+            postings, needle = self.folded_postings, text.lower()
+        matches = [rows for token, rows in postings.items() if needle in token]
+        if not matches:
+            return np.empty(0, dtype=np.int32)
+        if len(matches) == 1:
+            return matches[0]
+        return np.unique(np.concatenate(matches))
+
+    def filter_rows(self, scent_category: str) -> np.ndarray:
+        """
+        Rows whose notes mention the scent category (case-insensitive), or every row when no category is given.
+        """
+        if scent_category:
+            return self.rows_containing(scent_category, False)
+        return self.all_rows
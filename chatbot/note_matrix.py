@@ -0,0 +1,254 @@
+import re
+from functools import lru_cache
+from typing import Iterable
+
+import numpy as np
+
+from chatbot.catalog import PerfumeCatalog
+
+# Separators between the notes of a Notes cell: " Vanilla bean, musks", "Soap Foam Accord (Aldehydes & Musk)"
+NOTE_SEPARATORS = re.compile(r"[,;/&()+]|\band\b")
+WORD_PATTERN = re.compile(r"[^\W\d_]+")
+# Longest phrase, in words, looked up when parsing a query
+MAX_PHRASE_WORDS = 5
+
+
+def singular(word: str) -> str:
+    """
+    Fold a lowercase English plural to its singular ("musks", "berries", "peaches"); words that only look plural
+    ("iris", "moss", "citrus") and short words are kept.
+    """
+    if len(word) <= 3 or word.endswith(("ss", "us", "is")):
+        return word
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith(("ches", "shes", "sses", "xes", "zes")):
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def canonical_words(text: str) -> list[str]:
+    return [singular(word) for word in WORD_PATTERN.findall(text.lower())]
+
+
+def canonical_note(text: str) -> str:
+    """
+    Canonical spelling of one note: lowercase, singular words separated by single spaces, so "Ylang-Ylang",
+    "ylang ylang" and "Ylang Ylangs" are the same note.
+    """
+    return " ".join(canonical_words(text))
+
+
+def keyword_phrases(scent_keywords: dict[str, list[str]]) -> list[str]:
+    """
+    Every keyword of a scent keyword table (category -> keywords), once each.
+    """
+    return list(dict.fromkeys(term for terms in scent_keywords.values() for term in terms))
+
+
+class NoteParser:
+    """
+    Splits a Notes cell into canonical note ids. Every note is its own id, plus the id of each scent keyword it
+    contains as whole words, which folds variants onto the keyword: "vanilla bean" -> {"vanilla bean", "vanilla"},
+    "damask rose" -> {"damask rose", "rose"}, while "rosewood" and "primrose" stay apart from "rose".
+    """
+
+    def __init__(self, keywords: Iterable[str] = ()) -> None:
+        self.keywords = tuple(dict.fromkeys(keywords))
+        self.keyword_notes = frozenset(filter(None, map(canonical_note, self.keywords)))
+        self.keyword_words = max((note.count(" ") + 1 for note in self.keyword_notes), default=0)
+
+    def note_ids(self, note: str) -> tuple[str, ...]:
+        """
+        Ids of one note (a piece of a Notes cell between separators).
+        """
+        words = canonical_words(note)
+        if not words:
+            return ()
+        ids = {" ".join(words)}
+        for size in range(1, min(self.keyword_words, len(words) - 1) + 1):
+            for start in range(len(words) - size + 1):
+                phrase = " ".join(words[start:start + size])
+                if phrase in self.keyword_notes:
+                    ids.add(phrase)
+        return tuple(sorted(ids))
+
+    def parse(self, notes: str) -> set[str]:
+        """
+        Ids of every note in a Notes cell, or in one comma-separated note of the catalog's note vocabulary.
+        """
+        ids: set[str] = set()
+        for note in NOTE_SEPARATORS.split(str(notes).lower()):
+            ids.update(self.note_ids(note))
+        return ids
+
+
+class NoteMatrix:
+    """
+    Notes as a sparse note x perfume matrix: row i of the CSR `matrix` lists the perfumes that have note
+    `terms[i]`, and `by_perfume` is its transpose (the notes of each perfume). Scoring a query is one sparse
+    product of its note weights with either, whichever touches fewer entries, instead of a substring test per
+    perfume and keyword.
+
+    It is derived from the notes the catalog already split on commas (`PerfumeCatalog.note_vocabulary`): each
+    distinct catalog note is parsed once into canonical ids, recorded in the `folding` matrix (catalog note x
+    canonical note), and the perfumes' catalog notes are folded through it.
+    """
+
+    def __init__(self, terms: list[str], matrix, by_perfume, folding, parser: NoteParser,
+                 cache_size: int = 4096) -> None:
+        """
+        `matrix` is a (len(terms), perfumes) CSR matrix, `by_perfume` the same as (perfumes, len(terms)) and
+        `folding` a (catalog notes, len(terms)) one, all binary, e.g. memory-mapped from an artifact.
+        """
+        self.terms = terms
+        self.ids = {term: i for i, term in enumerate(terms)}
+        self.matrix = matrix
+        self.by_perfume = by_perfume
+        self.folding = folding
+        self.parser = parser
+        self.cache_size = cache_size
+        self.phrase_words = min(MAX_PHRASE_WORDS, max((term.count(" ") + 1 for term in terms), default=0))
+        self.note_ids = lru_cache(maxsize=cache_size)(self._note_ids)
+
+    @classmethod
+    def fit(cls, catalog: PerfumeCatalog, keywords: Iterable[str] = (), cache_size: int = 4096) -> "NoteMatrix":
+        """
+        Parse the notes of `catalog` (which may be None, for an empty matrix), folding them onto `keywords`.
+        """
+        from scipy.sparse import csr_matrix
+
+        empty = csr_matrix((0, 0), dtype=np.float32)
+        empty = cls([], empty, empty, empty, NoteParser(keywords), cache_size)
+        return empty if catalog is None else empty.extend(catalog)
+
+    @property
+    def size(self) -> int:
+        return self.matrix.shape[1]
+
+    def extend(self, catalog: PerfumeCatalog) -> "NoteMatrix":
+        """
+        Return a matrix over `catalog`, whose first `size` rows and first catalog notes must be the ones folded
+        here; only catalog notes not seen before are parsed, and canonical notes not seen before get new ids
+        after the existing ones.
+        """
+        from scipy.sparse import csr_matrix, hstack, vstack
+
+        ids = dict(self.ids)
+        terms = list(self.terms)
+        known = self.folding.shape[0]
+        rows: list[int] = []
+        columns: list[int] = []
+        for row, note in enumerate(catalog.note_vocabulary[known:]):
+            for term in sorted(self.parser.parse(note)):
+                if term not in ids:
+                    ids[term] = len(terms)
+                    terms.append(term)
+                rows.append(row)
+                columns.append(ids[term])
+        folding = vstack([
+            _with_columns(self.folding, len(terms)),
+            csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, columns)),
+                       shape=(len(catalog.note_vocabulary) - known, len(terms))),
+        ], format="csr")
+
+        start = self.size
+        first, last = catalog.note_offsets[start], catalog.note_offsets[-1]
+        perfume_notes = csr_matrix(
+            (np.ones(last - first, dtype=np.float32), catalog.note_ids[first:last],
+             catalog.note_offsets[start:] - first),
+            shape=(len(catalog) - start, len(catalog.note_vocabulary)),
+        )
+        added = perfume_notes @ folding
+        # Several catalog notes may fold onto one canonical note ("rose", "damask rose"); a perfume has it once
+        added.data[:] = 1
+        added.sort_indices()
+        by_perfume = vstack([_with_columns(self.by_perfume, len(terms)), added], format="csr")
+        matrix = hstack([_with_rows(self.matrix, len(terms)), added.T.tocsr()], format="csr")
+        matrix.sort_indices()
+        return type(self)(terms, matrix, by_perfume, folding, self.parser, self.cache_size)
+
+    def _note_ids(self, text: str) -> tuple[int, ...]:
+        """
+        Ids of the notes mentioned in free text, found as runs of up to MAX_PHRASE_WORDS canonical words that do
+        not cross a separator ("rose and lavender" does not name "rose lavender"), in order of first mention.
+        """
+        found: dict[int, None] = {}
+        for piece in NOTE_SEPARATORS.split(text.lower()):
+            words = canonical_words(piece)
+            for start in range(len(words)):
+                for size in range(1, min(self.phrase_words, len(words) - start) + 1):
+                    note = self.ids.get(" ".join(words[start:start + size]))
+                    if note is not None:
+                        found[note] = None
+        return tuple(found)
+
+    def document_frequencies(self, live: np.ndarray = None) -> np.ndarray:
+        """
+        Number of perfumes (only those where `live` is set, if given) having each note.
+        """
+        if live is None:
+            return np.diff(self.matrix.indptr).astype(np.int64)
+        return np.rint(self.matrix @ live.astype(np.float32)).astype(np.int64)
+
+    def score(self, rows: np.ndarray, weights: dict[int, float]) -> np.ndarray:
+        """
+        For each of the given rows, the summed weight of the weighted notes it has.
+        """
+        if not weights:
+            return np.zeros(len(rows), dtype=np.float64)
+        indptr, indices = self.matrix.indptr, self.matrix.indices
+        lengths = [indptr[note + 1] - indptr[note] for note in weights]
+        values = np.fromiter(weights.values(), dtype=np.float64, count=len(weights))
+        if sum(lengths) > len(rows) * self.matrix.nnz / max(self.size, 1):
+            # The notes are common and the rows few: sum the weights over the rows' own notes instead, read straight
+            # from the CSR arrays (slicing the matrix costs more than the product for a few dozen rows)
+            dense = np.zeros(self.matrix.shape[0], dtype=np.float64)
+            dense[list(weights)] = values
+            indptr, indices = self.by_perfume.indptr, self.by_perfume.indices
+            starts = indptr[rows]
+            lengths = indptr[np.asarray(rows) + 1] - starts
+            ends = np.cumsum(lengths)
+            positions = np.arange(ends[-1] if len(ends) else 0) + np.repeat(starts - ends + lengths, lengths)
+            owners = np.repeat(np.arange(len(rows)), lengths)
+            return np.bincount(owners, weights=dense[indices[positions]], minlength=len(rows))
+        perfumes = np.concatenate([indices[indptr[note]:indptr[note + 1]] for note in weights])
+        # The product of the weights with the notes' rows, accumulated per perfume
+        scores = np.bincount(perfumes, weights=np.repeat(values, lengths), minlength=self.size)
+        return scores if len(rows) == self.size else scores[rows]
+
+    def rank(self, rows: np.ndarray, weights: dict[int, float], limit: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Up to `limit` rows ordered by score, ties broken by earlier position, with their scores.
+        """
+        if not len(rows) or limit <= 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64)
+        if not weights:
+            return rows[:limit], np.zeros(min(limit, len(rows)), dtype=np.float64)
+        scores = self.score(rows, weights)
+        if limit < len(rows):
+            # Everything scoring at least the limit-th best score, in row order; ties at the cut keep earlier rows
+            threshold = -np.partition(-scores, limit - 1)[limit - 1]
+            top = np.flatnonzero(scores >= threshold)
+        else:
+            top = np.arange(len(rows))
+        top = top[np.argsort(-scores[top], kind="stable")][:limit]
+        return rows[top], scores[top]
+
+
+def _with_rows(matrix, rows: int):
+    """
+    `matrix` with empty rows appended up to `rows`, sharing its arrays.
+    """
+    from scipy.sparse import csr_matrix
+
+    indptr = np.concatenate([matrix.indptr, np.full(rows - matrix.shape[0], matrix.indptr[-1])])
+    return csr_matrix((matrix.data, matrix.indices, indptr), shape=(rows, matrix.shape[1]), copy=False)
+
+
+def _with_columns(matrix, columns: int):
+    from scipy.sparse import csr_matrix
+
+    return csr_matrix((matrix.data, matrix.indices, matrix.indptr), shape=(matrix.shape[0], columns), copy=False)
@@ -1,12 +1,56 @@
+from __future__ import annotations
+
 import json
+import os
 import re
-import random
+import threading
+from functools import partial
+from typing import TYPE_CHECKING, Callable
 
-import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
+import numpy as np
 
+from chatbot.artifacts import ArtifactBundle, artifact_key, load_or_build
+from chatbot.cache import LRUCache
+from chatbot.catalog import Perfume, PerfumeCatalog
 from chatbot.chatbot_base import ChatbotBase
+from chatbot.embeddings import DEFAULT_MODEL, SemanticRetriever, load_semantic_retriever
 from chatbot.intent_chatbot import IntentChatbot
+from chatbot.note_index import NoteIndex
+from chatbot.note_matrix import NoteMatrix, canonical_note, keyword_phrases
+from chatbot.retrieval import TfidfQueryEncoder, TfidfRetriever, diversify
+from chatbot.refinement import Refinement, RefinementParser
+from chatbot.scent_detector import ScentDetector, ScentMatch
+from chatbot.session import ChatSession, QueryContext, RecommendationPage
+from chatbot.shards import ShardedRanker, ShardResult
+from chatbot.spelling import DOMAIN_WORDS, SpellingCorrector, english_words
+from chatbot.updates import CatalogSnapshot, compact_journal, perfume_key
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+DATASET_PATH = os.path.join(DATA_DIR, "perfume_dataset.csv")
+KEYWORDS_PATH = os.path.join(DATA_DIR, "scent_keywords.json")
+ARTIFACT_ROOT = os.path.join(DATA_DIR, "artifacts")
+EMBEDDING_ROOT = os.path.join(DATA_DIR, "embeddings")
+UPDATES_PATH = os.path.join(DATA_DIR, "catalog_updates.jsonl")
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+def __getattr__(name: str):
+    # pandas and scikit-learn take seconds to import, so they are only imported when something asks for them.
+    if name == "TfidfVectorizer":
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        return TfidfVectorizer
+    if name == "pd":
+        import pandas
+        return pandas
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _scaled(scores: np.ndarray) -> np.ndarray:
+    # Divided by the largest magnitude, so the best score is 1; all zeros stay zeros
+    peak = float(np.abs(scores).max()) if len(scores) else 0.0
+    return scores / peak if peak > 0 else scores
 
 
 class PerfumeChatbot(ChatbotBase):
@@ -14,27 +58,340 @@ class PerfumeChatbot(ChatbotBase):
     A hybrid chatbot combining custom scent-based perfume recommendations with general intent handling using IntentChatbot.
     """
 
-    def __init__(self, name: str = "Perfumer", dataset: pd.DataFrame = None) -> None:
+    MODES = ("keyword", "tfidf", "semantic")
+    NOTE_WEIGHTINGS = ("count", "idf")
+    # Intent routes that semantic mode may override: no intent matched, or only greeting keywords hidden inside
+    # ordinary words ("something" contains "hi"); a whole-word greeting is still answered as one
+    SEMANTIC_FALLBACK_ROUTES = ("default", "respond_small_talk")
+    EXIT_COMMANDS = ("exit", "quit", "bye", "goodbye")
+    # Asking for the following perfume of the kept ranking; whole words only, so "mother" is not "other"
+    NEXT_PATTERN = re.compile(r"\b(?:next|other|another)\b")
+    NOT_FOUND_MESSAGE = "I'm really sorry that I couldn't find the suitable perfume, can you change your favourite scent? (e.g. rose, violet, lime, grapefruit)"
+    EXHAUSTED_MESSAGE = "Those were all my best matches for that. Tell me another scent you love and I'll find you something new!"
+    PRICE_UNKNOWN_MESSAGE = "I don't have prices for these perfumes, so I can't compare them on cost. I can make it woodier, sweeter or fresher, or leave out a note you don't like!"
+    # Candidates scored per query, as a multiple of the list kept, so brand diversification has rows to choose from
+    DIVERSITY_POOL = 4
+    # Weight of a follow-up's notes ("woodier") against the original ranking, both scaled to a best score of 1
+    REFINEMENT_WEIGHT = 1.0
+    FAREWELL_MESSAGE = "Thank you for using customised perfume Journeys. We wish you a wonderful day in beautiful fragrances. Remember to give me a good review!"
+    INSTRUMENTED_TURNS = ("process_input", "process_turn")
+    INSTRUMENTED_STAGES = {
+        "correct_spelling": "spelling",
+        "detect_scents": "detect_scents",
+        "extract_keywords": "extract_keywords",
+        "rank_candidates": "rank",
+        "_filter_by_scent_category": "filter",
+        "_score_candidates": "score",
+        "_rank_in_shards": "shards",
+        "_refine_page": "refine",
+        "_compose_recommendation_response": "compose",
+    }
+    # Attributes filled in from the artifact bundle when the chatbot is created with an `artifact_loader`
+    LAZY_ATTRIBUTES = frozenset({"artifacts", "snapshot", "scent_keywords", "scent_detector", "refinement_parser"})
+
+    def __init__(self, name: str = "Perfumer", dataset: pd.DataFrame = None, mode: str = "keyword",
+                 artifacts: ArtifactBundle = None, artifact_loader: Callable[[], ArtifactBundle] = None,
+                 cache_size: int = 1024, candidate_limit: int = 20, extra_columns: tuple[str, ...] = (),
+                 semantic_retriever: SemanticRetriever = None,
+                 semantic_loader: Callable[..., SemanticRetriever] = None, diversity: float = 0.3,
+                 note_weighting: str = "idf", category_weight: float = 0.25, shards: int = 1,
+                 shard_deadline: float = 0.5) -> None:
         """
         Initialize chatbot with a dataset and prepare TF-IDF for perfume matching.
+        `mode` selects the recommendation scorer: "keyword" sums the weights of the notes named in the query,
+        "tfidf" ranks by TF-IDF similarity, "semantic" by sentence-embedding similarity from `semantic_retriever`
+        (or one built lazily by `semantic_loader(note_index=...)`); semantic mode also answers free-text requests
+        that name no scent.
+        A prebuilt `artifacts` bundle replaces `dataset` and skips all parsing and fitting; an `artifact_loader`
+        defers loading the bundle until it is first needed or warmup() is called.
+        Up to `cache_size` ranked candidate lists of `candidate_limit` perfumes are kept for repeated queries.
+        `diversity` (0 to 1) trades relevance for variety of brands within a ranked list.
+        Keyword scoring weighs each matched note by its idf (`note_weighting="idf"`) or 1 ("count"); notes listed
+        under the detected scent category also count, with `category_weight` times their weight.
+        With `shards` > 1, keyword and tfidf scoring is spread over that many worker processes (see ShardedRanker);
+        shards that take longer than `shard_deadline` seconds are left out of that answer. Call close() to stop them.
+        The dataset is read once into an immutable catalog and never modified; columns other than Name, Brand and
+        Notes are dropped unless listed in `extra_columns`.
+        Perfumes can be added, updated and removed at runtime without refitting; see apply_updates() and compact().
         """
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown recommendation mode: {mode!r}")
+        if note_weighting not in self.NOTE_WEIGHTINGS:
+            raise ValueError(f"Unknown note weighting: {note_weighting!r}")
 
         self.name = name
+        self.mode = mode
         self.conversation_is_active = True
-        self.intent_chatbot = IntentChatbot(name=name)
-        self.dataset = dataset
-        with open("data\\scent_keywords.json", "r", encoding="utf-8") as f:
-            self.scent_keywords = json.load(f)
+        self.intent_chatbot = IntentChatbot(name=name, cache_size=cache_size)
+        self.extra_columns = tuple(extra_columns)
+        self.candidate_limit = candidate_limit
+        self.diversity = diversity
+        self.note_weighting = note_weighting
+        self.category_weight = category_weight
+        self.candidate_cache = LRUCache(cache_size)
+        self.shard_ranker = ShardedRanker(shards, shard_deadline) if shards > 1 else None
+        self._artifact_loader = artifact_loader
+        self._artifact_sources = None
+        self._semantic_loader = semantic_loader
+        self._semantic_source = semantic_loader
+        self._updates_path = None
+        self._pending_updates: list[dict] = []
+        self._speller = None
+        self._load_lock = threading.Lock()
+        self._update_lock = threading.Lock()
+        if semantic_loader is None:
+            self.semantic_retriever = semantic_retriever
+
+        if artifacts is not None:
+            self._adopt_artifacts(artifacts)
+        elif artifact_loader is None:
+            self.artifacts = None
+            with open(KEYWORDS_PATH, "r", encoding="utf-8") as f:
+                self.scent_keywords = json.load(f)
+            self._fit_dataset(dataset)
 
+    def _fit_dataset(self, dataset: pd.DataFrame) -> None:
         # Ensure required columns ('Name', 'Notes') exist
-        if self.dataset is not None and 'Name' in self.dataset and 'Notes' in self.dataset:
-            self.dataset['Name'] = self.dataset['Name'].fillna('')
-            self.dataset['Notes'] = self.dataset['Notes'].fillna('')
-            self.dataset['full_description'] = self.dataset['Name'] + " " + self.dataset['Notes']
-            self.tfidf_vectorizer = TfidfVectorizer()
-            self.tfidf_matrix = self.tfidf_vectorizer.fit_transform(self.dataset['full_description'])
+        if dataset is not None and 'Name' in dataset and 'Notes' in dataset:
+            self.snapshot = CatalogSnapshot.fit(PerfumeCatalog.from_frame(dataset, self.extra_columns),
+                                                keywords=keyword_phrases(self.scent_keywords))
         else:
-            self.tfidf_matrix = None
+            self.snapshot = CatalogSnapshot.fit(None, keywords=keyword_phrases(self.scent_keywords))
+
+    def _adopt_artifacts(self, artifacts: ArtifactBundle) -> None:
+        self.artifacts = artifacts
+        # Keep keywords that were assigned before the bundle was loaded
+        if "_scent_keywords" not in self.__dict__:
+            self.scent_keywords = artifacts.scent_keywords
+        self.snapshot = CatalogSnapshot(artifacts.catalog, artifacts.note_index, artifacts.vectorizer,
+                                        artifacts.tfidf_matrix, artifacts.key, note_matrix=artifacts.note_matrix)
+
+    # Everything below is read from the current snapshot, which updates replace as a whole; a request reads
+    # self.snapshot once and passes it along so it never mixes two versions.
+    @property
+    def catalog(self) -> PerfumeCatalog:
+        return self.snapshot.catalog
+
+    @property
+    def note_index(self) -> NoteIndex:
+        return self.snapshot.note_index
+
+    @property
+    def note_matrix(self) -> NoteMatrix:
+        return self.snapshot.note_matrix
+
+    @property
+    def tfidf_vectorizer(self):
+        return self.snapshot.vectorizer
+
+    @property
+    def tfidf_matrix(self):
+        return self.snapshot.tfidf_matrix
+
+    @property
+    def retriever(self) -> TfidfRetriever:
+        return self.snapshot.retriever
+
+    @property
+    def catalog_version(self) -> str:
+        return self.snapshot.version
+
+    @property
+    def scent_keywords(self) -> dict[str, list[str]]:
+        return self._scent_keywords
+
+    @scent_keywords.setter
+    def scent_keywords(self, scent_keywords: dict[str, list[str]]) -> None:
+        # Recompile the category detector whenever the keyword table is replaced; category weights come from it
+        self._scent_keywords = scent_keywords
+        self.scent_detector = ScentDetector(scent_keywords)
+        self.refinement_parser = RefinementParser(scent_keywords, self._names_note)
+        self._speller = None
+        self.candidate_cache.clear()
+
+    def __getattr__(self, attribute: str):
+        # Only reached when normal lookup fails, so once the bundle is loaded this costs nothing.
+        if attribute in self.LAZY_ATTRIBUTES and self.__dict__.get("_artifact_loader") is not None:
+            self._load_artifacts()
+            return getattr(self, attribute)
+        if attribute == "semantic_retriever" and self.__dict__.get("_semantic_loader") is not None:
+            self._load_semantic_retriever()
+            return self.semantic_retriever
+        raise AttributeError(f"{type(self).__name__!r} object has no attribute {attribute!r}")
+
+    def _load_artifacts(self) -> None:
+        with self._load_lock:
+            if self._artifact_loader is not None:
+                self._adopt_artifacts(self._artifact_loader())
+                self._artifact_loader = None
+
+    def _load_semantic_retriever(self) -> None:
+        if self._semantic_loader is None:
+            return
+        # Resolved outside the lock: loading the note index may itself take it
+        note_index = self.note_index
+        with self._load_lock:
+            if self._semantic_loader is not None:
+                self.semantic_retriever = self._semantic_loader(note_index=note_index)
+                self._semantic_loader = None
+
+    def warmup(self) -> None:
+        """
+        Load the catalog, TF-IDF model, embeddings and sentiment analyzer now instead of on the first request, and
+        start the shard workers if there are any.
+        """
+        self._load_artifacts()
+        self._load_semantic_retriever()
+        self.spelling_corrector()
+        self.intent_chatbot.warmup()
+        if self.shard_ranker is not None and self.mode in self.shard_ranker.MODES:
+            self.shard_ranker.publish(self.snapshot, list(self.scent_keywords))
+
+    def close(self) -> None:
+        """
+        Stop the shard workers, if any; they are started again on the next request.
+        """
+        if self.shard_ranker is not None:
+            self.shard_ranker.close()
+
+    @classmethod
+    def from_files(cls, name: str = "Perfumer", csv_path: str = DATASET_PATH, keywords_path: str = KEYWORDS_PATH,
+                   artifact_root: str = ARTIFACT_ROOT, mode: str = "keyword", embedding_root: str = EMBEDDING_ROOT,
+                   embedding_model: str = DEFAULT_MODEL, updates_path: str = UPDATES_PATH, shards: int = 1,
+                   shard_deadline: float = 0.5) -> "PerfumeChatbot":
+        """
+        Create a chatbot backed by the on-disk artifact cache, which is loaded (and rebuilt if the sources
+        changed) on first use or by warmup(). Semantic mode also loads (or builds) the embedding matrix for
+        `embedding_model`, which must already be in the local model cache.
+        Runtime catalog changes are persisted to the journal at `updates_path` by compact(), and the journal is
+        replayed onto the CSV whenever the artifacts are rebuilt.
+        """
+        semantic_loader = None
+        if mode == "semantic":
+            semantic_loader = partial(load_semantic_retriever, csv_path, embedding_root, model=embedding_model,
+                                      updates_path=updates_path)
+        bot = cls(name=name, mode=mode,
+                  artifact_loader=partial(load_or_build, csv_path, keywords_path, artifact_root, updates_path),
+                  semantic_loader=semantic_loader, shards=shards, shard_deadline=shard_deadline)
+        bot._artifact_sources = (csv_path, keywords_path, artifact_root)
+        bot._updates_path = updates_path
+        return bot
+
+    def reload_if_stale(self) -> bool:
+        """
+        Reload the artifact bundle if its source files changed on disk; cached candidates are dropped with the
+        old catalog, and runtime changes not yet compacted are applied again on top. Returns whether a reload
+        happened.
+        """
+        if self._artifact_sources is None:
+            return False
+        csv_path, keywords_path, artifact_root = self._artifact_sources
+        if self.artifacts.key == artifact_key(csv_path, keywords_path, self._updates_path):
+            return False
+        with self._update_lock:
+            self._adopt_artifacts(load_or_build(csv_path, keywords_path, artifact_root, self._updates_path))
+            if self._pending_updates:
+                self.snapshot = self.snapshot.apply(self._pending_updates, self.extra_columns)
+        return True
+
+    def add_perfume(self, name: str, brand: str, notes: str, **columns: str) -> int:
+        """
+        Add a perfume at runtime and return its row; it is searchable as soon as this returns.
+        Raises ValueError if a perfume with the same name and brand exists (use update_perfume()).
+        """
+        record = {"op": "put", "Name": name, "Brand": brand, "Notes": notes, **columns}
+        with self._update_lock:
+            if (name, brand) in self.snapshot.rows_by_key():
+                raise ValueError(f"Perfume {name!r} from {brand!r} already exists")
+            snapshot = self._apply_locked([record])
+        return snapshot.rows_by_key()[perfume_key(record)][-1]
+
+    def update_perfume(self, name: str, brand: str, **changes: str) -> int:
+        """
+        Change columns (Notes, Name, Brand or a kept extra column) of an existing perfume and return its new row.
+        Raises KeyError if there is no such perfume.
+        """
+        with self._update_lock:
+            rows = self.snapshot.rows_by_key().get((name, brand))
+            if not rows:
+                raise KeyError(f"No perfume {name!r} from {brand!r}")
+            record = {**self.catalog.record(rows[-1]), **changes}
+            updates = [{"op": "put", **record}]
+            if perfume_key(record) != (name, brand):
+                # Renamed: the old identity goes away
+                updates.insert(0, {"op": "delete", "Name": name, "Brand": brand})
+            snapshot = self._apply_locked(updates)
+        return snapshot.rows_by_key()[perfume_key(record)][-1]
+
+    def remove_perfume(self, name: str, brand: str) -> None:
+        """
+        Remove a perfume at runtime. Raises KeyError if there is no such perfume.
+        """
+        with self._update_lock:
+            if (name, brand) not in self.snapshot.rows_by_key():
+                raise KeyError(f"No perfume {name!r} from {brand!r}")
+            self._apply_locked([{"op": "delete", "Name": name, "Brand": brand}])
+
+    def apply_updates(self, updates: list[dict]) -> None:
+        """
+        Apply journal operations ({"op": "put", "Name", "Brand", "Notes", ...} or {"op": "delete", "Name",
+        "Brand"}) in one step: the new snapshot is built aside and published with a single assignment, so
+        concurrent requests see either all of the batch or none of it. Cached rankings are invalidated.
+        Each call copies the catalog's matrices (see CatalogSnapshot.apply), so apply changes in batches rather
+        than one call each, and compact() from time to time to drop masked rows.
+        """
+        updates = list(updates)
+        if not updates:
+            return
+        with self._update_lock:
+            self._apply_locked(updates)
+
+    def _apply_locked(self, updates: list[dict]) -> CatalogSnapshot:
+        # The caller holds _update_lock; returns the snapshot this batch produced, even if another lands after it
+        snapshot = self.snapshot = self.snapshot.apply(updates, self.extra_columns)
+        self._pending_updates.extend(updates)
+        self.instrumentation.count("catalog_updates", len(updates))
+        return snapshot
+
+    def compact(self) -> None:
+        """
+        Fold runtime changes back in: add them to the update journal, which keeps one operation per perfume, and
+        rebuild the artifact (and embeddings
+        in semantic mode) from the sources plus journal, or, for a chatbot built from a DataFrame, refit TF-IDF
+        and the note index over the live rows. Either way removed rows are dropped and idf is exact again.
+        """
+        with self._update_lock:
+            if self._artifact_sources is not None and self._updates_path is not None:
+                if self._pending_updates:
+                    compact_journal(self._updates_path, self._pending_updates)
+                csv_path, keywords_path, artifact_root = self._artifact_sources
+                artifacts = load_or_build(csv_path, keywords_path, artifact_root, self._updates_path)
+                if self._semantic_source is not None and artifacts.key != self.artifacts.key:
+                    self.semantic_retriever = self._semantic_source(note_index=artifacts.note_index)
+                    self._semantic_loader = None
+                self._adopt_artifacts(artifacts)
+            else:
+                self.snapshot = self.snapshot.compacted()
+            self._pending_updates = []
+
+    def instrument(self, instrumentation) -> None:
+        super().instrument(instrumentation)
+        self.intent_chatbot.instrument(instrumentation)
+
+    @property
+    def rng(self):
+        """
+        Source of the response templates' random choices, shared with the intent chatbot (the `random` module
+        unless a seeded random.Random is set).
+        """
+        return self.intent_chatbot.rng
+
+    @rng.setter
+    def rng(self, rng) -> None:
+        self.intent_chatbot.rng = rng
+
+    def cache_stats(self) -> dict:
+        return {"candidates": self.candidate_cache.stats(), "routes": self.intent_chatbot.route_cache.stats()}
 
     def extract_keywords(self, text: str) -> list[str]:
         pattern = r'\b[a-zA-Z]+\b'
@@ -51,7 +408,10 @@ class PerfumeChatbot(ChatbotBase):
             f"[3] Of course, I can also get time; help you relieve your emotions; introduce myself, etc.")
 
     def farewell(self) -> None:
-        print("Thank you for using customised perfume Journeys. We wish you a wonderful day in beautiful fragrances. Remember to give me a good review!")
+        print(self.farewell_message())
+
+    def farewell_message(self) -> str:
+        return self.FAREWELL_MESSAGE
 
     def receive_input(self) -> str:
         return input("You: ")
@@ -59,71 +419,359 @@ class PerfumeChatbot(ChatbotBase):
     def recommend_perfume(self, user_input: str, scent_category: str) -> str:
         """
         Recommend a perfume based on user input and scent category.
-        Extracts keywords from the input, filters the dataset by category, and selects the best-matching perfume using a simple scoring system.
+        Filters the dataset by category and selects the perfume whose notes best match the notes named in the input.
         """    
-        self.dataset['Notes'] = self.dataset['Notes'].fillna('').astype(str)
-        keywords = self.extract_keywords(user_input)
-        scent_filtered_data = self._filter_by_scent_category(scent_category)
-        perfume_scores = self._calculate_scores(scent_filtered_data, keywords)
+        snapshot = self.snapshot
+        ranked_rows = self.rank_candidates(user_input, scent_category, snapshot)
 
-        if perfume_scores:
-            recommended_perfume = self._select_best_perfume(scent_filtered_data, perfume_scores)
+        if len(ranked_rows):
+            recommended_perfume = snapshot.catalog.perfume(ranked_rows[0])
             return self._compose_recommendation_response(recommended_perfume)
         else:
-            return "I'm really sorry that I couldn't find the suitable perfume, can you change your favourite scent? (e.g. rose, violet, lime, grapefruit)"
+            return self.NOT_FOUND_MESSAGE
 
+    def recommend_many(self, query: str, k: int = 5) -> list[Perfume]:
+        """
+        Return up to k perfumes for a free-text query, best first and spread across brands; the scent category is
+        detected from the query as in a conversation.
+        """
+        query = self.correct_spelling(query.strip().lower())
+        scent_match = self.detect_scents(query)
+        snapshot = self.snapshot
+        notes = self._query_notes(query, scent_match.terms, snapshot)
+        rows = self.rank_candidates(query, scent_match.categories[0] if scent_match.categories else "",
+                                    snapshot=snapshot, limit=k, notes=notes)
+        return [snapshot.catalog.perfume(row) for row in rows]
 
-    def _filter_by_scent_category(self, scent_category: str) -> pd.DataFrame:
-        if scent_category:
-            return self.dataset[self.dataset['Notes'].str.contains(scent_category, case=False, na=False)]
-        return self.dataset
 
+    def rank_candidates(self, user_input: str, scent_category: str, snapshot: CatalogSnapshot = None,
+                        limit: int = None, with_pool: bool = False, notes: tuple[int, ...] = None):
+        """
+        Return the best `limit` (default `candidate_limit`) rows for the query, best first and diversified by brand,
+        from the cache when a query naming the same notes was ranked before against the current catalog (or the
+        given `snapshot` of it). With `with_pool`, return (rows, pool, pool scores), the pool being the scored
+        candidates the rows were picked from, best first.
+        `notes` are the query's note ids when the caller already knows them (see _query_notes); otherwise every
+        note of the catalog named in the input is looked up.
+        """
+        snapshot = snapshot or self.snapshot
+        limit = limit or self.candidate_limit
+        if notes is None:
+            notes = snapshot.note_matrix.note_ids(user_input)
+        key = (self.mode, limit, scent_category or "", tuple(sorted(notes)))
+        if self.mode == "tfidf":
+            key += (tuple(sorted(TfidfQueryEncoder.TOKEN_PATTERN.findall(user_input.lower()))),)
+        elif self.mode == "semantic":
+            key += (" ".join(user_input.lower().split()),)
+        cached = self.candidate_cache.get(key, version=snapshot.version)
+        if cached is None:
+            self.instrumentation.count("candidate_cache_misses")
+            result = self._rank_in_shards(user_input, scent_category, notes, snapshot, limit * self.DIVERSITY_POOL)
+            if result is None:
+                candidate_rows = self._filter_by_scent_category(scent_category, snapshot)
+                self.instrumentation.count("candidates_scanned", len(candidate_rows))
+                rows, scores = self._score_candidates(user_input, scent_category, notes, candidate_rows, snapshot,
+                                                      limit * self.DIVERSITY_POOL)
+            else:
+                rows, scores = result.rows, result.scores
+            ranked = diversify(rows, scores, snapshot.catalog.brand_codes, self.diversity, limit)
+            cached = (ranked, np.asarray(rows), np.asarray(scores, dtype=np.float64))
+            for array in cached:
+                array.flags.writeable = False
+            if result is None or result.complete:
+                # A partial answer is served once but not kept, so the next asker gets every shard's rows
+                self.candidate_cache.put(key, cached, version=snapshot.version)
+        else:
+            self.instrumentation.count("candidate_cache_hits")
+        return cached if with_pool else cached[0]
 
-    def _calculate_scores(self, data: pd.DataFrame, keywords: list[str]) -> list[int]:
-        scores = []
-        for _, perfume in data.iterrows():
-            perfume_notes = perfume['Notes']
-            score = sum(1 for keyword in keywords if keyword in perfume_notes)
-            scores.append(score)
-        return scores
+    def _rank_in_shards(self, user_input: str, scent_category: str, notes: tuple[int, ...],
+                        snapshot: CatalogSnapshot, limit: int) -> ShardResult:
+        """
+        Top `limit` rows from the shard workers, or None when the query is ranked in this process: without shards,
+        in semantic mode, or for a scent category the shards were not given.
+        """
+        ranker = self.shard_ranker
+        if ranker is None or self.mode not in ranker.MODES:
+            return None
+        ranker.publish(snapshot, list(self.scent_keywords))
+        if scent_category and scent_category not in ranker.categories:
+            return None
+        result = None
+        if self.mode == "tfidf" and snapshot.retriever is not None:
+            result = ranker.rank("tfidf", snapshot.vectorizer.transform([user_input]), scent_category, limit)
+        if result is None or (result.complete and not len(result.rows)):
+            # As in _score_candidates, a query without any TF-IDF match is ranked on its notes
+            result = ranker.rank("keyword", self._note_weights(notes, scent_category, snapshot), scent_category,
+                                 limit)
+        if not result.complete:
+            self.instrumentation.count("shard_timeouts", result.shards - result.answered)
+        return result
 
+    def _score_candidates(self, user_input: str, scent_category: str, notes: list[int],
+                          candidate_rows: np.ndarray, snapshot: CatalogSnapshot = None,
+                          limit: int = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Top `limit` candidate rows, best first, with their scores; keyword scoring uses the query's `notes`.
+        """
+        snapshot = snapshot or self.snapshot
+        limit = limit or self.candidate_limit
+        if len(candidate_rows) and self.mode == "tfidf" and snapshot.retriever is not None:
+            hits = snapshot.retriever.search(user_input, limit, scent_category)
+        elif len(candidate_rows) and self.mode == "semantic" and self.semantic_retriever is not None:
+            hits = snapshot.resolve_semantic(self.semantic_retriever.search(user_input, limit, scent_category))
+        else:
+            hits = []
+        if hits:
+            return np.asarray([row for row, _ in hits], dtype=np.int32), np.asarray([score for _, score in hits])
+        return snapshot.note_matrix.rank(candidate_rows, self._note_weights(notes, scent_category, snapshot), limit)
 
-    def _select_best_perfume(self, data: pd.DataFrame, scores: list[int]) -> pd.Series:
-        most_similar_index = scores.index(max(scores))
-        return data.iloc[most_similar_index]
+    @staticmethod
+    def _query_notes(user_input: str, terms: list[str], snapshot: CatalogSnapshot) -> tuple[int, ...]:
+        """
+        Note ids of a query: the scent keywords matched by the detector, in order, then every other note of the
+        catalog the input names ("cistus", "neroli"), which no keyword covers; notes no perfume has are skipped.
+        """
+        ids = snapshot.note_matrix.ids
+        notes = (ids[note] for note in map(canonical_note, terms) if note in ids)
+        return tuple(dict.fromkeys((*notes, *snapshot.note_matrix.note_ids(user_input))))
 
+    def _note_weights(self, notes: list[int], scent_category: str, snapshot: CatalogSnapshot) -> dict[int, float]:
+        """
+        Weight of each note for keyword scoring: the query's own notes, then the notes of its scent category at
+        `category_weight`, each scaled by idf when enabled.
+        """
+        weights = dict.fromkeys(notes, 1.0)
+        if scent_category and self.category_weight:
+            for term in self.scent_keywords.get(scent_category, ()):
+                for note in snapshot.note_matrix.note_ids(term):
+                    weights.setdefault(note, self.category_weight)
+        if self.note_weighting == "idf" and weights:
+            idf = snapshot.note_idf()
+            weights = {note: weight * idf[note] for note, weight in weights.items()}
+        return weights
 
-    def _compose_recommendation_response(self, perfume: pd.Series) -> str:
+    def _filter_by_scent_category(self, scent_category: str, snapshot: CatalogSnapshot = None) -> np.ndarray:
+        snapshot = snapshot or self.snapshot
+        return snapshot.filter_live(snapshot.note_index.filter_rows(scent_category))
+
+
+    def _compose_recommendation_response(self, perfume: Perfume) -> str:
         """
         Generate a user-facing recommendation string from the selected perfume.
         """
-        perfume_name = perfume['Name']
-        perfume_brand = perfume['Brand']
-        perfume_notes = perfume['Notes']
+        perfume_name = perfume.Name
+        perfume_brand = perfume.Brand
+        perfume_notes = perfume.Notes
 
         responses = [
             f"You're in for a treat! How about the delightful [{perfume_name}] from [{perfume_brand}]? It has a wonderful blend of notes like [{perfume_notes}], perfect for your next perfume adventure. \nDo you have any other favourite flavours? I can continue to recommend them for you.",
             f"How about [{perfume_name}] from [{perfume_brand}]? Its [{perfume_notes}] will make you feel like you're wearing a little slice of luxury every day. \nDo you have any other favourite flavours? I can continue to recommend them for you.",
             f"Here's a thought: why not try [{perfume_name}] from [{perfume_brand}]? The [{perfume_notes}] are fresh and lively, just the kind of scent that might brighten your day. \nDo you have any other favourite flavours? I can continue to recommend them for you.",
         ]
-        return random.choice(responses)
+        return self.rng.choice(responses)
+
+    def spelling_corrector(self) -> SpellingCorrector:
+        """
+        The typo corrector for the current catalog and keyword table, built on first use after either changes.
+        Note tokens are the vocabulary, scent keywords and category names the preferred targets, and valid English
+        words (see english_words()) plus everything the intent router listens for are never corrected.
+        """
+        snapshot, scent_keywords = self.snapshot, self.scent_keywords
+        speller = self._speller
+        if speller is not None and speller[0] is snapshot and speller[1] is scent_keywords:
+            return speller[2]
+        vocabulary = {}
+        if snapshot.note_index is not None:
+            vocabulary = {token: len(rows) for token, rows in snapshot.note_index.folded_postings.items()}
+        keywords = {word for category, terms in scent_keywords.items()
+                    for word in SpellingCorrector.WORD_PATTERN.findall(" ".join([category, *terms]).lower())}
+        intent = IntentChatbot
+        protected = " ".join([*(k for _, keywords in intent.INTENT_KEYWORDS for k in keywords),
+                              *intent.HAPPY_KEYWORDS, *intent.UPSET_KEYWORDS, *intent.ANGRY_KEYWORDS,
+                              *self.intent_chatbot.zodiac_perfume_map]).lower().split()
+        corrector = SpellingCorrector(vocabulary, keywords, english_words().union(DOMAIN_WORDS, protected))
+        self._speller = (snapshot, scent_keywords, corrector)
+        return corrector
+
+    def correct_spelling(self, user_input: str) -> str:
+        """
+        Replace misspelled notes and scent words ("vanila", "sandlewood") with their closest known spelling.
+        """
+        corrected = self.spelling_corrector().correct_text(user_input)
+        if corrected != user_input:
+            self.instrumentation.count("spelling_corrections")
+        return corrected
+
+    def detect_scents(self, user_input: str) -> ScentMatch:
+        """
+        Find every scent category and keyword mentioned in the input in one pass.
+        """
+        return self.scent_detector.detect(user_input)
+
+    def process_input(self, user_input: str, session: ChatSession = None) -> str:
+        """
+        Answer one input. Without a `session` every input is answered on its own (as in batch mode); with one,
+        repeated scent requests and "next"/"other" page through the ranking kept in the session.
+        """
+        if session is None:
+            return self.process_turn(user_input)[0]
+        response, session.recommendations = self.process_turn(user_input, session.recommendations)
+        return response
+
+    def process_turn(self, user_input: str, page: RecommendationPage = None) -> tuple[str, RecommendationPage]:
+        """
+        Answer one input given a session's current recommendation page; returns the response and the page to
+        keep. Nothing is modified, so a server can run this anywhere and store the page itself.
+        """
+        # Forgive typos in note names, for follow-ups and scent requests alike
+        corrected = self.correct_spelling(user_input)
+        if page is not None and page.context is not None:
+            # A follow-up such as "something like that but woodier" re-ranks the kept candidates
+            refinement = self.refinement_parser.parse(corrected.lower())
+            if not refinement.empty:
+                refined = self._refine_page(refinement, page)
+                if refined is not None:
+                    self.instrumentation.label("route", "refine")
+                    return refined
 
-    def process_input(self, user_input: str) -> str:
         # Identify if user input is related to perfume scents
-        for category, keywords in self.scent_keywords.items():
-            if any(keyword in user_input.lower() for keyword in keywords):
-                return self.recommend_perfume(user_input, category)
+        scent_match = self.detect_scents(corrected)
+        if scent_match.categories:
+            self.instrumentation.label("route", "scent")
+            return self._recommend_page(corrected, scent_match, page)
+
+        route = self.intent_chatbot.route(user_input.lower()) if page is not None or self.mode == "semantic" else None
+        if page is not None and route == "ask_follow_up_question" and self.NEXT_PATTERN.search(user_input.lower()):
+            # "next" / "other": the following perfume of the kept ranking, no rescoring
+            self.instrumentation.label("route", "next")
+            snapshot = self.snapshot
+            if page.version == snapshot.version:
+                return self._show_page(page, snapshot)
+            return self._recommend_page(page.query, self.detect_scents(page.query), page)
 
         # Delegate to intent-based response if no perfume scent is detected
-        return self.intent_chatbot.generate_response(user_input)
+        if (self.mode == "semantic" and route in self.SEMANTIC_FALLBACK_ROUTES
+                and self.intent_chatbot.whole_word_intent(user_input.lower()) != route):
+            # Nothing else matched: a free-text wish ("something cozy for winter") may still describe a perfume
+            snapshot = self.snapshot
+            hits = self.semantic_retriever.search(user_input, 1) if self.semantic_retriever is not None else []
+            hits = snapshot.resolve_semantic(hits)
+            if hits:
+                self.instrumentation.label("route", "semantic")
+                return self._compose_recommendation_response(snapshot.catalog.perfume(hits[0][0])), page
+        return self.intent_chatbot.generate_response(user_input), page
+
+    def _recommend_page(self, user_input: str, scent_match: ScentMatch,
+                        page: RecommendationPage) -> tuple[str, RecommendationPage]:
+        """
+        Show the next perfume for the query: the top one for a new query, the one after the last shown when the
+        same query (same category and notes) is asked again. The list is ranked again only when the query
+        changes or the catalog was updated, keeping how far the session got. The query's notes are the keywords
+        the detector matched and any other catalog note it names, so "rose and cistus" and "rose and neroli" are
+        different queries.
+        """
+        scent_category = scent_match.categories[0]
+        snapshot = self.snapshot
+        notes = self._query_notes(user_input, scent_match.terms, snapshot)
+        key = (scent_category, tuple(sorted(snapshot.note_matrix.terms[note] for note in notes)))
+        if page is None or page.key != key or page.version != snapshot.version:
+            position = page.position if page is not None and page.key == key else 0
+            rows, pool, scores = self.rank_candidates(user_input, scent_category, snapshot, with_pool=True,
+                                                      notes=notes)
+            weights = self._note_weights(notes, scent_category, snapshot)
+            shown = page.shown if page is not None and page.key == key else ()
+            page = RecommendationPage(key, user_input, scent_category, tuple(rows.tolist()), position,
+                                      snapshot.version, QueryContext.create(weights, (), pool, scores), shown)
+        return self._show_page(page, snapshot)
+
+    def _refine_page(self, refinement: Refinement, page: RecommendationPage) -> tuple[str, RecommendationPage]:
+        """
+        Re-rank the candidates kept in the page's context for a follow-up ("woodier", "less sweet", "without oud")
+        instead of searching the catalog again, leaving out the perfumes already shown. The follow-up's notes are
+        added to the context's query vector and its excluded notes to its filters, so refinements accumulate.
+        Returns None when the follow-up names nothing known. The catalog has no prices, so a price request is
+        answered with PRICE_UNKNOWN_MESSAGE.
+        """
+        snapshot = self.snapshot
+        more = self._refinement_weights(refinement.more, snapshot)
+        less = self._refinement_weights(refinement.less, snapshot)
+        without = self._refinement_weights(refinement.without, snapshot)
+        if not (more or less or without):
+            return (self.PRICE_UNKNOWN_MESSAGE, page) if refinement.price else None
+
+        context = page.context
+        note_matrix = snapshot.note_matrix
+        if page.version == snapshot.version:
+            rows, scores = context.candidate_rows(), context.candidate_scores().astype(np.float64)
+            shown = page.rows[:page.position]
+        else:
+            # Rows may have been removed or renumbered since: rank the catalog again with the kept query vector, and
+            # find the perfumes already shown by name and brand
+            rows, scores = note_matrix.rank(self._filter_by_scent_category(page.scent_category, snapshot),
+                                            context.note_weights(), self.candidate_limit * self.DIVERSITY_POOL)
+            rows_by_key = snapshot.rows_by_key()
+            shown = [row for key in page.shown for row in rows_by_key.get(key, ())]
+        excluded = set(context.excluded_notes()).union(without)
+        keep = ~np.isin(rows, shown)
+        if excluded:
+            keep &= note_matrix.score(rows, dict.fromkeys(excluded, 1.0)) == 0
+        rows, scores = rows[keep], scores[keep]
+        self.instrumentation.count("candidates_scanned", len(rows))
+
+        delta = dict(more)
+        for note, weight in less.items():
+            delta[note] = delta.get(note, 0.0) - weight
+        scores = _scaled(scores) + self.REFINEMENT_WEIGHT * _scaled(note_matrix.score(rows, delta))
+        # Ties keep the previous order
+        order = np.argsort(-scores, kind="stable")
+        rows, scores = rows[order], scores[order]
+        ranked = diversify(rows, scores, snapshot.catalog.brand_codes, self.diversity, self.candidate_limit)
+
+        weights = context.note_weights()
+        for note, weight in delta.items():
+            weights[note] = weights.get(note, 0.0) + weight
+        page = RecommendationPage((page.key, refinement), page.query, page.scent_category, tuple(ranked.tolist()), 0,
+                                  snapshot.version, QueryContext.create(weights, excluded, rows, scores), page.shown)
+        response, page = self._show_page(page, snapshot)
+        return (f"{self.PRICE_UNKNOWN_MESSAGE}\n{response}" if refinement.price else response), page
+
+    def _names_note(self, phrase: str) -> bool:
+        """
+        Whether a phrase is exactly one note of the current catalog ("vanilla", "tonka beans").
+        """
+        return canonical_note(phrase) in self.snapshot.note_matrix.ids
+
+    def _refinement_weights(self, phrases: tuple[str, ...], snapshot: CatalogSnapshot) -> dict[int, float]:
+        """
+        Notes named by a follow-up's phrases, weighted like query notes: a scent category stands for its keywords.
+        """
+        weights: dict[int, float] = {}
+        for phrase in phrases:
+            for term in (phrase, *self.scent_keywords.get(phrase, ())):
+                weights.update(dict.fromkeys(snapshot.note_matrix.note_ids(term), 1.0))
+        if self.note_weighting == "idf" and weights:
+            idf = snapshot.note_idf()
+            weights = {note: weight * idf[note] for note, weight in weights.items()}
+        return weights
+
+    def _show_page(self, page: RecommendationPage, snapshot: CatalogSnapshot) -> tuple[str, RecommendationPage]:
+        if not page.rows:
+            return self.NOT_FOUND_MESSAGE, page
+        if page.position >= len(page.rows):
+            return self.EXHAUSTED_MESSAGE, page
+        perfume = snapshot.catalog.perfume(page.rows[page.position])
+        return self._compose_recommendation_response(perfume), page._replace(
+            position=page.position + 1, shown=(*page.shown, (perfume.Name, perfume.Brand)))
 
     def respond(self) -> None:
         self.greeting()
+        session = ChatSession(self.name)
         while self.conversation_is_active:
             received_input = input("\nYou: ").strip().lower()
-            if received_input in ["exit", "quit", "bye", "goodbye"]:
+            if received_input in self.EXIT_COMMANDS:
                 self.farewell()
                 self.conversation_is_active = False
                 break
-            processed_input = self.process_input(received_input)
-            print(f"Bot: {processed_input}")
\ No newline at end of file
+            processed_input = self.process_input(received_input, session)
+            print(f"Bot: {processed_input}")
@@ -0,0 +1,115 @@
+import re
+from typing import Callable, NamedTuple
+
+WORD_PATTERN = re.compile(r"[a-z]+(?:-[a-z]+)*|[,.;!?]")
+
+
+class Refinement(NamedTuple):
+    """
+    How a follow-up changes the last recommendation: scent categories or notes to move toward (`more`) or away from
+    (`less`), notes to filter out (`without`), and whether it asked about price.
+    """
+    more: tuple[str, ...]
+    less: tuple[str, ...]
+    without: tuple[str, ...]
+    price: bool
+
+    @property
+    def empty(self) -> bool:
+        return not (self.more or self.less or self.without or self.price)
+
+
+class RefinementParser:
+    """
+    Recognizes follow-ups that adjust the last recommendation instead of asking for something new: comparatives of
+    the scent categories ("woodier", "sweeter", "more floral", "less spicy"), notes to add or drop after a cue word
+    ("more vanilla", "less musk", "without oud and amber") and price comparisons ("cheaper", "more expensive").
+    A cue only takes the scent categories and notes that follow it, joined by "and"/"or", as resolved by `names`
+    (a callable telling whether a lowercase phrase names a note); it stops at the first word that names neither,
+    so "no, i want something with vanilla" and "tell me more about citrus" refine nothing.
+    """
+
+    MORE_WORDS = frozenset({"more", "extra", "stronger", "plus"})
+    LESS_WORDS = frozenset({"less", "fewer", "lighter"})
+    WITHOUT_WORDS = frozenset({"without", "no", "minus", "except"})
+    # Price comparisons on their own ("cheaper"), and price words that only compare after a cue ("less expensive",
+    # "lower price"), so "the price is fine, just woodier" is not a price request
+    PRICE_COMPARATIVES = frozenset({"cheaper", "cheap", "cheapest", "pricier", "affordable", "lower-priced"})
+    PRICE_WORDS = frozenset({"expensive", "pricey", "price", "prices", "priced", "cost", "costs", "costly"})
+    PRICE_CUES = frozenset({"lower", "higher"})
+    # Words skipped between a cue and its first note ("a bit more of the vanilla"), and between its notes
+    FILLER_WORDS = frozenset({"of", "the", "a", "an", "some", "any", "much", "bit"})
+    CONNECTIVES = frozenset({"and", "or", "nor"})
+    # Words never part of a note, so a cue's notes cannot run into the rest of the sentence
+    STOP_WORDS = frozenset({"but", "than", "that", "this", "it", "one", "please", "similar", "like", "love", "want",
+                            "wants", "prefer", "need", "try", "get", "give", "show", "tell", "find"})
+    # Longest note, in words, looked up after a cue
+    MAX_NOTE_WORDS = 4
+
+    def __init__(self, categories, names: Callable[[str], bool] = None) -> None:
+        self.categories = frozenset(categories)
+        self.names = names or (lambda phrase: False)
+        comparatives: dict[str, str] = {}
+        for category in self.categories:
+            stem = category[:-1] + "i" if category.endswith("y") else category
+            comparatives.setdefault(stem + "er", category)
+        self.comparatives = comparatives
+
+    def parse(self, text: str) -> Refinement:
+        """
+        Parse a lowercase message; the result is empty when it does not refine anything.
+        """
+        phrases = {"more": [], "less": [], "without": []}
+        words = WORD_PATTERN.findall(text)
+        price = False
+        position = 0
+        while position < len(words):
+            word = words[position]
+            position += 1
+            if word in self.comparatives:
+                phrases["more"].append(self.comparatives[word])
+            elif word in self.PRICE_COMPARATIVES:
+                price = True
+            elif (position < len(words) and words[position] in self.PRICE_WORDS
+                  and (word in self.MORE_WORDS or word in self.LESS_WORDS or word in self.PRICE_CUES)):
+                # "more expensive", "lower price"
+                price = True
+                position += 1
+            elif word in self.MORE_WORDS or word in self.LESS_WORDS or word in self.WITHOUT_WORDS:
+                cue = "more" if word in self.MORE_WORDS else "less" if word in self.LESS_WORDS else "without"
+                if cue == "without" and position < len(words) and words[position] in self.MORE_WORDS:
+                    # "no more musk"
+                    position += 1
+                position = self._read_notes(words, position, phrases[cue])
+        return Refinement(tuple(phrases["more"]), tuple(phrases["less"]), tuple(phrases["without"]), price)
+
+    def _read_notes(self, words: list[str], position: int, found: list[str]) -> int:
+        """
+        Append the categories and notes named from `position` on to `found`; returns where reading stopped.
+        """
+        while True:
+            while position < len(words) and words[position] in self.FILLER_WORDS:
+                position += 1
+            end = self._note_end(words, position)
+            if end is None:
+                return position
+            found.append(" ".join(words[position:end]))
+            position = end
+            # Another note may follow a comma or "and"/"or" ("oud, amber and musk")
+            if position < len(words) and words[position] == ",":
+                position += 1
+            if position < len(words) and words[position] in self.CONNECTIVES:
+                position += 1
+            elif words[position - 1] != ",":
+                return position
+
+    def _note_end(self, words: list[str], position: int) -> int:
+        # End of the longest category or note starting at `position`, or None; tokens are words or punctuation
+        for end in range(min(len(words), position + self.MAX_NOTE_WORDS), position, -1):
+            phrase = words[position:end]
+            if any(not word[0].isalpha() or word in self.STOP_WORDS for word in phrase):
+                continue
+            phrase = " ".join(phrase)
+            if phrase in self.categories or self.names(phrase):
+                return end
+        return None
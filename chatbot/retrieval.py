@@ -0,0 +1,132 @@
+import re
+
+import numpy as np
+
+from chatbot.note_index import NoteIndex
+
+
+class TfidfQueryEncoder:
+    """
+    transform() of a fitted default TfidfVectorizer (lowercase, word unigrams, smooth idf, l2 norm) rebuilt from
+    its vocabulary and idf, so that loading artifacts does not need to import scikit-learn.
+    """
+
+    TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+    def __init__(self, vocabulary: dict[str, int], idf: np.ndarray) -> None:
+        self.vocabulary_ = vocabulary
+        self.idf_ = idf
+
+    def transform(self, documents: list[str]):
+        from scipy.sparse import csr_matrix
+
+        indptr = [0]
+        indices: list[int] = []
+        values: list[float] = []
+        for document in documents:
+            counts: dict[int, int] = {}
+            for token in self.TOKEN_PATTERN.findall(document.lower()):
+                column = self.vocabulary_.get(token)
+                if column is not None:
+                    counts[column] = counts.get(column, 0) + 1
+            columns = sorted(counts)
+            weights = np.asarray([counts[column] for column in columns], dtype=np.float64) * self.idf_[columns]
+            norm = np.sqrt(np.dot(weights, weights))
+            indices.extend(columns)
+            values.extend((weights / norm).tolist() if norm else weights.tolist())
+            indptr.append(len(indices))
+        return csr_matrix((values, indices, indptr), shape=(len(documents), len(self.idf_)), dtype=np.float64)
+
+
+class TfidfRetriever:
+    """
+    Vectorized top-k retrieval over the fitted TF-IDF matrix.
+    A query is transformed once and scored against every perfume with a single sparse matrix-vector product.
+    """
+
+    def __init__(self, vectorizer, tfidf_matrix, note_index: NoteIndex = None, batch_size: int = 256,
+                 row_mask: np.ndarray = None) -> None:
+        """
+        `row_mask`, when given, marks the rows that may be returned at all (e.g. perfumes not removed since the
+        matrix was built).
+        """
+        self.vectorizer = vectorizer
+        self.matrix = tfidf_matrix.tocsr()
+        self.note_index = note_index
+        self.batch_size = batch_size
+        self.row_mask = row_mask
+        self.category_masks: dict[str, np.ndarray] = {}
+
+    def category_mask(self, scent_category: str) -> np.ndarray:
+        """
+        Boolean row mask for a scent category, computed once per category from the note index.
+        """
+        if not scent_category or self.note_index is None:
+            return self.row_mask
+        mask = self.category_masks.get(scent_category)
+        if mask is None:
+            mask = np.zeros(self.matrix.shape[0], dtype=bool)
+            mask[self.note_index.filter_rows(scent_category)] = True
+            if self.row_mask is not None:
+                mask &= self.row_mask
+            self.category_masks[scent_category] = mask
+        return mask
+
+    def search(self, query: str, k: int = 5, scent_category: str = None) -> list[tuple[int, float]]:
+        """
+        Return up to k (row, score) pairs with a positive score, best first.
+        """
+        return self.search_batch([query], k, scent_category)[0]
+
+    def search_batch(self, queries: list[str], k: int = 5, scent_category: str = None) -> list[list[tuple[int, float]]]:
+        """
+        Score many queries with one sparse matrix product per block of `batch_size` queries.
+        """
+        mask = self.category_mask(scent_category)
+        results = []
+        for start in range(0, len(queries), self.batch_size):
+            query_matrix = self.vectorizer.transform(queries[start:start + self.batch_size])
+            scores = (query_matrix @ self.matrix.T).toarray()
+            if mask is not None:
+                scores[:, ~mask] = 0.0
+            results.extend(self._top_k(row_scores, k) for row_scores in scores)
+        return results
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> list[tuple[int, float]]:
+        if k <= 0 or not len(scores):
+            return []
+        if k < len(scores):
+            # Everything scoring at least the k-th best score: argpartition alone may cut a tie at the boundary
+            # in favor of a higher row
+            threshold = -np.partition(-scores, k - 1)[k - 1]
+            top = np.flatnonzero(scores >= threshold)
+        else:
+            top = np.arange(len(scores))
+        # Order by score, breaking ties on the lower row so results are deterministic.
+        top = top[np.lexsort((top, -scores[top]))][:k]
+        return [(int(row), float(scores[row])) for row in top if scores[row] > 0]
+
+
+def diversify(rows: np.ndarray, scores: np.ndarray, brand_codes: np.ndarray, diversity: float, limit: int) -> np.ndarray:
+    """
+    Greedy MMR re-ranking of `rows` (best first) with brand as the similarity: each pick maximizes
+    (1 - diversity) * score / max score - diversity * (perfumes of its brand already picked); ties keep the input
+    order. The first pick is always the most relevant row, and diversity 0 returns the input order.
+    """
+    if diversity <= 0 or len(rows) <= 1:
+        return rows[:limit]
+    scores = np.asarray(scores, dtype=np.float64)
+    top = scores.max()
+    relevance = (1 - diversity) * (scores / top if top > 0 else np.zeros(len(rows)))
+    brands = np.asarray(brand_codes)[rows]
+    picked_per_brand = np.zeros(len(rows), dtype=np.float64)
+    available = np.ones(len(rows), dtype=bool)
+    order = []
+    for _ in range(min(limit, len(rows))):
+        value = np.where(available, relevance - diversity * picked_per_brand, -np.inf)
+        best = int(np.argmax(value))
+        order.append(best)
+        available[best] = False
+        picked_per_brand[brands == brands[best]] += 1
+    return rows[np.asarray(order, dtype=np.intp)]
@@ -0,0 +1,56 @@
+from typing import NamedTuple
+
+from chatbot.keyword_matcher import KeywordAutomaton
+
+
+class ScentMatch(NamedTuple):
+    """
+    Scent categories found in a message, in scent_keywords.json order, and the keywords that matched.
+    """
+    categories: list[str]
+    terms: list[str]
+
+
+class ScentDetector:
+    """
+    All scent keywords compiled into one automaton, so every category hit is found in a single pass over the input.
+    Keywords must start and end on word boundaries ("lime" does not match "sublime"); a plural "s"/"es" is allowed.
+    """
+
+    PLURAL_SUFFIXES = ("es", "s")
+
+    def __init__(self, scent_keywords: dict[str, list[str]]) -> None:
+        self.category_order = {category: order for order, category in enumerate(scent_keywords)}
+        categories_by_term: dict[str, list[str]] = {}
+        for category, keywords in scent_keywords.items():
+            for keyword in keywords:
+                categories_by_term.setdefault(keyword.lower(), []).append(category)
+        self.categories_by_term = categories_by_term
+        self.automaton = KeywordAutomaton(list(categories_by_term))
+
+    def detect(self, text: str) -> ScentMatch:
+        text = text.lower()
+        keywords = self.automaton.keywords
+        terms: list[str] = []
+        categories: set[str] = set()
+        for start, end, keyword_id in self.automaton.iter_matches(text):
+            if not self._on_word_boundaries(text, start, end):
+                continue
+            term = keywords[keyword_id]
+            if term not in terms:
+                terms.append(term)
+                categories.update(self.categories_by_term[term])
+        return ScentMatch(sorted(categories, key=self.category_order.get), terms)
+
+    @classmethod
+    def _on_word_boundaries(cls, text: str, start: int, end: int) -> bool:
+        if start > 0 and text[start - 1].isalnum():
+            return False
+        if end == len(text) or not text[end].isalnum():
+            return True
+        for suffix in cls.PLURAL_SUFFIXES:
+            if text.startswith(suffix, end):
+                after = end + len(suffix)
+                if after == len(text) or not text[after].isalnum():
+                    return True
+        return False
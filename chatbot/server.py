@@ -0,0 +1,226 @@
+import asyncio
+import json
+import traceback
+import uuid
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing.util import Finalize
+from typing import Callable
+
+from chatbot.perfume_chatbot import PerfumeChatbot
+from chatbot.session import RecommendationPage, SessionStore
+
+MAX_BODY_BYTES = 64 * 1024
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+           500: "Internal Server Error"}
+
+# Per-process chatbot used when scoring runs in a process pool
+_worker_bot = None
+
+
+def _init_worker(bot_factory: Callable) -> None:
+    global _worker_bot
+    _worker_bot = bot_factory()
+    _worker_bot.warmup()
+    # Stop the worker's own shard processes when the pool shuts it down
+    Finalize(_worker_bot, _worker_bot.close, exitpriority=10)
+
+
+def _process_in_worker(text: str, page: RecommendationPage) -> tuple[str, RecommendationPage]:
+    return _worker_bot.process_turn(text, page)
+
+
+def _recommend_in_worker(query: str, k: int) -> list:
+    return _worker_bot.recommend_many(query, k)
+
+
+class ChatServer:
+    """
+    Minimal asyncio HTTP/1.1 front-end for a chatbot, built on the standard library only.
+    One read-only chatbot is shared per process; sessions only hold conversation state. Scoring runs in a thread
+    (or process) pool so the event loop never blocks, and identical in-flight messages from sessions in the same
+    state (e.g. no recommendations shown yet) are computed once.
+
+    Endpoints:
+        POST /chat       {"session": "<id>", "message": "<text>"} -> {"session", "response", "active"}
+        POST /recommend  {"query": "<text>", "k": 5} -> {"perfumes": [{"Name", "Brand", "Notes"}, ...]}
+        GET  /health  liveness probe
+        GET  /stats   session count, coalescing and cache counters
+    """
+
+    def __init__(self, bot_factory: Callable, host: str = "127.0.0.1", port: int = 8080, workers: int = 4,
+                 use_processes: bool = False, max_sessions: int = 10000, session_ttl: float = 1800) -> None:
+        self.bot_factory = bot_factory
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.use_processes = use_processes
+        self.sessions = SessionStore(max_sessions, session_ttl)
+        self.bot = None
+        self.executor: Executor = None
+        self.computed = 0
+        self.coalesced = 0
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._server: asyncio.AbstractServer = None
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self.use_processes:
+            self.executor = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.bot_factory,))
+        else:
+            self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="chatbot")
+            self.bot = self.bot_factory()
+            await loop.run_in_executor(self.executor, self.bot.warmup)
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        # Report the real port when started with port 0
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self) -> None:
+        await self._server.serve_forever()
+
+    async def close(self) -> None:
+        """
+        Stop accepting connections, let the running turns finish, then close the chatbot (stopping its shard
+        workers and freeing their shared memory).
+        """
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self.executor is not None:
+            # Waited for off the event loop; queued turns are cancelled
+            await asyncio.to_thread(self.executor.shutdown, wait=True, cancel_futures=True)
+        if self.bot is not None:
+            self.bot.close()
+
+    async def handle_message(self, session_id: str, message: str) -> dict:
+        """
+        Answer one message for a session; exit commands end the session's conversation. Messages of one session
+        are answered one at a time, so each turn starts from the page the previous one left.
+        """
+        session = self.sessions.get(session_id or uuid.uuid4().hex)
+        text = message.strip().lower()
+        async with session.lock:
+            if text in PerfumeChatbot.EXIT_COMMANDS:
+                session.conversation_is_active = False
+                response = self._farewell()
+            else:
+                session.conversation_is_active = True
+                response, session.recommendations = await self._process(text, session.recommendations)
+        return {"session": session.session_id, "response": response, "active": session.conversation_is_active}
+
+    def _farewell(self) -> str:
+        if self.bot is not None:
+            return self.bot.farewell_message()
+        return PerfumeChatbot.FAREWELL_MESSAGE
+
+    async def recommend(self, query: str, k: int) -> list[dict]:
+        loop = asyncio.get_running_loop()
+        if self.use_processes:
+            perfumes = await loop.run_in_executor(self.executor, _recommend_in_worker, query, k)
+        else:
+            perfumes = await loop.run_in_executor(self.executor, self.bot.recommend_many, query, k)
+        return [perfume._asdict() for perfume in perfumes]
+
+    async def _process(self, text: str, page: RecommendationPage) -> tuple[str, RecommendationPage]:
+        # The answer depends on the session only through its recommendation page
+        key = (text, page)
+        future = self._inflight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            if self.use_processes:
+                future = loop.run_in_executor(self.executor, _process_in_worker, text, page)
+            else:
+                future = loop.run_in_executor(self.executor, self.bot.process_turn, text, page)
+            self._inflight[key] = future
+
+            def forget(done: asyncio.Future) -> None:
+                if self._inflight.get(key) is done:
+                    del self._inflight[key]
+
+            future.add_done_callback(forget)
+            self.computed += 1
+        else:
+            self.coalesced += 1
+        # Shielded so that one client disconnecting does not cancel the work others are waiting on
+        return await asyncio.shield(future)
+
+    async def _dispatch(self, method: str, path: str, body: bytes) -> tuple[int, dict]:
+        path = path.split("?", 1)[0]
+        if path == "/health":
+            return 200, {"status": "ok"}
+        if path == "/stats":
+            stats = {"sessions": len(self.sessions), "computed": self.computed, "coalesced": self.coalesced}
+            if self.bot is not None:
+                stats["cache"] = self.bot.cache_stats()
+            return 200, stats
+        if path not in ("/chat", "/recommend"):
+            return 404, {"error": "not found"}
+        if method != "POST":
+            return 405, {"error": "use POST"}
+        try:
+            payload = json.loads(body or b"{}")
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return 400, {"error": "body must be JSON"}
+        if path == "/recommend":
+            if not isinstance(payload, dict) or not isinstance(payload.get("query"), str):
+                return 400, {"error": "'query' must be a string"}
+            k = payload.get("k", 5)
+            if not isinstance(k, int) or isinstance(k, bool) or not 1 <= k <= 100:
+                return 400, {"error": "'k' must be an integer from 1 to 100"}
+            return 200, {"perfumes": await self.recommend(payload["query"], k)}
+        if not isinstance(payload, dict) or not isinstance(payload.get("message"), str):
+            return 400, {"error": "'message' must be a string"}
+        session_id = payload.get("session")
+        return 200, await self.handle_message(str(session_id) if session_id is not None else None, payload["message"])
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                parts = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                if len(parts) != 3:
+                    await self._write(writer, 400, {"error": "malformed request line"}, keep_alive=False)
+                    break
+                length = headers.get("content-length") or "0"
+                if not length.isdigit():
+                    await self._write(writer, 400, {"error": "malformed Content-Length"}, keep_alive=False)
+                    break
+                length = int(length)
+                if length > MAX_BODY_BYTES:
+                    await self._write(writer, 413, {"error": "body too large"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    status, payload = await self._dispatch(parts[0].upper(), parts[1], body)
+                except Exception:
+                    # The client only learns that the request failed; the traceback goes to stderr
+                    traceback.print_exc()
+                    status, payload, keep_alive = 500, {"error": "internal error"}, False
+                await self._write(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _write(writer: asyncio.StreamWriter, status: int, payload: dict, keep_alive: bool) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
@@ -0,0 +1,126 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Iterable, NamedTuple
+
+import numpy as np
+
+
+class QueryContext(NamedTuple):
+    """
+    What a session's recommendations were ranked from, kept so a follow-up ("woodier", "without oud") re-ranks the
+    same candidates instead of searching the catalog again: the query's note weights, the notes filtered out, and
+    the candidate rows with their scores, best first. Arrays are stored as raw int32/float32 bytes, which keeps a
+    context to a few hundred bytes and hashable.
+    """
+
+    notes: bytes
+    weights: bytes
+    excluded: bytes
+    candidates: bytes
+    scores: bytes
+
+    @classmethod
+    def create(cls, weights: dict[int, float], excluded: Iterable[int], candidates: np.ndarray,
+               scores: np.ndarray) -> "QueryContext":
+        return cls(
+            np.fromiter(weights, dtype=np.int32, count=len(weights)).tobytes(),
+            np.fromiter(weights.values(), dtype=np.float32, count=len(weights)).tobytes(),
+            np.asarray(sorted(excluded), dtype=np.int32).tobytes(),
+            np.asarray(candidates, dtype=np.int32).tobytes(),
+            np.asarray(scores, dtype=np.float32).tobytes(),
+        )
+
+    def note_weights(self) -> dict[int, float]:
+        notes = np.frombuffer(self.notes, dtype=np.int32).tolist()
+        return dict(zip(notes, np.frombuffer(self.weights, dtype=np.float32).tolist()))
+
+    def excluded_notes(self) -> list[int]:
+        return np.frombuffer(self.excluded, dtype=np.int32).tolist()
+
+    def candidate_rows(self) -> np.ndarray:
+        return np.frombuffer(self.candidates, dtype=np.int32)
+
+    def candidate_scores(self) -> np.ndarray:
+        return np.frombuffer(self.scores, dtype=np.float32)
+
+
+class RecommendationPage(NamedTuple):
+    """
+    The ranked perfumes for a session's last scent request and how many of them were already shown, so "next" or
+    "other" is answered from the list instead of by ranking again. `shown` is the (Name, Brand) of every perfume
+    shown since the request, refinements included, which identifies them in a later catalog version. Immutable and
+    hashable: sessions in the same state can share one computation.
+    """
+
+    key: tuple
+    query: str
+    scent_category: str
+    rows: tuple[int, ...]
+    position: int
+    version: str
+    context: QueryContext = None
+    shown: tuple[tuple[str, str], ...] = ()
+
+
+class ChatSession:
+    """
+    Per-user conversation state kept by a server, separate from the shared read-only chatbot. A server holds
+    `lock` while a turn reads and writes the state.
+    """
+
+    def __init__(self, session_id: str) -> None:
+        self.session_id = session_id
+        self.conversation_is_active = True
+        self.recommendations: RecommendationPage = None
+        self.last_seen = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def touch(self) -> None:
+        self.last_seen = time.monotonic()
+
+
+class SessionStore:
+    """
+    Sessions by id with least-recently-used eviction once `max_sessions` is reached; sessions idle for more than
+    `ttl` seconds are dropped as well.
+    """
+
+    def __init__(self, max_sessions: int = 10000, ttl: float = 1800) -> None:
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: OrderedDict[str, ChatSession] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def get(self, session_id: str) -> ChatSession:
+        """
+        Return the session, creating it (and evicting the least recently used one if full) when it is new.
+        """
+        self.expire()
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = ChatSession(session_id)
+            self._sessions[session_id] = session
+            if len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session_id)
+        session.touch()
+        return session
+
+    def expire(self) -> int:
+        """
+        Drop the sessions idle for longer than `ttl`; returns how many were dropped.
+        """
+        # Sessions are kept in order of last use, so the expired ones are at the front
+        deadline = time.monotonic() - self.ttl
+        expired = 0
+        while self._sessions and next(iter(self._sessions.values())).last_seen < deadline:
+            self._sessions.popitem(last=False)
+            expired += 1
+        return expired
@@ -0,0 +1,340 @@
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from itertools import count
+from multiprocessing.connection import Connection, wait
+from typing import TYPE_CHECKING, NamedTuple
+
+import numpy as np
+
+from chatbot.catalog import load_array
+from chatbot.note_matrix import NoteMatrix
+from chatbot.retrieval import TfidfRetriever
+
+if TYPE_CHECKING:
+    from chatbot.updates import CatalogSnapshot
+
+# tmpfs, so published shard arrays live in shared memory and every worker maps the same pages
+SHARED_MEMORY_ROOT = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+# How often the reply receiver looks for workers that were restarted or closed
+RECEIVE_POLL_SECONDS = 0.05
+
+
+class ShardResult(NamedTuple):
+    rows: np.ndarray
+    scores: np.ndarray
+    # Shards that answered in time, out of all of them; the result is partial when they differ
+    answered: int
+    shards: int
+
+    @property
+    def complete(self) -> bool:
+        return self.answered == self.shards
+
+
+class ShardedRanker:
+    """
+    Scores a catalog split into `shards` contiguous row ranges, each served by its own worker process, so one
+    query uses as many cores as there are shards. Every snapshot is published once as memory-mapped arrays in
+    shared memory (the shard's rows of the note matrices, TF-IDF matrix, live mask and scent category masks),
+    which the workers map instead of receiving copies; a query then only sends its note weights or TF-IDF vector.
+
+    Each shard returns its own top `limit` and the coordinator merges them by score, ties going to the lower row,
+    which is the order an unsharded ranking gives. Shards that have not answered within `deadline` seconds are
+    left out and the result is marked partial. Queries from several threads are in flight together: the lock is
+    only held to send them, and one receiver thread hands each reply to the query waiting for it. A worker that
+    died is started again, with the published snapshot, before the next query. The workers are started on first
+    use and stopped by close() (or when the ranker is garbage collected).
+    """
+
+    MODES = ("keyword", "tfidf")
+
+    def __init__(self, shards: int, deadline: float = 0.5, root: str = SHARED_MEMORY_ROOT) -> None:
+        if shards < 1:
+            raise ValueError(f"Shard count must be at least 1, got {shards}")
+        self.shards = shards
+        self.deadline = deadline
+        self.root = root
+        self.version: str = None
+        self.categories: dict[str, int] = {}
+        self._directory: str = None
+        self._published: str = None
+        self._connections: list[Connection] = []
+        self._processes: list[multiprocessing.Process] = []
+        self._requests = count()
+        # Queries waiting for replies, by request id
+        self._pending: dict[int, _PendingRank] = {}
+        self._stopped: threading.Event = None
+        # Workers started again after dying
+        self.restarts = 0
+        self._lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+        self._finalizer = None
+
+    def start(self) -> None:
+        if self._processes:
+            return
+        self._directory = tempfile.mkdtemp(prefix="perfumer-shards-", dir=self.root)
+        for _ in range(self.shards):
+            connection, process = _spawn()
+            self._connections.append(connection)
+            self._processes.append(process)
+        self._stopped = threading.Event()
+        # The receiver only sees the shared lists and locks, not the ranker, so the ranker can still be collected
+        threading.Thread(target=_receive, args=(self._connections, self._pending, self._lock, self._stopped),
+                         name="perfumer-shard-replies", daemon=True).start()
+        self._finalizer = weakref.finalize(self, _shutdown, self._connections, self._processes, self._directory,
+                                           self._stopped)
+
+    def close(self) -> None:
+        if self._finalizer is not None:
+            self._finalizer()
+        self._connections, self._processes, self._finalizer = [], [], None
+        self._pending, self._stopped = {}, None
+        self.version, self._published = None, None
+
+    def publish(self, snapshot: CatalogSnapshot, categories: list[str]) -> None:
+        """
+        Write the shards of `snapshot` to shared memory and point the workers at them, unless they already serve
+        it; `categories` are the scent categories a query can be restricted to.
+        """
+        with self._publish_lock:
+            if snapshot.version != self.version or list(categories) != list(self.categories):
+                self._publish(snapshot, list(categories))
+
+    def _publish(self, snapshot: CatalogSnapshot, categories: list[str]) -> None:
+        self.start()
+        size = len(snapshot)
+        bounds = np.linspace(0, size, self.shards + 1).astype(np.int64)
+        category_masks = np.zeros((len(categories), size), dtype=bool)
+        for column, category in enumerate(categories):
+            category_masks[column, snapshot.note_index.filter_rows(category)] = True
+        live = snapshot.live if snapshot.live is not None else np.ones(size, dtype=bool)
+        by_perfume = snapshot.note_matrix.by_perfume
+        tfidf = snapshot.tfidf_matrix.tocsr() if snapshot.tfidf_matrix is not None else None
+
+        directory = tempfile.mkdtemp(prefix=f"{snapshot.version}-", dir=self._directory)
+        for shard, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:])):
+            path = os.path.join(directory, str(shard))
+            os.makedirs(path)
+            notes = by_perfume[start:stop]
+            _save_csr(path, "note_by_perfume", notes)
+            _save_csr(path, "note_matrix", notes.T.tocsr())
+            if tfidf is not None:
+                _save_csr(path, "tfidf", tfidf[start:stop], binary=False)
+            np.save(os.path.join(path, "live.npy"), live[start:stop])
+            np.save(os.path.join(path, "categories.npy"), category_masks[:, start:stop])
+            with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({"version": snapshot.version, "start": int(start), "rows": int(stop - start),
+                           "notes": by_perfume.shape[1], "tfidf": None if tfidf is None else tfidf.shape[1]}, f)
+
+        with self._lock:
+            previous = self._published
+            for shard, connection in enumerate(self._connections):
+                connection.send(("load", os.path.join(directory, str(shard))))
+            self.version, self._published = snapshot.version, directory
+            self.categories = {category: column for column, category in enumerate(categories)}
+        if previous is not None:
+            # Workers keep the arrays they mapped, so the files can go; a worker still behind fails to load them
+            # and moves on to the current shard, which is queued next
+            shutil.rmtree(previous, ignore_errors=True)
+
+    def rank(self, mode: str, query, scent_category: str, limit: int) -> ShardResult:
+        """
+        Top `limit` rows of the published snapshot with their scores. `query` is a {note id: weight} dict in
+        keyword mode, or a 1 x vocabulary TF-IDF row in tfidf mode (which, like TfidfRetriever, only returns rows
+        with a positive score). Raises KeyError for a category that was not published.
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown sharded mode: {mode!r}")
+        category = self.categories[scent_category] if scent_category else -1
+        if mode == "tfidf":
+            query = (query.indices.astype(np.int64), query.data.astype(np.float64))
+        with self._lock:
+            self._restart_dead()
+            request = next(self._requests)
+            message = ("rank", request, self.version, mode, query, category, limit)
+            pending = self._pending[request] = _PendingRank()
+            for shard, connection in enumerate(self._connections):
+                try:
+                    connection.send(message)
+                    pending.waiting.add(shard)
+                except (BrokenPipeError, OSError):
+                    pass
+            if not pending.waiting:
+                pending.done.set()
+        pending.done.wait(self.deadline)
+        with self._lock:
+            # Replies to this request arriving from now on are dropped
+            del self._pending[request]
+            results = list(pending.results)
+
+        rows = np.concatenate([rows for rows, _ in results]) if results else np.empty(0, dtype=np.int64)
+        scores = np.concatenate([scores for _, scores in results]) if results else np.empty(0, dtype=np.float64)
+        order = np.lexsort((rows, -scores))[:limit]
+        return ShardResult(rows[order], scores[order], len(results), self.shards)
+
+    def _restart_dead(self) -> None:
+        # Called with the lock held: replace every dead worker by a new one serving the published shard
+        for shard, process in enumerate(self._processes):
+            if process.is_alive():
+                continue
+            self._connections[shard].close()
+            self._connections[shard], self._processes[shard] = _spawn()
+            if self._published is not None:
+                self._connections[shard].send(("load", os.path.join(self._published, str(shard))))
+            self.restarts += 1
+
+
+class _PendingRank:
+    """
+    Replies collected for one query; `done` is set once every shard it was sent to has answered or died.
+    """
+
+    def __init__(self) -> None:
+        self.waiting: set[int] = set()
+        self.results: list[tuple[np.ndarray, np.ndarray]] = []
+        self.done = threading.Event()
+
+    def answer(self, shard: int, result) -> None:
+        if shard in self.waiting:
+            self.waiting.discard(shard)
+            if result is not None:
+                self.results.append(result)
+            if not self.waiting:
+                self.done.set()
+
+
+class _Shard:
+    """
+    A worker's view of one published shard; every array is memory-mapped from shared memory.
+    """
+
+    def __init__(self, path: str) -> None:
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.version = meta["version"]
+        self.start = meta["start"]
+        rows, notes = meta["rows"], meta["notes"]
+        self.notes = NoteMatrix([], _load_csr(path, "note_matrix", (notes, rows)),
+                                _load_csr(path, "note_by_perfume", (rows, notes)), None, None)
+        self.tfidf = None
+        if meta["tfidf"] is not None:
+            self.tfidf = _load_csr(path, "tfidf", (rows, meta["tfidf"]), binary=False)
+        self.live = load_array(path, "live.npy")
+        self.categories = load_array(path, "categories.npy")
+
+    def rank(self, mode: str, query, category: int, limit: int) -> tuple[np.ndarray, np.ndarray]:
+        mask = self.live if category < 0 else self.live & self.categories[category]
+        if mode == "tfidf":
+            indices, values = query
+            vector = np.zeros(self.tfidf.shape[1], dtype=np.float64)
+            vector[indices] = values
+            scores = np.where(mask, self.tfidf @ vector, 0.0)
+            hits = TfidfRetriever._top_k(scores, limit)
+            rows = np.asarray([row for row, _ in hits], dtype=np.int64)
+            return rows + self.start, np.asarray([score for _, score in hits], dtype=np.float64)
+        rows, scores = self.notes.rank(np.flatnonzero(mask), query, limit)
+        return rows.astype(np.int64) + self.start, scores
+
+
+def _spawn() -> tuple[Connection, multiprocessing.Process]:
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_serve_shard, args=(child,), daemon=True)
+    process.start()
+    child.close()
+    return parent, process
+
+
+def _receive(connections: list[Connection], pending: dict[int, _PendingRank], lock: threading.Lock,
+             stopped: threading.Event) -> None:
+    """
+    Hand the workers' replies to the queries waiting for them, until `stopped` is set. `connections` is the
+    ranker's own list, in which a restarted worker replaces a dead one, so it is read again on every round.
+    """
+    closed: set[Connection] = set()
+    while not stopped.is_set():
+        with lock:
+            shard_of = {connection: shard for shard, connection in enumerate(connections)
+                        if connection not in closed}
+        try:
+            ready = wait(list(shard_of), RECEIVE_POLL_SECONDS)
+        except (OSError, ValueError):
+            # A connection was closed by a restart or by close(); read the list again
+            continue
+        for connection in ready:
+            try:
+                reply = connection.recv()
+            except (EOFError, OSError):
+                # The worker died: its queries in flight stop waiting for it, unless it was already replaced
+                closed.add(connection)
+                with lock:
+                    if connections[shard_of[connection]] is connection:
+                        for query in pending.values():
+                            query.answer(shard_of[connection], None)
+                continue
+            with lock:
+                query = pending.get(reply[0])
+                if query is not None:
+                    query.answer(shard_of[connection], reply[1])
+
+
+def _serve_shard(connection: Connection) -> None:
+    shard = None
+    while True:
+        try:
+            message = connection.recv()
+        except (EOFError, OSError):
+            return
+        if message is None:
+            return
+        if message[0] == "load":
+            try:
+                shard = _Shard(message[1])
+            except (OSError, ValueError):
+                # Superseded before it was loaded; the next publish brings a new one
+                shard = None
+            continue
+        _, request, version, mode, query, category, limit = message
+        result = shard.rank(mode, query, category, limit) if shard is not None and shard.version == version else None
+        connection.send((request, result))
+
+
+def _save_csr(path: str, name: str, matrix, binary: bool = True) -> None:
+    # The note matrices are binary, so only their structure is stored
+    if not binary:
+        np.save(os.path.join(path, f"{name}_data.npy"), matrix.data)
+    index_dtype = np.int32 if matrix.nnz < np.iinfo(np.int32).max else np.int64
+    np.save(os.path.join(path, f"{name}_indices.npy"), matrix.indices.astype(index_dtype))
+    np.save(os.path.join(path, f"{name}_indptr.npy"), matrix.indptr.astype(index_dtype))
+
+
+def _load_csr(path: str, name: str, shape: tuple[int, int], binary: bool = True):
+    from scipy.sparse import csr_matrix
+
+    indices = load_array(path, f"{name}_indices.npy")
+    data = np.ones(len(indices), dtype=np.float32) if binary else load_array(path, f"{name}_data.npy")
+    return csr_matrix((data, indices, load_array(path, f"{name}_indptr.npy")), shape=shape, copy=False)
+
+
+def _shutdown(connections: list[Connection], processes: list[multiprocessing.Process], directory: str,
+              stopped: threading.Event) -> None:
+    stopped.set()
+    for connection in connections:
+        try:
+            connection.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+    for process in processes:
+        process.join(timeout=1)
+        if process.is_alive():
+            process.terminate()
+    for connection in connections:
+        connection.close()
+    shutil.rmtree(directory, ignore_errors=True)
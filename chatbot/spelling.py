@@ -0,0 +1,141 @@
+import os
+import re
+from functools import lru_cache
+from typing import Iterable
+
+from chatbot.cache import LRUCache
+
+ENGLISH_WORDS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data",
+                                  "english_words.txt")
+# Words of the perfume domain that general English uses too rarely to be in the word list
+DOMAIN_WORDS = frozenset({"perfumes", "fragrances", "scents", "colognes", "perfumery", "perfumer", "parfum",
+                          "eau", "toilette", "extrait"})
+
+
+@lru_cache(maxsize=None)
+def english_words(path: str = ENGLISH_WORDS_PATH) -> frozenset[str]:
+    """
+    The bundled list of common English words (lines starting with "#" are comments), read once. Valid words are
+    never corrected, however close they are to a note ("beach" -> "peach", "music" -> "musc").
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return frozenset(line.strip() for line in f if line.strip() and not line.startswith("#"))
+
+
+class SpellingCorrector:
+    """
+    Typo-tolerant lookup of words against a fixed vocabulary (note tokens and scent keywords), SymSpell style:
+    every term's deletions of up to `max_distance` letters are precomputed, so a query only generates its own
+    deletions and looks them up instead of comparing itself against the whole vocabulary. Candidates are verified
+    with the (optimal string alignment) Damerau-Levenshtein distance, and each query word's outcome is cached.
+
+    Words shorter than `min_length` are never corrected, longer ones allow one edit and words of at least
+    `long_length` letters allow `max_distance`. Unknown words go to the closest term, preferring keywords and
+    then the most frequent; a word that is a vocabulary term but not a keyword ("jasmin", "vanille") is only
+    moved to a keyword within its budget, since keywords are what scent detection looks for.
+    """
+
+    WORD_PATTERN = re.compile(r"[a-zA-Z]+")
+
+    def __init__(self, vocabulary: dict[str, int], keywords: Iterable[str] = (), protected: Iterable[str] = (),
+                 max_distance: int = 2, min_length: int = 5, long_length: int = 9, cache_size: int = 4096) -> None:
+        """
+        `vocabulary` maps each lowercase term to its frequency; `keywords` are terms that are never corrected and
+        win ties, `protected` words are never corrected nor suggested.
+        """
+        self.keywords = frozenset(keywords)
+        self.frequencies = {**dict.fromkeys(self.keywords, 1), **vocabulary}
+        self.known = self.keywords | frozenset(protected)
+        self.max_distance = max_distance
+        self.min_length = min_length
+        self.long_length = long_length
+        self.cache = LRUCache(cache_size)
+
+        self.deletes: dict[str, list[str]] = {}
+        for term in self.frequencies:
+            if len(term) + max_distance < min_length:
+                continue
+            for variant in _deletions(term, max_distance):
+                self.deletes.setdefault(variant, []).append(term)
+
+    def budget(self, word: str) -> int:
+        if len(word) < self.min_length:
+            return 0
+        return self.max_distance if len(word) >= self.long_length else min(1, self.max_distance)
+
+    def correct(self, word: str) -> str:
+        """
+        Return the correction of a lowercase word, or the word itself when it is a keyword or protected, too
+        short, or has no suitable term within its edit budget.
+        """
+        if word in self.known:
+            return word
+        correction = self.cache.get(word)
+        if correction is None:
+            correction = self._lookup(word)
+            self.cache.put(word, correction)
+        return correction
+
+    def correct_text(self, text: str) -> str:
+        """
+        Replace every misspelled word of `text` with its correction (lowercased); other characters are kept.
+        """
+        return self.WORD_PATTERN.sub(self._replace, text)
+
+    def _replace(self, match: re.Match) -> str:
+        word = match.group()
+        lowered = word.lower()
+        if len(word) < self.min_length or lowered in self.known:
+            return word
+        correction = self.correct(lowered)
+        return word if correction == lowered else correction
+
+    def _lookup(self, word: str) -> str:
+        budget = self.budget(word)
+        if not budget:
+            return word
+        candidates = {term for variant in _deletions(word, budget) for term in self.deletes.get(variant, ())}
+        if word in self.frequencies:
+            candidates &= self.keywords
+        best, best_key = word, None
+        for term in candidates:
+            distance = edit_distance(word, term, budget)
+            if distance > budget:
+                continue
+            key = (distance, term not in self.keywords, -self.frequencies[term], term)
+            if best_key is None or key < best_key:
+                best, best_key = term, key
+        return best
+
+
+def _deletions(word: str, distance: int) -> set[str]:
+    """
+    `word` and every string obtained from it by deleting up to `distance` letters.
+    """
+    results = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {variant[:i] + variant[i + 1:] for variant in frontier for i in range(len(variant))}
+        results |= frontier
+    return results
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Optimal string alignment distance between a and b (adjacent transpositions count as one edit); any value
+    above `limit` is reported as limit + 1.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return min(previous[len(b)], limit + 1)
@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import json
+import os
+import uuid
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from chatbot.catalog import PerfumeCatalog
+from chatbot.note_index import NoteIndex
+from chatbot.note_matrix import NoteMatrix
+from chatbot.retrieval import TfidfQueryEncoder, TfidfRetriever
+
+# Journal operations: "put" adds or replaces the perfume with the record's (Name, Brand), "delete" removes it.
+OPERATIONS = ("put", "delete")
+
+
+def perfume_key(record: dict) -> tuple[str, str]:
+    """
+    Identity of a perfume across updates and rebuilds: its (Name, Brand) pair.
+    """
+    return str(record.get("Name") or ''), str(record.get("Brand") or '')
+
+
+def read_updates(path: str) -> list[dict]:
+    """
+    Read an update journal (one JSON operation per line); a missing file is an empty journal.
+    """
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compact_journal(path: str, updates: list[dict]) -> None:
+    """
+    Add operations to the journal, rewriting it as the shortest journal that replays the same: one put or delete
+    per perfume ever touched, in order of last write, so it grows with the perfumes changed rather than with every
+    update. The new journal is written aside, flushed and renamed into place, so a crash leaves the old one whole.
+    """
+    latest = _last_writes([*read_updates(path), *updates])
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    staging = f"{path}.tmp"
+    with open(staging, "w", encoding="utf-8") as f:
+        for (name, brand), record in latest.items():
+            update = {"op": "put", **record} if record is not None else {"op": "delete", "Name": name, "Brand": brand}
+            f.write(json.dumps(update, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(staging, path)
+
+
+def replay_journal(chunks: Iterable[dict[str, list[str]]], updates: list[dict],
+                   extra_columns: Iterable[str] = ()) -> Iterator[dict[str, list[str]]]:
+    """
+    Replay journal operations onto a stream of column chunks with Name, Brand, Notes and `extra_columns`, as read
+    by chatbot.ingest.read_chunks: touched perfumes leave their original rows and the surviving records follow as
+    one last chunk, in order of their last write, which is the row order a runtime-updated catalog has.
+    """
+    latest = _last_writes(updates)
+    for chunk in chunks:
+        if latest:
+            keep = [key not in latest for key in zip(chunk["Name"], chunk["Brand"])]
+            chunk = {column: [value for value, kept in zip(values, keep) if kept] for column, values in chunk.items()}
+        yield chunk
+    additions = [record for record in latest.values() if record is not None]
+    if additions:
+        yield {column: [str(record.get(column) or '') for record in additions]
+               for column in dict.fromkeys(("Name", "Brand", "Notes", *extra_columns))}
+
+
+def _last_writes(updates: list[dict]) -> dict[tuple[str, str], dict]:
+    """
+    The record each perfume touched by `updates` ends up with (None if deleted), in order of last write.
+    """
+    latest: dict[tuple[str, str], dict] = {}
+    for update in updates:
+        key = perfume_key(update)
+        latest.pop(key, None)
+        latest[key] = {k: v for k, v in update.items() if k != "op"} if update["op"] == "put" else None
+    return latest
+
+
+class CatalogSnapshot:
+    """
+    One consistent version of everything a recommendation reads: the catalog, note index, note matrix, TF-IDF
+    model and the mask of rows still live. A snapshot is never modified; apply() returns a new one, which the chatbot publishes
+    with a single attribute assignment, so a query that picked up a snapshot sees it whole while updates land.
+
+    Updates are incremental: added rows are appended to the catalog, note postings, note matrix and TF-IDF matrix,
+    removed rows
+    are only masked, and document frequencies are kept exact so new rows and queries use the current idf.
+    Rows already in the matrix keep the idf they were weighted with until compacted() refits everything.
+    """
+
+    def __init__(self, catalog: PerfumeCatalog, note_index: NoteIndex, vectorizer, tfidf_matrix, version: str,
+                 live: np.ndarray = None, document_frequencies: np.ndarray = None,
+                 semantic_rows: np.ndarray = None, changes: int = 0, note_matrix: NoteMatrix = None) -> None:
+        """
+        `live` is None when every row is live; `changes` counts the operations applied since the last fit.
+        `semantic_rows` maps rows of an embedding index built before the last in-memory compaction to catalog rows
+        (-1 for dropped ones); None means the numbering is the same.
+        """
+        self.catalog = catalog
+        self.note_index = note_index
+        self.vectorizer = vectorizer
+        self.tfidf_matrix = tfidf_matrix
+        self.version = version
+        self.live = live
+        self.semantic_rows = semantic_rows
+        self.changes = changes
+        self.note_matrix = note_matrix
+        self._document_frequencies = document_frequencies
+        self._note_idf: np.ndarray = None
+        self._rows_by_key: dict[tuple[str, str], list[int]] = None
+        if tfidf_matrix is not None:
+            self.retriever = TfidfRetriever(vectorizer, tfidf_matrix, note_index, row_mask=live)
+        else:
+            self.retriever = None
+
+    @classmethod
+    def fit(cls, catalog: PerfumeCatalog, version: str = None, keywords: Iterable[str] = ()) -> "CatalogSnapshot":
+        """
+        Fit TF-IDF, the note index and the note matrix (folding notes onto the scent `keywords`) from scratch; an
+        empty (None) catalog gives an empty snapshot.
+        """
+        version = version or uuid.uuid4().hex
+        if catalog is None:
+            return cls(None, None, None, None, version, note_matrix=NoteMatrix.fit(None, keywords))
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        vectorizer = TfidfVectorizer()
+        matrix = vectorizer.fit_transform([f"{name} {notes}" for name, notes in zip(catalog.names, catalog.notes)])
+        return cls(catalog, NoteIndex(catalog.notes), vectorizer, matrix, version,
+                   note_matrix=NoteMatrix.fit(catalog, keywords))
+
+    def __len__(self) -> int:
+        return 0 if self.catalog is None else len(self.catalog)
+
+    def live_count(self) -> int:
+        return len(self) if self.live is None else int(np.count_nonzero(self.live))
+
+    def filter_live(self, rows: np.ndarray) -> np.ndarray:
+        return rows if self.live is None else rows[self.live[rows]]
+
+    def resolve_semantic(self, hits: list[tuple[int, float]]) -> list[tuple[int, float]]:
+        """
+        Translate (embedding-index row, score) hits to live catalog rows, dropping removed perfumes.
+        """
+        if self.semantic_rows is not None:
+            hits = [(int(self.semantic_rows[row]), score) for row, score in hits if row < len(self.semantic_rows)]
+        return [(row, score) for row, score in hits if 0 <= row < len(self) and (self.live is None or self.live[row])]
+
+    def rows_by_key(self) -> dict[tuple[str, str], list[int]]:
+        """
+        Live rows per (Name, Brand), built on first use.
+        """
+        if self._rows_by_key is None:
+            rows_by_key: dict[tuple[str, str], list[int]] = {}
+            for row in range(len(self)):
+                if self.live is None or self.live[row]:
+                    perfume = self.catalog.perfume(row)
+                    rows_by_key.setdefault((perfume.Name, perfume.Brand), []).append(row)
+            self._rows_by_key = rows_by_key
+        return self._rows_by_key
+
+    def document_frequencies(self) -> np.ndarray:
+        """
+        Number of live rows containing each TF-IDF term; every stored weight is positive, so this is the column
+        count of the live part of the matrix.
+        """
+        if self._document_frequencies is None:
+            matrix = self.tfidf_matrix.tocsr()
+            if self.live is not None:
+                matrix = matrix[np.flatnonzero(self.live)]
+            self._document_frequencies = np.bincount(matrix.indices, minlength=matrix.shape[1]).astype(np.int64)
+        return self._document_frequencies
+
+    def note_idf(self) -> np.ndarray:
+        """
+        Smooth idf of every note over the live rows, built on first use.
+        """
+        if self._note_idf is None:
+            frequencies = self.note_matrix.document_frequencies(self.live)
+            self._note_idf = np.log((1 + self.live_count()) / (1 + frequencies)) + 1
+        return self._note_idf
+
+    def apply(self, updates: list[dict], extra_columns: Iterable[str] = ()) -> "CatalogSnapshot":
+        """
+        Return the snapshot after the journal operations in `updates`, in order. A put masks every live row of its
+        (Name, Brand) and appends the record as a new row; a delete only masks. `extra_columns` is used only
+        when this snapshot is empty.
+        Every call copies the TF-IDF matrix, note matrix, note postings and catalog columns into the new snapshot,
+        so its cost grows with the catalog rather than with the batch: apply many changes in one call, not one
+        call each. Masked rows stay in memory until compacted().
+        """
+        if self.catalog is None:
+            latest = {}
+            for update in updates:
+                key = perfume_key(update)
+                latest.pop(key, None)
+                latest[key] = update if update["op"] == "put" else None
+            records = [record for record in latest.values() if record is not None]
+            if not records:
+                return self
+            catalog = PerfumeCatalog.from_columns(
+                *([str(record.get(column) or '') for record in records] for column in ("Name", "Brand", "Notes")),
+                {name: [str(record.get(name) or '') for record in records] for name in extra_columns},
+            )
+            return CatalogSnapshot.fit(catalog, keywords=self.note_matrix.parser.keywords)
+
+        start = len(self)
+        rows_by_key = dict(self.rows_by_key())
+        added: list[dict] = []
+        dead: list[int] = []
+        for update in updates:
+            if update["op"] not in OPERATIONS:
+                raise ValueError(f"Unknown update operation: {update['op']!r}")
+            key = perfume_key(update)
+            dead.extend(rows_by_key.pop(key, ()))
+            if update["op"] == "put":
+                rows_by_key[key] = [start + len(added)]
+                added.append(update)
+
+        live = np.ones(start + len(added), dtype=bool)
+        if self.live is not None:
+            live[:start] = self.live
+        live[dead] = False
+        old_dead = [row for row in dead if row < start]
+
+        # Extend the vocabulary with unseen terms, then bring document frequencies up to date before weighting
+        vocabulary = dict(self.vectorizer.vocabulary_)
+        documents = [f"{record.get('Name') or ''} {record.get('Notes') or ''}" for record in added]
+        for document in documents:
+            for token in TfidfQueryEncoder.TOKEN_PATTERN.findall(document.lower()):
+                vocabulary.setdefault(token, len(vocabulary))
+        frequencies = np.zeros(len(vocabulary), dtype=np.int64)
+        frequencies[:self.tfidf_matrix.shape[1]] = self.document_frequencies()
+        if old_dead:
+            frequencies -= np.bincount(self.tfidf_matrix.tocsr()[old_dead].indices, minlength=len(vocabulary))
+        presence = TfidfQueryEncoder(vocabulary, np.ones(len(vocabulary))).transform(documents)
+        for offset in range(len(added)):
+            if live[start + offset]:
+                frequencies[presence.indices[presence.indptr[offset]:presence.indptr[offset + 1]]] += 1
+        live_count = int(np.count_nonzero(live))
+        # scikit-learn's smooth idf
+        idf = np.log((1 + live_count) / (1 + frequencies)) + 1
+        vectorizer = TfidfQueryEncoder(vocabulary, idf)
+
+        matrix = _widen(self.tfidf_matrix, len(vocabulary))
+        if added:
+            from scipy.sparse import vstack
+
+            matrix = vstack([matrix, vectorizer.transform(documents)], format="csr")
+            catalog = self.catalog.extend(added)
+            note_index = self.note_index.extend(catalog.notes)
+            note_matrix = self.note_matrix.extend(catalog)
+        else:
+            catalog, note_index, note_matrix = self.catalog, self.note_index, self.note_matrix
+
+        snapshot = CatalogSnapshot(catalog, note_index, vectorizer, matrix, uuid.uuid4().hex,
+                                   None if live.all() else live, frequencies, self.semantic_rows,
+                                   self.changes + len(updates), note_matrix)
+        snapshot._rows_by_key = rows_by_key
+        return snapshot
+
+    def compacted(self) -> "CatalogSnapshot":
+        """
+        Drop masked rows and refit TF-IDF, the note index and the note matrix on the live rows, in their current
+        order.
+        """
+        if self.catalog is None or not self.changes:
+            return self
+        rows = np.arange(len(self)) if self.live is None else np.flatnonzero(self.live)
+        keywords = self.note_matrix.parser.keywords
+        if not len(rows):
+            return CatalogSnapshot.fit(None, keywords=keywords)
+        records = [self.catalog.record(row) for row in rows]
+        catalog = PerfumeCatalog.from_columns(
+            *([record[column] for record in records] for column in ("Name", "Brand", "Notes")),
+            {name: [record[name] for record in records] for name in self.catalog.extra_columns},
+        )
+        snapshot = CatalogSnapshot.fit(catalog, keywords=keywords)
+        old_to_new = np.full(len(self), -1, dtype=np.int64)
+        old_to_new[rows] = np.arange(len(rows))
+        if self.semantic_rows is None:
+            snapshot.semantic_rows = old_to_new
+        else:
+            snapshot.semantic_rows = np.where(self.semantic_rows >= 0, old_to_new[self.semantic_rows], -1)
+        return snapshot
+
+
+def _widen(matrix, columns: int):
+    from scipy.sparse import csr_matrix
+
+    matrix = matrix.tocsr()
+    if matrix.shape[1] == columns:
+        return matrix
+    return csr_matrix((matrix.data, matrix.indices, matrix.indptr), shape=(matrix.shape[0], columns), copy=False)
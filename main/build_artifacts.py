@@ -0,0 +1,24 @@
+import argparse
+import sys
+import os
+
+# Add project root to system path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from chatbot.artifacts import artifact_key, build_artifacts
+from chatbot.ingest import IngestReport
+from chatbot.perfume_chatbot import ARTIFACT_ROOT, DATASET_PATH, KEYWORDS_PATH, UPDATES_PATH
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the memory-mappable artifact cache used by the chatbot.")
+    parser.add_argument("--csv", default=DATASET_PATH, help="perfume dataset CSV")
+    parser.add_argument("--keywords", default=KEYWORDS_PATH, help="scent keyword JSON")
+    parser.add_argument("--updates", default=UPDATES_PATH, help="catalog update journal replayed onto the CSV")
+    parser.add_argument("--output", default=ARTIFACT_ROOT, help="artifact root directory")
+    args = parser.parse_args()
+
+    key = artifact_key(args.csv, args.keywords, args.updates)
+    report = IngestReport()
+    path = build_artifacts(args.csv, args.keywords, args.output, key, args.updates, report)
+    print(f"Built artifact {key[:16]} at {path}: {report}")
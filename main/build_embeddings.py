@@ -0,0 +1,26 @@
+import argparse
+import sys
+import os
+
+# Add project root to system path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from chatbot.embeddings import DEFAULT_MODEL, DTYPES, build_embeddings
+from chatbot.perfume_chatbot import DATASET_PATH, EMBEDDING_ROOT, UPDATES_PATH
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed every perfume once for the semantic recommender.")
+    parser.add_argument("--csv", default=DATASET_PATH, help="perfume dataset CSV")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="locally cached sentence-transformers model or path")
+    parser.add_argument("--dtype", choices=DTYPES, default="float16", help="storage precision of the matrix")
+    parser.add_argument("--ivf-lists", type=int, default=0,
+                        help="clusters for the approximate IVF index (0 = exact search only; ~4*sqrt(rows) for 100k+)")
+    parser.add_argument("--batch-size", type=int, default=64, help="perfumes encoded per model call")
+    parser.add_argument("--updates", default=UPDATES_PATH, help="catalog update journal replayed onto the CSV")
+    parser.add_argument("--output", default=EMBEDDING_ROOT, help="embedding root directory")
+    args = parser.parse_args()
+
+    path = build_embeddings(args.csv, args.output, args.model, args.dtype, args.ivf_lists, batch_size=args.batch_size,
+                            updates_path=args.updates)
+    print(f"Built embeddings at {path}")
@@ -0,0 +1,32 @@
+import argparse
+import sys
+import os
+from functools import partial
+
+# Add project root to system path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from chatbot.batch import read_queries, run_batch
+from chatbot.perfume_chatbot import PerfumeChatbot
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer queries from a JSONL or plain-text file and write JSONL responses.")
+    parser.add_argument("input", nargs="?", default="-", help="query file, or - for stdin")
+    parser.add_argument("--output", default="-", help="response file, or - for stdout")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--seed", type=int, default=None, help="seed for reproducible response templates")
+    parser.add_argument("--chunk-size", type=int, default=64, help="queries sent to a worker at a time")
+    parser.add_argument("--mode", choices=PerfumeChatbot.MODES, default="keyword", help="recommendation scorer")
+    args = parser.parse_args()
+
+    source = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    target = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        run_batch(read_queries(source), target, partial(PerfumeChatbot.from_files, mode=args.mode),
+                  workers=args.workers, seed=args.seed, chunk_size=args.chunk_size)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
@@ -1,23 +1,69 @@
+import argparse
+import cProfile
 import sys
 import os
-import pandas as pd
 
 # Add project root to system path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+from chatbot.batch import read_queries
+from chatbot.instrumentation import Instrumentation, JsonLogSink, PrometheusSink
 from chatbot.perfume_chatbot import PerfumeChatbot
+from chatbot.session import ChatSession
+
+
+def replay(bot: PerfumeChatbot, path: str) -> None:
+    """
+    Answer every query in a JSONL or plain-text file as one conversation, printing the transcript: the turns share
+    a session, so "next" and follow-ups such as "woodier" work as in respond(), and an exit command ends it.
+    """
+    session = ChatSession(bot.name)
+    with open(path, "r", encoding="utf-8") as f:
+        for record in read_queries(f):
+            query = record['query'].strip().lower()
+            print(f"You: {record['query']}")
+            if query in bot.EXIT_COMMANDS:
+                print(f"Bot: {bot.farewell_message()}")
+                break
+            print(f"Bot: {bot.process_input(query, session)}")
 
 
 if __name__ == "__main__":
-    # Load the perfume dataset
-    dataset: pd.DataFrame = pd.read_csv(
-        "data\\perfume_dataset.csv",
-        encoding='ISO-8859-1',
-        on_bad_lines='skip'
-    )
-
-    # Initialize the chatbot
-    bot: PerfumeChatbot = PerfumeChatbot(name="Perfumer", dataset=dataset)
-
-    # Start the chatbot
-    bot.respond()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Chat with the perfume consultant.")
+    parser.add_argument("--replay", help="answer the queries in this file instead of reading from the terminal")
+    parser.add_argument("--profile", help="write a cProfile dump of the session to this file")
+    parser.add_argument("--metrics", choices=("json", "prometheus"),
+                        help="report per-stage timings on stderr: one JSON line per turn, or Prometheus text at exit")
+    args = parser.parse_args()
+
+    # Load the perfume dataset from the artifact cache (rebuilt automatically when the sources change)
+    bot: PerfumeChatbot = PerfumeChatbot.from_files(name="Perfumer")
+
+    sink = None
+    if args.metrics == "json":
+        sink = JsonLogSink(sys.stderr)
+    elif args.metrics == "prometheus":
+        sink = PrometheusSink()
+    if sink is not None:
+        bot.instrument(Instrumentation([sink]))
+
+    if args.replay:
+        # Keep artifact loading out of the replayed turns' timings
+        bot.warmup()
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        # Start the chatbot
+        if args.replay:
+            replay(bot, args.replay)
+        else:
+            bot.respond()
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            # Readable with pstats, snakeviz, or flameprof/gprof2dot for a flame graph
+            profiler.dump_stats(args.profile)
+        if isinstance(sink, PrometheusSink):
+            sys.stderr.write(sink.render())
@@ -0,0 +1,41 @@
+import argparse
+import asyncio
+import sys
+import os
+from functools import partial
+
+# Add project root to system path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from chatbot.perfume_chatbot import PerfumeChatbot
+from chatbot.server import ChatServer
+
+
+async def main(args: argparse.Namespace) -> None:
+    server = ChatServer(partial(PerfumeChatbot.from_files, mode=args.mode, shards=args.shards,
+                                shard_deadline=args.shard_deadline), host=args.host, port=args.port,
+                        workers=args.workers, use_processes=args.processes, session_ttl=args.session_ttl)
+    await server.start()
+    print(f"Perfumer listening on http://{server.host}:{server.port}/chat")
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the perfume chatbot over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=4, help="scoring threads (or processes with --processes)")
+    parser.add_argument("--processes", action="store_true", help="score in a process pool instead of threads")
+    parser.add_argument("--mode", choices=PerfumeChatbot.MODES, default="keyword", help="recommendation scorer")
+    parser.add_argument("--session-ttl", type=float, default=1800,
+                        help="seconds of inactivity after which a session and its context are dropped")
+    parser.add_argument("--shards", type=int, default=1, help="catalog shards, each scored by its own process")
+    parser.add_argument("--shard-deadline", type=float, default=0.5,
+                        help="seconds to wait for a shard before answering without it")
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -3,15 +3,42 @@ import os
 import pandas as pd
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+import asyncio
+import io
+import threading
+import json
+import subprocess
+import tempfile
+import time
 import unittest
+from functools import partial
 from unittest.mock import patch, MagicMock
 import random
+import signal
 
+import numpy as np
 import pandas as pd
 
 from chatbot.chatbot_base import ChatbotBase
 from chatbot.intent_chatbot import IntentChatbot
 from chatbot.perfume_chatbot import PerfumeChatbot, TfidfVectorizer
+from chatbot.artifacts import load_or_build
+from chatbot.batch import read_queries, run_batch
+from chatbot.cache import LRUCache
+from chatbot.catalog import Perfume, PerfumeCatalog
+from chatbot.embeddings import BruteForceIndex, IVFIndex, build_embeddings, load_index, load_semantic_retriever, quantize
+from chatbot.ingest import IngestReport, detect_encoding, read_catalog, read_chunks
+from chatbot.instrumentation import HistogramSink, Instrumentation, JsonLogSink, PrometheusSink
+from chatbot.keyword_matcher import KeywordAutomaton, PriorityMatcher
+from chatbot.note_index import NoteIndex
+from chatbot.note_matrix import NoteMatrix, canonical_note, singular
+from chatbot.retrieval import TfidfQueryEncoder, TfidfRetriever, diversify
+from chatbot.scent_detector import ScentDetector
+from chatbot.server import ChatServer
+from chatbot.refinement import Refinement, RefinementParser
+from chatbot.session import ChatSession, SessionStore
+from chatbot.spelling import SpellingCorrector, edit_distance
+from chatbot.updates import read_updates
 
 # Sample data for PerfumeChatbot tests
 data = {
@@ -20,6 +47,11 @@ data = {
     'Notes': ['rose lavender', 'citrus lemon']
 }
 
+def make_toy_bot():
+    bot = PerfumeChatbot(name='Toy', dataset=pd.DataFrame(data))
+    bot.scent_keywords = {'rose': ['rose'], 'citrus': ['citrus']}
+    return bot
+
 class TestChatbotBase(unittest.TestCase):
     def setUp(self):
         self.bot = ChatbotBase(name='TestBot')
@@ -78,6 +110,64 @@ class TestIntentChatbot(unittest.TestCase):
         joke = self.bot.get_joke()
         self.assertIn('perfume', joke.lower())
 
+class TestIntentRouting(unittest.TestCase):
+    def setUp(self):
+        self.bot = IntentChatbot(name='RouterTest')
+        self.bot.analyzer = MagicMock()
+        self.bot.analyzer.polarity_scores.return_value = {'compound': 0.0}
+
+    def test_routing_priority_is_unchanged(self):
+        cases = {
+            'history of this brand': 'get_perfume_history',
+            'brand of joke': 'get_perfume_brand_info',
+            'hello, tell me a joke': 'respond_small_talk',
+            'this': 'respond_small_talk',
+            'make fun of time': 'get_joke',
+            'aid me, when': 'help',
+            'what time is it, aries?': 'get_time',
+            'the other one': 'ask_follow_up_question',
+            'cleopatra': 'leo',
+            'i am a capricorn or a pisces': 'capricorn',
+            'qwerty': None,
+        }
+        for text, expected in cases.items():
+            self.assertEqual(self.bot.intent_router.first_match(text), expected, text)
+
+    @patch('random.choice', lambda seq: seq[0])
+    def test_sentiment_scored_once_per_turn(self):
+        self.bot.generate_response('I am an Aquarius, any suggestions?')
+        self.assertEqual(self.bot.analyzer.polarity_scores.call_count, 1)
+        self.bot.analyzer.polarity_scores.return_value = {'compound': -0.6}
+        self.assertEqual(self.bot.generate_response('so bad today'), self.bot.respond_upset_confirmation())
+        self.assertEqual(self.bot.analyzer.polarity_scores.call_count, 2)
+
+    def test_priority_matcher_agrees_with_sequential_scan(self):
+        rng = random.Random(7)
+        for _ in range(200):
+            groups = [(f'g{i}', [''.join(rng.choice('abch ') for _ in range(rng.randint(1, 3)))
+                                 for _ in range(rng.randint(1, 3))]) for i in range(rng.randint(1, 5))]
+            matcher = PriorityMatcher(groups)
+            for _ in range(10):
+                text = ''.join(rng.choice('abch ') for _ in range(rng.randint(0, 12)))
+                expected = next((label for label, keywords in groups if any(k in text for k in keywords)), None)
+                self.assertEqual(matcher.first_match(text), expected)
+
+    def test_automaton_reports_overlapping_matches(self):
+        automaton = KeywordAutomaton(['he', 'she', 'hers', 'his'])
+        found = sorted((start, automaton.keywords[k]) for start, _, k in automaton.iter_matches('ushers'))
+        self.assertEqual(found, [(1, 'she'), (2, 'he'), (2, 'hers')])
+
+    def test_whole_word_groups(self):
+        matcher = PriorityMatcher([('greet', ['hi', 'hello']), ('other', ['is'])], whole_word_labels=['greet'])
+        self.assertEqual(matcher.first_match('this'), 'other')
+        self.assertEqual(matcher.first_match('something'), None)
+        self.assertEqual(matcher.first_match('oh hi, this'), 'greet')
+        self.assertEqual(matcher.first_match('hello'), 'greet')
+        bot = IntentChatbot(name='WholeWords')
+        self.assertEqual(bot.route('this'), 'respond_small_talk')
+        self.assertIsNone(bot.whole_word_intent('this'))
+        self.assertEqual(bot.whole_word_intent('hi, something for my mother'), 'respond_small_talk')
+
 class TestPerfumeChatbot(unittest.TestCase):
     def setUp(self):
         df = pd.DataFrame(data)
@@ -93,13 +183,13 @@ class TestPerfumeChatbot(unittest.TestCase):
         self.assertIn('rose', keywords)
         self.assertIn('citrus', keywords)
 
-    def test_filter_calculate_select(self):
+    def test_filter_and_rank(self):
         filtered = self.bot._filter_by_scent_category('rose')
         self.assertEqual(len(filtered), 1)
-        scores = self.bot._calculate_scores(filtered, ['rose'])
-        self.assertEqual(scores, [1])
-        best = self.bot._select_best_perfume(filtered, scores)
-        self.assertEqual(best.Name, 'Rose Delight')
+        rows, pool, scores = self.bot.rank_candidates('rose', 'rose', with_pool=True)
+        self.assertEqual(pool.tolist(), filtered.tolist())
+        self.assertGreater(scores[0], 0)
+        self.assertEqual(self.bot.catalog.perfume(rows[0]).Name, 'Rose Delight')
 
     @patch('random.choice', lambda seq: seq[0])
     def test_compose_response_name_only(self):
@@ -117,5 +207,935 @@ class TestPerfumeChatbot(unittest.TestCase):
         resp2 = self.bot.process_input('hello')
         self.assertIsInstance(resp2, str)
 
+class TestCaching(unittest.TestCase):
+    def test_lru_cache_evicts_and_invalidates_on_version_change(self):
+        cache = LRUCache(maxsize=2)
+        cache.put('a', 1, version='v1')
+        cache.put('b', 2, version='v1')
+        self.assertEqual(cache.get('a', version='v1'), 1)
+        cache.put('c', 3, version='v1')
+        self.assertIsNone(cache.get('b', version='v1'))
+        self.assertEqual(cache.get('c', version='v1'), 3)
+        self.assertIsNone(cache.get('a', version='v2'))
+        self.assertEqual(cache.stats(), {'size': 0, 'maxsize': 2, 'hits': 2, 'misses': 2, 'evictions': 1,
+                                         'invalidations': 1})
+
+    def test_cached_ranking_matches_uncached(self):
+        bot = make_toy_bot()
+        first = bot.rank_candidates('rose and lavender', 'rose')
+        second = bot.rank_candidates('lavender, rose!', 'rose')
+        self.assertIs(first, second)
+        self.assertEqual(first.tolist(), [0])
+        self.assertEqual(bot.rank_candidates('anything', '').tolist(), [0, 1])
+        self.assertEqual(bot.cache_stats()['candidates']['hits'], 1)
+        bot._fit_dataset(pd.DataFrame(data))
+        self.assertEqual(bot.rank_candidates('rose and lavender', 'rose').tolist(), [0])
+        self.assertEqual(bot.candidate_cache.invalidations, 1)
+
+    def test_route_cache_reuses_decisions(self):
+        bot = IntentChatbot(name='CacheTest')
+        bot.analyzer = MagicMock()
+        bot.analyzer.polarity_scores.return_value = {'compound': 0.0}
+        self.assertEqual(bot.route('qwerty'), 'default')
+        self.assertEqual(bot.route('qwerty'), 'default')
+        self.assertEqual(bot.analyzer.polarity_scores.call_count, 1)
+        self.assertEqual(bot.route_cache.hits, 1)
+
+class TestDiverseRecommendations(unittest.TestCase):
+    def setUp(self):
+        self.bot = PerfumeChatbot(name='Diverse', dataset=pd.DataFrame({
+            'Name': ['Rose A1', 'Rose A2', 'Rose A3', 'Rose B1', 'Rose C1'],
+            'Brand': ['A', 'A', 'A', 'B', 'C'],
+            'Notes': ['rose, musk, oud', 'rose, musk', 'rose, musk', 'rose', 'rose'],
+        }))
+        self.bot.scent_keywords = {'rose': ['rose']}
+
+    def test_diversify_spreads_brands_but_keeps_the_best_first(self):
+        rows, scores, brands = np.arange(5), np.array([3, 2, 2, 1, 1]), np.array([0, 0, 0, 1, 2])
+        self.assertEqual(diversify(rows, scores, brands, 0.0, 5).tolist(), [0, 1, 2, 3, 4])
+        self.assertEqual(diversify(rows, scores, brands, 0.5, 5).tolist(), [0, 3, 4, 1, 2])
+        self.assertEqual(diversify(rows, scores, brands, 0.5, 2).tolist(), [0, 3])
+
+    def test_recommend_many(self):
+        names = [perfume.Name for perfume in self.bot.recommend_many('Rose with musk and oud', 3)]
+        self.assertEqual(names, ['Rose A1', 'Rose B1', 'Rose C1'])
+        self.assertEqual(len(self.bot.recommend_many('rose', 10)), 5)
+
+    @patch('random.choice', lambda seq: seq[0])
+    def test_session_pages_through_the_ranking(self):
+        session = ChatSession('s1')
+        shown = [self.bot.process_input('i like rose', session) for _ in range(2)]
+        shown += [self.bot.process_input(text, session) for text in ('next', 'tell me a joke', 'other one')]
+        names = ['Rose A1', 'Rose B1', 'Rose C1', None, 'Rose A2']
+        for response, name in zip(shown, names):
+            if name:
+                self.assertIn(f'[{name}]', response)
+        self.assertEqual(session.recommendations.position, 4)
+        # "other" inside another word does not page
+        self.bot.process_input('what should i buy for my mother', session)
+        self.assertEqual(session.recommendations.position, 4)
+        rows = session.recommendations.rows
+        self.bot.process_input('next', session)
+        self.assertEqual(self.bot.process_input('next', session), self.bot.EXHAUSTED_MESSAGE)
+        self.assertIs(session.recommendations.rows, rows)
+        # Without a session every request is answered on its own
+        self.assertIn('[Rose A1]', self.bot.process_input('i like rose'))
+        self.assertIn('[Rose A1]', self.bot.process_input('i like rose'))
+
+class TestRefinement(unittest.TestCase):
+    def setUp(self):
+        self.bot = PerfumeChatbot(name='Refine', diversity=0.0, dataset=pd.DataFrame({
+            'Name': ['Plain Rose', 'Musky Rose', 'Cedar Rose', 'Cedar', 'Vanilla Rose'],
+            'Brand': ['A', 'B', 'C', 'D', 'E'],
+            'Notes': ['rose', 'rose, musk', 'rose, cedar, musk', 'cedar', 'rose, vanilla'],
+        }))
+        self.bot.scent_keywords = {'rose': ['rose'], 'woody': ['cedar'], 'sweet': ['vanilla']}
+        self.bot.intent_chatbot.analyzer = MagicMock()
+        self.bot.intent_chatbot.analyzer.polarity_scores.return_value = {'compound': 0.0}
+
+    def test_parser(self):
+        parser = RefinementParser(self.bot.scent_keywords, {'oud', 'musk', 'vanilla', 'tonka bean'}.__contains__)
+        self.assertEqual(parser.parse('something like that but woodier'), Refinement(('woody',), (), (), False))
+        self.assertEqual(parser.parse('less sweet, without oud and musk please'),
+                         Refinement((), ('sweet',), ('oud', 'musk'), False))
+        self.assertEqual(parser.parse('a bit more of the tonka bean, vanilla'),
+                         Refinement(('tonka bean', 'vanilla'), (), (), False))
+        self.assertEqual(parser.parse('no more musk'), Refinement((), (), ('musk',), False))
+        self.assertEqual(parser.parse('more expensive than that'), Refinement((), (), (), True))
+        self.assertEqual(parser.parse('a lower price please'), Refinement((), (), (), True))
+        # A price word without a cue is not a price comparison
+        self.assertEqual(parser.parse('the price is fine, just woodier'), Refinement(('woody',), (), (), False))
+        self.assertEqual(parser.parse('cheaper and without musk'), Refinement((), (), ('musk',), True))
+        self.assertTrue(parser.parse('i like rose').empty)
+        # A cue only takes the notes right after it
+        self.assertTrue(parser.parse('no i want something with vanilla').empty)
+        self.assertTrue(parser.parse('no, i want vanilla').empty)
+        self.assertTrue(parser.parse('tell me more about vanilla').empty)
+        self.assertEqual(parser.parse('without musk i want vanilla'), Refinement((), (), ('musk',), False))
+
+    @patch('random.choice', lambda seq: seq[0])
+    def test_refining_after_a_catalog_update_still_skips_shown_perfumes(self):
+        session = ChatSession('s1')
+        self.bot.process_input('i like rose', session)
+        self.bot.process_input('next', session)
+        self.assertEqual(session.recommendations.shown, (('Plain Rose', 'A'), ('Musky Rose', 'B')))
+        self.bot.add_perfume('Musk Rose', 'F', 'rose, musk')
+        self.bot.process_input('more musk', session)
+        names = [self.bot.catalog.perfume(row).Name for row in session.recommendations.rows]
+        self.assertIn('Musk Rose', names)
+        self.assertFalse({'Plain Rose', 'Musky Rose'} & set(names))
+
+    @patch('random.choice', lambda seq: seq[0])
+    def test_new_requests_are_not_taken_for_refinements(self):
+        session = ChatSession('s1')
+        self.bot.process_input('i like rose', session)
+        self.assertIn('[Vanilla Rose]', self.bot.process_input('no I want a rose with vanilla', session))
+        self.assertEqual(session.recommendations.context.excluded_notes(), [])
+        # A new search for rose, not the previous one refined
+        self.bot.process_input('tell me more about rose', session)
+        self.assertEqual(session.recommendations.key, ('rose', ('rose',)))
+
+    @patch('random.choice', lambda seq: seq[0])
+    def test_follow_ups_rerank_the_kept_candidates(self):
+        session = ChatSession('s1')
+        self.assertIn('[Plain Rose]', self.bot.process_input('i like rose', session))
+        context = session.recommendations.context
+        self.assertEqual(sorted(context.candidate_rows().tolist()), [0, 1, 2, 4])
+
+        sink = HistogramSink()
+        self.bot.instrument(Instrumentation([sink]))
+        self.assertIn('[Cedar Rose]', self.bot.process_input('something like that but woodier', session))
+        # Only the kept candidates were scored, and the perfume already shown is left out
+        self.assertEqual(sink.summary()['counters'], {'candidates_scanned': 3})
+        self.assertEqual(sink.summary()['turns'], {'refine': 1})
+        self.assertIn('[Musky Rose]', self.bot.process_input('next', session))
+
+        page = session.recommendations
+        self.assertTrue(self.bot.process_input('cheaper than that', session).startswith("I don't have prices"))
+        self.assertIs(session.recommendations, page)
+
+        self.assertIn('[Vanilla Rose]', self.bot.process_input('without musk', session))
+        self.assertEqual(self.bot.process_input('next', session), self.bot.EXHAUSTED_MESSAGE)
+        self.assertEqual(session.recommendations.context.excluded_notes(),
+                         list(self.bot.note_matrix.note_ids('musk')))
+
+    def test_refinement_after_a_catalog_update_ranks_the_catalog_again(self):
+        session = ChatSession('s1')
+        self.bot.process_input('i like rose', session)
+        self.bot.add_perfume('Oak Rose', 'F', 'rose, cedar')
+        self.bot.process_input('woodier', session)
+        rows = session.recommendations.rows
+        self.assertEqual(self.bot.snapshot.catalog.perfume(rows[0]).Name, 'Cedar Rose')
+        self.assertIn(5, rows)
+
+    def test_session_store_expires_idle_sessions(self):
+        store = SessionStore(max_sessions=2, ttl=60)
+        store.get('a').last_seen -= 120
+        store.get('b')
+        store.get('c')
+        self.assertNotIn('a', store)
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.expire(), 0)
+
+class TestCatalog(unittest.TestCase):
+    def test_constructor_leaves_dataset_untouched(self):
+        df = pd.DataFrame({'Name': ['A', None], 'Brand': ['X', 'X'], 'Notes': ['Rose, musk', None],
+                           'Description': ['long text', 'more'], 'Image URL': ['u1', 'u2']})
+        before = df.copy()
+        bot = PerfumeChatbot(name='Frozen', dataset=df)
+        pd.testing.assert_frame_equal(df, before)
+        self.assertEqual(bot.catalog.perfume(1), ('', 'X', ''))
+        self.assertEqual(bot.catalog.extra_columns, {})
+        self.assertFalse(bot.catalog.brand_codes.flags.writeable)
+
+    def test_brands_are_interned_and_notes_parsed_to_ids(self):
+        catalog = PerfumeCatalog.from_frame(pd.DataFrame({
+            'Name': ['A', 'B', 'C'], 'Brand': ['X', 'Y', 'X'],
+            'Notes': [' Rose, Musk', 'musk,  rose , rose', ''], 'Description': ['d1', 'd2', 'd3'],
+        }), extra_columns=['Description'])
+        self.assertEqual(catalog.brands, ('X', 'Y'))
+        self.assertEqual(catalog.brand_codes.tolist(), [0, 1, 0])
+        self.assertEqual(catalog.note_vocabulary, ('rose', 'musk'))
+        self.assertEqual(catalog.note_names(1), ['musk', 'rose'])
+        self.assertEqual(catalog.note_names(2), [])
+        self.assertEqual(catalog.column('Description')[2], 'd3')
+        with self.assertRaises(KeyError):
+            catalog.column('Image URL')
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.bot = make_toy_bot()
+        self.bot.intent_chatbot.analyzer = MagicMock()
+        self.bot.intent_chatbot.analyzer.polarity_scores.return_value = {'compound': 0.0}
+
+    def test_turns_record_stages_counters_and_route(self):
+        sink, log = HistogramSink(), io.StringIO()
+        self.bot.instrument(Instrumentation([sink, JsonLogSink(log)]))
+        self.bot.process_input('I like rose')
+        self.bot.process_input('I like rose')
+        self.bot.process_input('qwerty')
+        summary = sink.summary()
+        self.assertEqual(summary['turns'], {'scent': 2, 'default': 1})
+        self.assertEqual(summary['counters'], {'candidate_cache_misses': 1, 'candidates_scanned': 1,
+                                               'candidate_cache_hits': 1, 'route_cache_misses': 1})
+        self.assertEqual(summary['stages']['turn']['count'], 3)
+        self.assertEqual(summary['stages']['score']['count'], 1)
+        self.assertIn('sentiment', summary['stages'])
+        lines = [json.loads(line) for line in log.getvalue().splitlines()]
+        self.assertEqual([line['route'] for line in lines], ['scent', 'scent', 'default'])
+
+    def test_disabling_removes_the_wrappers(self):
+        self.bot.instrument(Instrumentation([HistogramSink()]))
+        self.assertIn('process_input', vars(self.bot))
+        self.bot.instrument(None)
+        self.assertNotIn('process_input', vars(self.bot))
+        self.assertNotIn('route', vars(self.bot.intent_chatbot))
+        self.assertFalse(self.bot.instrumentation.enabled)
+
+    def test_prometheus_text(self):
+        sink = PrometheusSink()
+        self.bot.instrument(Instrumentation([sink]))
+        self.bot.process_input('I like citrus')
+        text = sink.render()
+        self.assertIn('perfumer_stage_seconds_count{stage="turn"} 1', text)
+        self.assertIn('perfumer_stage_seconds_bucket{stage="turn",le="+Inf"} 1', text)
+        self.assertIn('perfumer_turns_total{route="scent"} 1', text)
+
+class TestNoteIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = NoteIndex(['Primrose, musk', 'rose lavender', 'Rosewood, Musks', ''])
+
+    def test_filter_rows_matches_substrings_case_insensitively(self):
+        self.assertEqual(self.index.filter_rows('rose').tolist(), [0, 1, 2])
+        self.assertEqual(self.index.filter_rows('MUSK').tolist(), [0, 2])
+        self.assertEqual(self.index.filter_rows('').tolist(), [0, 1, 2, 3])
+        self.assertEqual(self.index.filter_rows('oud').tolist(), [])
+
+class TestNoteMatrix(unittest.TestCase):
+    def setUp(self):
+        self.catalog = PerfumeCatalog.from_columns(
+            ['A', 'B', 'C', 'D'], ['X', 'Y', 'X', 'Z'],
+            [' Damask Roses, Musks', 'Primrose, rosewood', 'Ylang-Ylang, vanilla bean', 'rose, rose de mai & amber'])
+        self.notes = NoteMatrix.fit(self.catalog, ['rose', 'ylang ylang', 'vanilla', 'amber'])
+
+    def test_notes_fold_onto_keywords_and_singulars(self):
+        self.assertEqual(singular('berries'), 'berry')
+        self.assertEqual(singular('iris'), 'iris')
+        self.assertEqual(canonical_note(' Ylang-Ylangs'), 'ylang ylang')
+        rose = self.notes.ids['rose']
+        self.assertEqual(self.notes.matrix[rose].indices.tolist(), [0, 3])
+        self.assertEqual(self.notes.by_perfume[2].indices.tolist(),
+                         sorted(self.notes.ids[term] for term in ['ylang ylang', 'vanilla bean', 'vanilla']))
+        self.assertEqual([self.notes.terms[note] for note in self.notes.note_ids('Roses and lily of the valley, musk')],
+                         ['rose', 'musk'])
+
+    def test_rank_weights_notes_without_substring_matches(self):
+        rows = np.arange(4)
+        weights = {self.notes.ids['rose']: 1.0, self.notes.ids['amber']: 0.5}
+        self.assertEqual(self.notes.score(rows, weights).tolist(), [1.0, 0.0, 0.0, 1.5])
+        self.assertEqual(self.notes.score(np.array([3]), weights).tolist(), [1.5])
+        ranked, scores = self.notes.rank(rows, weights, 2)
+        self.assertEqual(ranked.tolist(), [3, 0])
+        self.assertEqual(self.notes.rank(rows, {}, 2)[0].tolist(), [0, 1])
+
+    def test_extend_matches_fit(self):
+        catalog = self.catalog.extend([{'Name': 'E', 'Brand': 'Y', 'Notes': 'oud, Roses'}])
+        extended, fitted = self.notes.extend(catalog), NoteMatrix.fit(catalog, self.notes.parser.keywords)
+        self.assertEqual(extended.terms, fitted.terms)
+        self.assertEqual((extended.matrix != fitted.matrix).nnz, 0)
+        self.assertEqual((extended.by_perfume != fitted.by_perfume).nnz, 0)
+        self.assertEqual(extended.document_frequencies(np.array([1, 1, 1, 0, 1], dtype=bool))[extended.ids['rose']], 2)
+
+    def test_chatbot_scores_whole_notes(self):
+        bot = PerfumeChatbot(name='NoteTest', dataset=pd.DataFrame({
+            'Name': ['Prim', 'Real'], 'Brand': ['A', 'B'], 'Notes': ['primrose, rosewood', 'musk, roses']}))
+        rows, pool, scores = bot.rank_candidates('i like rose', '', with_pool=True)
+        self.assertEqual(rows[0], 1)
+        # "primrose" and "rosewood" are not rose
+        self.assertEqual(pool.tolist(), [1, 0])
+        self.assertGreater(scores[0], 0)
+        self.assertEqual(scores[1], 0)
+
+class TestShardedRanking(unittest.TestCase):
+    def make_bot(self, mode, shards=1):
+        names = [f'P{i}' for i in range(11)]
+        notes = ['rose, musk', 'rose', 'citrus, lemon', 'musk', 'rose, lemon, amber', 'amber', 'lemon',
+                 'rose, amber', 'citrus', 'musk, amber', 'rose, citrus']
+        bot = PerfumeChatbot(name='Sharded', mode=mode, shards=shards, shard_deadline=5, dataset=pd.DataFrame(
+            {'Name': names, 'Brand': [f'B{i % 4}' for i in range(11)], 'Notes': notes}))
+        bot.scent_keywords = {'rose': ['rose'], 'citrus': ['citrus', 'lemon']}
+        self.addCleanup(bot.close)
+        return bot
+
+    def test_shards_rank_like_one_process(self):
+        for mode in ('keyword', 'tfidf'):
+            local, sharded = self.make_bot(mode), self.make_bot(mode, shards=3)
+            for query, category in [('rose and amber', 'rose'), ('lemon musk', 'citrus'), ('amber', '')]:
+                self.assertEqual(sharded.rank_candidates(query, category).tolist(),
+                                 local.rank_candidates(query, category).tolist(), (mode, query))
+            local.add_perfume('P11', 'B0', 'amber, rose, musk')
+            sharded.add_perfume('P11', 'B0', 'amber, rose, musk')
+            self.assertEqual(sharded.rank_candidates('amber musk', '').tolist(),
+                             local.rank_candidates('amber musk', '').tolist())
+
+    def pause_worker(self, bot, shard):
+        # A stopped worker is alive but never answers
+        process = bot.shard_ranker._processes[shard]
+        os.kill(process.pid, signal.SIGSTOP)
+        self.addCleanup(os.kill, process.pid, signal.SIGCONT)
+
+    def test_missing_shard_gives_uncached_partial_result(self):
+        bot = self.make_bot('keyword', shards=2)
+        bot.intent_chatbot.analyzer = MagicMock()
+        bot.intent_chatbot.analyzer.polarity_scores.return_value = {'compound': 0.0}
+        bot.warmup()
+        bot.shard_ranker.deadline = 0.5
+        self.pause_worker(bot, 1)
+        sink = HistogramSink()
+        bot.instrument(Instrumentation([sink]))
+        bot.process_input('I like rose')
+        self.assertEqual(sink.summary()['counters']['shard_timeouts'], 1)
+        self.assertEqual(len(bot.candidate_cache), 0)
+        self.assertTrue(set(bot.rank_candidates('rose', 'rose').tolist()) <= {0, 1, 4})
+
+    def test_slow_shard_does_not_hold_up_other_queries(self):
+        bot = self.make_bot('keyword', shards=2)
+        bot.warmup()
+        bot.shard_ranker.deadline = 1.0
+        self.pause_worker(bot, 1)
+        weights = {bot.note_matrix.ids['rose']: 1.0}
+        started = time.monotonic()
+        threads = [threading.Thread(target=bot.shard_ranker.rank, args=('keyword', weights, '', 5)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # The queries wait out the deadline together, not one after another
+        self.assertLess(time.monotonic() - started, 2.0)
+
+    def test_dead_worker_is_restarted(self):
+        bot = self.make_bot('keyword', shards=2)
+        expected = bot.rank_candidates('rose', '').tolist()
+        process = bot.shard_ranker._processes[1]
+        process.kill()
+        process.join()
+        result = bot.shard_ranker.rank('keyword', {bot.note_matrix.ids['rose']: 1.0}, '', 5)
+        self.assertTrue(result.complete)
+        self.assertEqual(bot.shard_ranker.restarts, 1)
+        bot.candidate_cache.clear()
+        self.assertEqual(bot.rank_candidates('rose', '').tolist(), expected)
+
+    def test_close_stops_workers_and_removes_shards(self):
+        bot = self.make_bot('keyword', shards=2)
+        bot.rank_candidates('rose', '')
+        directory, processes = bot.shard_ranker._directory, bot.shard_ranker._processes
+        bot.close()
+        self.assertFalse(os.path.exists(directory))
+        self.assertFalse(any(process.is_alive() for process in processes))
+        self.assertEqual(sorted(bot.rank_candidates('musk', '').tolist()[:3]), [0, 3, 9])
+
+class TestScentDetector(unittest.TestCase):
+    def setUp(self):
+        self.detector = ScentDetector({
+            'floral': ['rose', 'cherry blossom', 'ylang-ylang'],
+            'citrus': ['lime', 'orange', 'orange blossom'],
+            'fruity': ['cherry', 'orange'],
+            'herbal': ['rosemary'],
+        })
+
+    def test_multi_word_keywords_and_overlaps(self):
+        match = self.detector.detect('Something with Orange Blossom and cherry blossom')
+        self.assertEqual(match.categories, ['floral', 'citrus', 'fruity'])
+        self.assertEqual(set(match.terms), {'orange', 'orange blossom', 'cherry', 'cherry blossom'})
+
+    def test_word_boundaries(self):
+        self.assertEqual(self.detector.detect('sublime rosemary').categories, ['herbal'])
+        self.assertEqual(self.detector.detect('roses and limes').terms, ['rose', 'lime'])
+        self.assertEqual(self.detector.detect('ylang-ylang!').categories, ['floral'])
+        self.assertEqual(self.detector.detect('primrose').categories, [])
+
+    def test_process_input_uses_first_detected_category(self):
+        bot = PerfumeChatbot(name='DetectTest', dataset=pd.DataFrame(data))
+        bot.scent_keywords = {'citrus': ['lemon'], 'rose': ['rose']}
+        self.assertEqual(bot.detect_scents('rose or lemon').categories, ['citrus', 'rose'])
+        self.assertIn('Citrus Splash', bot.process_input('rose or lemon'))
+
+    def test_matched_terms_reach_the_ranking(self):
+        bot = PerfumeChatbot(name='DetectTest', dataset=pd.DataFrame(data))
+        bot.scent_keywords = {'citrus': ['lemon'], 'rose': ['rose']}
+        with patch.object(bot, 'extract_keywords') as extract, \
+                patch.object(bot, 'rank_candidates', wraps=bot.rank_candidates) as rank:
+            self.assertIn('Citrus Splash', bot.process_input('rose or lemon', ChatSession('s1')))
+        extract.assert_not_called()
+        ids = bot.note_matrix.ids
+        self.assertEqual(rank.call_args.kwargs['notes'], (ids['rose'], ids['lemon']))
+
+    def test_notes_without_a_keyword_still_rank(self):
+        bot = PerfumeChatbot(name='DetectTest', dataset=pd.DataFrame({
+            'Name': ['Neroli Rose', 'Cistus Rose'],
+            'Brand': ['A', 'B'],
+            'Notes': ['rose, neroli', 'rose, cistus'],
+        }))
+        bot.scent_keywords = {'rose': ['rose']}
+        session = ChatSession('s1')
+        self.assertIn('[Cistus Rose]', bot.process_input('rose and cistus', session))
+        self.assertIn('[Neroli Rose]', bot.process_input('rose and neroli', session))
+        self.assertEqual([perfume.Name for perfume in bot.recommend_many('cistus and rose', 1)], ['Cistus Rose'])
+
+class TestSpellingCorrector(unittest.TestCase):
+    def setUp(self):
+        self.corrector = SpellingCorrector({'vanilla': 5, 'sandalwood': 3, 'wood': 4, 'jasmin': 2, 'jasmine': 1},
+                                           keywords=['vanilla', 'sandalwood', 'jasmine'], protected=['would'])
+
+    def test_corrects_within_the_edit_budget(self):
+        self.assertEqual(self.corrector.correct('vanila'), 'vanilla')
+        self.assertEqual(self.corrector.correct('sandlewood'), 'sandalwood')
+        self.assertEqual(self.corrector.correct('jasmin'), 'jasmine')
+        self.assertEqual(self.corrector.correct('vnlla'), 'vnlla')
+        self.assertEqual(self.corrector.correct('woody'), 'wood')
+        self.assertEqual(self.corrector.correct('leather'), 'leather')
+        self.assertEqual(edit_distance('vanilla', 'vanilal', 2), 1)
+
+    def test_correct_text_keeps_protected_and_short_words(self):
+        self.assertEqual(self.corrector.correct_text('I would like Vanila, wod'), 'I would like vanilla, wod')
+
+    def test_chatbot_recommends_despite_typos(self):
+        bot = make_toy_bot()
+        bot.scent_keywords = {'rose': ['rose'], 'citrus': ['citrus', 'lemon']}
+        self.assertEqual(bot.correct_spelling('something citrusy'), 'something citrus')
+        self.assertIn('Citrus Splash', bot.process_input('something citrsu please'))
+
+    def test_valid_english_words_are_never_corrected(self):
+        bot = PerfumeChatbot(name='Words', dataset=pd.DataFrame({
+            'Name': ['Orchard', 'Spice Box', 'Oddities'],
+            'Brand': ['A', 'B', 'C'],
+            'Notes': ['peach, clover, vanilla', 'cloves, musc', 'tire, part'],
+        }))
+        bot.scent_keywords = {'fruity': ['peach'], 'spicy': ['clove'], 'green': ['clover'], 'sweet': ['vanilla']}
+        for text in ('i love the beach', 'i am a lover of music', 'my girlfriend loves roses',
+                     'tired after the party'):
+            self.assertEqual(bot.correct_spelling(text), text)
+            self.assertEqual(bot.detect_scents(text).categories, [])
+        self.assertEqual(bot.correct_spelling('vanila and peaches'), 'vanilla and peaches')
+
+class TestTfidfRetriever(unittest.TestCase):
+    def setUp(self):
+        notes = ['rose lavender', 'citrus lemon', 'rose oud amber', 'floral rose']
+        vectorizer = TfidfVectorizer()
+        matrix = vectorizer.fit_transform(notes)
+        self.retriever = TfidfRetriever(vectorizer, matrix, NoteIndex(notes))
+
+    def test_search_ranks_and_limits_results(self):
+        hits = self.retriever.search('rose oud', k=2)
+        self.assertEqual([row for row, _ in hits], [2, 0])
+        self.assertGreater(hits[0][1], hits[1][1])
+        self.assertEqual(self.retriever.search('patchouli'), [])
+
+    def test_search_restricted_to_category(self):
+        hits = self.retriever.search('rose', k=5, scent_category='floral')
+        self.assertEqual([row for row, _ in hits], [3])
+
+    def test_search_batch_matches_single_queries(self):
+        queries = ['rose', 'lemon', 'amber rose']
+        self.retriever.batch_size = 2
+        batch = self.retriever.search_batch(queries, k=3)
+        self.assertEqual(batch, [self.retriever.search(q, k=3) for q in queries])
+
+    def test_top_k_breaks_boundary_ties_toward_lower_rows(self):
+        scores = np.ones(1000)
+        scores[500] = 2.0
+        self.assertEqual(TfidfRetriever._top_k(scores, 3), [(500, 2.0), (0, 1.0), (1, 1.0)])
+
+    def test_query_encoder_matches_fitted_vectorizer(self):
+        vectorizer = self.retriever.vectorizer
+        encoder = TfidfQueryEncoder(vectorizer.vocabulary_, vectorizer.idf_)
+        queries = ['Rose ROSE oud', 'unknown words only', 'amber, lemon & rose']
+        np.testing.assert_allclose(encoder.transform(queries).toarray(), vectorizer.transform(queries).toarray())
+
+    def test_tfidf_mode_on_chatbot(self):
+        df = pd.DataFrame(data)
+        bot = PerfumeChatbot(name='TfidfTest', dataset=df, mode='tfidf')
+        self.assertIn('Citrus Splash', bot.recommend_perfume('lemon please', ''))
+        with self.assertRaises(ValueError):
+            PerfumeChatbot(name='Bad', dataset=df, mode='unknown')
+
+class TestIngest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_rows_are_repaired_skipped_and_deduplicated(self):
+        path = self.write('feed.csv', b'Name,Brand,Description,Notes\r\n'
+                                      b'Concentr\xc3\xa9e,A,"long, ""quoted"" text",rose\r\n'
+                                      b'Caf\xe9  Noir,B,dark\x85,"coffee,\nvanilla"\r\n'
+                                      b'Short,C\r\n'
+                                      b'Extra,D,x,musk,surplus\r\n'
+                                      b',E,x,amber\r\n'
+                                      b'Concentr\xc3\xa9e,A,again,oud\r\n')
+        self.assertEqual(detect_encoding(path), 'utf-8')
+        report = IngestReport()
+        chunks = list(read_chunks(path, chunk_size=2, report=report))
+        self.assertEqual([len(chunk['Name']) for chunk in chunks], [2, 1])
+        self.assertNotIn('Description', chunks[0])
+        self.assertEqual(chunks[0], {'Name': ['Concentrée', 'Café Noir'], 'Brand': ['A', 'B'],
+                                     'Notes': ['rose', 'coffee, vanilla']})
+        self.assertEqual(chunks[1]['Notes'], [''])
+        self.assertEqual((report.rows, report.duplicates, report.skipped, report.repaired), (3, 1, 2, 2))
+
+    def test_legacy_file_and_journal_replay(self):
+        path = self.write('legacy.csv', b'Notes,Name\nrose,Caf\xe9\nmusk,Other\n')
+        self.assertEqual(detect_encoding(path), 'cp1252')
+        updates = [{'op': 'delete', 'Name': 'Other', 'Brand': ''},
+                   {'op': 'put', 'Name': 'Oud Night', 'Brand': 'C', 'Notes': 'oud'}]
+        catalog = read_catalog(path, updates, chunk_size=1)
+        self.assertEqual([catalog.perfume(row) for row in range(len(catalog))],
+                         [Perfume('Café', '', 'rose'), Perfume('Oud Night', 'C', 'oud')])
+        self.assertEqual(catalog.note_names(1), ['oud'])
+        with self.assertRaises(ValueError):
+            list(read_chunks(self.write('bad.csv', b'Title,Notes\nx,rose\n')))
+
+class TestArtifacts(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.csv_path = os.path.join(self.tmp.name, 'perfumes.csv')
+        self.keywords_path = os.path.join(self.tmp.name, 'keywords.json')
+        self.root = os.path.join(self.tmp.name, 'artifacts')
+        pd.DataFrame(data).to_csv(self.csv_path, index=False)
+        with open(self.keywords_path, 'w', encoding='utf-8') as f:
+            json.dump({'rose': ['rose'], 'citrus': ['citrus']}, f)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_load_or_build_memory_maps_arrays(self):
+        bundle = load_or_build(self.csv_path, self.keywords_path, self.root)
+        self.assertEqual(len(bundle), 2)
+        self.assertEqual(bundle.catalog.perfume(1).Name, 'Citrus Splash')
+        self.assertEqual(bundle.scent_keywords, {'rose': ['rose'], 'citrus': ['citrus']})
+        self.assertEqual(bundle.note_index.filter_rows('lemon').tolist(), [1])
+        reloaded = load_or_build(self.csv_path, self.keywords_path, self.root)
+        self.assertEqual(reloaded.path, bundle.path)
+        self.assertIsInstance(np.load(os.path.join(reloaded.path, 'tfidf_data.npy'), mmap_mode='r'), np.memmap)
+        with open(os.path.join(reloaded.path, 'note_vocabulary.json'), encoding='utf-8') as f:
+            self.assertIn(['rose', 1], json.load(f))
+        self.assertEqual(reloaded.note_matrix.note_ids('lemon'), bundle.note_matrix.note_ids('lemons'))
+        with open(os.path.join(reloaded.path, 'meta.json'), encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['ingest']['rows'], 2)
+
+    def test_stale_artifact_is_rebuilt(self):
+        first = load_or_build(self.csv_path, self.keywords_path, self.root)
+        pd.DataFrame({'Name': ['Oud Night'], 'Brand': ['BrandC'], 'Notes': ['oud amber']}).to_csv(self.csv_path, index=False)
+        second = load_or_build(self.csv_path, self.keywords_path, self.root)
+        self.assertNotEqual(first.key, second.key)
+        self.assertEqual(os.listdir(self.root), [os.path.basename(second.path)])
+        self.assertEqual(second.catalog.perfume(0).Name, 'Oud Night')
+
+    @patch('random.choice', lambda seq: seq[0])
+    def test_chatbot_from_files_matches_dataframe_bot(self):
+        from_files = PerfumeChatbot.from_files(name='Cached', csv_path=self.csv_path,
+                                               keywords_path=self.keywords_path, artifact_root=self.root)
+        from_frame = PerfumeChatbot(name='Frame', dataset=pd.DataFrame(data))
+        from_frame.scent_keywords = from_files.scent_keywords
+        for query in ['I like rose', 'citrus lemon please']:
+            self.assertEqual(from_files.process_input(query), from_frame.process_input(query))
+
+class TestCatalogUpdates(unittest.TestCase):
+    def setUp(self):
+        self.bot = PerfumeChatbot(name='Updates', dataset=pd.DataFrame(data), mode='tfidf')
+        self.bot.scent_keywords = {'rose': ['rose'], 'citrus': ['citrus']}
+
+    def test_add_update_remove_without_refitting(self):
+        before = self.bot.snapshot
+        row = self.bot.add_perfume('Oud Night', 'BrandC', 'oud amber rose')
+        self.assertEqual(row, 2)
+        self.assertEqual(self.bot.rank_candidates('oud', '')[0], 2)
+        self.assertEqual(self.bot._filter_by_scent_category('rose').tolist(), [0, 2])
+        # The snapshot a request already holds is untouched
+        self.assertEqual(len(before), 2)
+        self.assertEqual(before.retriever.search('oud'), [])
+        with self.assertRaises(ValueError):
+            self.bot.add_perfume('Oud Night', 'BrandC', 'oud')
+
+        self.assertEqual(self.bot.update_perfume('Rose Delight', 'BrandA', Notes='violet musk'), 3)
+        self.assertEqual(self.bot._filter_by_scent_category('rose').tolist(), [2])
+        self.bot.remove_perfume('Citrus Splash', 'BrandB')
+        self.assertNotIn(1, self.bot.rank_candidates('lemon', '').tolist())
+        with self.assertRaises(KeyError):
+            self.bot.remove_perfume('Citrus Splash', 'BrandB')
+
+        # Document frequencies are kept exact, so the idf matches a refit over the live rows
+        reference = TfidfVectorizer().fit(['Oud Night oud amber rose', 'Rose Delight violet musk'])
+        vectorizer = self.bot.tfidf_vectorizer
+        for term, column in reference.vocabulary_.items():
+            self.assertAlmostEqual(vectorizer.idf_[vectorizer.vocabulary_[term]], reference.idf_[column])
+
+    def test_concurrent_adds_return_their_own_rows(self):
+        names = [f'Perfume {i}' for i in range(8)]
+        rows = {}
+
+        def add(name):
+            rows[name] = self.bot.add_perfume(name, 'BrandC', 'oud')
+
+        threads = [threading.Thread(target=add, args=(name,)) for name in names]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for name, row in rows.items():
+            self.assertEqual(self.bot.catalog.perfume(row).Name, name)
+
+    def test_compaction_drops_removed_rows(self):
+        self.bot.add_perfume('Oud Night', 'BrandC', 'oud amber')
+        self.bot.remove_perfume('Rose Delight', 'BrandA')
+        self.bot.compact()
+        catalog = self.bot.catalog
+        self.assertEqual([catalog.perfume(row).Name for row in range(len(catalog))], ['Citrus Splash', 'Oud Night'])
+        self.assertIsNone(self.bot.snapshot.live)
+        self.assertEqual(self.bot.rank_candidates('oud', '')[0], 1)
+
+    def test_compaction_persists_the_journal(self):
+        with tempfile.TemporaryDirectory() as root:
+            csv_path = os.path.join(root, 'perfumes.csv')
+            keywords_path = os.path.join(root, 'keywords.json')
+            updates_path = os.path.join(root, 'updates.jsonl')
+            pd.DataFrame(data).to_csv(csv_path, index=False)
+            with open(keywords_path, 'w', encoding='utf-8') as f:
+                json.dump({'rose': ['rose'], 'citrus': ['citrus']}, f)
+            sources = dict(csv_path=csv_path, keywords_path=keywords_path,
+                           artifact_root=os.path.join(root, 'artifacts'), updates_path=updates_path)
+            bot = PerfumeChatbot.from_files(name='Journal', **sources)
+            bot.add_perfume('Oud Night', 'BrandC', 'oud amber')
+            bot.update_perfume('Oud Night', 'BrandC', Notes='oud, amber, saffron')
+            bot.update_perfume('Citrus Splash', 'BrandB', Name='Citrus Burst')
+            self.assertFalse(os.path.exists(updates_path))
+            bot.compact()
+            # One operation per perfume touched, in order of last write
+            self.assertEqual([(u['op'], u['Name']) for u in read_updates(updates_path)],
+                             [('put', 'Oud Night'), ('delete', 'Citrus Splash'), ('put', 'Citrus Burst')])
+
+            restarted = PerfumeChatbot.from_files(name='Restarted', **sources)
+            for catalog in (bot.catalog, restarted.catalog):
+                names = [catalog.perfume(row).Name for row in range(len(catalog))]
+                self.assertEqual(names, ['Rose Delight', 'Oud Night', 'Citrus Burst'])
+            self.assertEqual(restarted.catalog_version, bot.catalog_version)
+
+class WordHashEncoder:
+    """Deterministic stand-in for a sentence-transformers model: hashed bag of words."""
+
+    def __init__(self, dim=32):
+        self.dim = dim
+        self.calls = []
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, normalize_embeddings=True):
+        self.calls.append(list(texts))
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().replace('.', ' ').replace(',', ' ').split():
+                vectors[row, sum(map(ord, word)) % self.dim] += 1.0
+        return vectors
+
+
+class TestSemanticSearch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.csv_path = os.path.join(self.tmp.name, 'perfumes.csv')
+        self.root = os.path.join(self.tmp.name, 'embeddings')
+        pd.DataFrame({
+            'Name': ['Rose Delight', 'Citrus Splash', 'Fireside'],
+            'Brand': ['BrandA', 'BrandB', 'BrandC'],
+            'Notes': ['rose lavender', 'citrus lemon', 'amber vanilla'],
+            'Description': ['a garden in may', 'bright summer morning', 'cozy warm winter evening by the fire'],
+        }).to_csv(self.csv_path, index=False)
+        self.encoder = WordHashEncoder()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_quantized_indexes_agree_with_exact_search(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(300, 16)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        queries = vectors[:5]
+        exact = BruteForceIndex(vectors).search(queries, 3)
+        for dtype in ('float16', 'int8'):
+            index = BruteForceIndex(*quantize(vectors, dtype))
+            self.assertEqual([rows[0] for rows, _ in index.search(queries, 3)], [0, 1, 2, 3, 4])
+        ivf = IVFIndex.build(*quantize(vectors, 'float16'), n_lists=8)
+        ivf.n_probe = 8
+        for (rows, _), (expected, _) in zip(ivf.search(queries, 3), exact):
+            self.assertEqual(rows.tolist(), expected.tolist())
+        mask = np.zeros(300, dtype=bool)
+        mask[10:20] = True
+        rows, _ = BruteForceIndex(vectors).search(queries[:1], 50, mask)[0]
+        self.assertEqual(sorted(rows.tolist()), list(range(10, 20)))
+
+    def test_build_and_load_memory_mapped_matrix(self):
+        path = build_embeddings(self.csv_path, self.root, model='toy', dtype='int8', ivf_lists=2, encoder=self.encoder)
+        self.assertEqual(np.load(os.path.join(path, 'vectors.npy')).dtype, np.int8)
+        self.assertIsInstance(load_index(path), IVFIndex)
+        self.assertIsInstance(load_index(path, approximate=False), BruteForceIndex)
+
+    def test_query_embeddings_are_cached_and_batched(self):
+        retriever = load_semantic_retriever(self.csv_path, self.root, model='toy', encoder=self.encoder)
+        self.encoder.calls.clear()
+        results = retriever.search_batch(['Cozy  winter evening', 'summer morning', 'cozy winter evening'], k=1)
+        self.assertEqual([hits[0][0] for hits in results], [2, 1, 2])
+        self.assertEqual(self.encoder.calls, [['cozy winter evening', 'summer morning']])
+        retriever.search('summer morning', k=1)
+        self.assertEqual(len(self.encoder.calls), 1)
+
+    @patch('random.choice', lambda seq: seq[0])
+    def test_semantic_mode_answers_free_text(self):
+        keywords_path = os.path.join(self.tmp.name, 'keywords.json')
+        with open(keywords_path, 'w', encoding='utf-8') as f:
+            json.dump({'rose': ['rose'], 'citrus': ['citrus']}, f)
+        bot = PerfumeChatbot(name='Semantic', mode='semantic', artifact_loader=partial(
+            load_or_build, self.csv_path, keywords_path, os.path.join(self.tmp.name, 'artifacts')),
+            semantic_loader=partial(load_semantic_retriever, self.csv_path, self.root, model='toy', encoder=self.encoder))
+        bot.intent_chatbot.analyzer = MagicMock()
+        bot.intent_chatbot.analyzer.polarity_scores.return_value = {'compound': 0.0}
+        self.assertIn('Fireside', bot.process_input('something cozy for a winter evening'))
+        self.assertIn('Rose Delight', bot.process_input('I like rose'))
+        self.assertIn("didn't", bot.process_input('qwerty'))
+        # A real greeting is answered as one, not with a perfume
+        self.assertEqual(bot.process_input('hello'), bot.intent_chatbot.respond_small_talk())
+
+class TestLazyStartup(unittest.TestCase):
+    PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    IMPORT_BUDGET_SECONDS = 1.0
+
+    def test_import_time_benchmark(self):
+        script = (
+            "import json, sys, time\n"
+            "start = time.perf_counter()\n"
+            "import chatbot.perfume_chatbot\n"
+            "elapsed = time.perf_counter() - start\n"
+            "heavy = [m for m in ('pandas', 'sklearn', 'nltk', 'scipy') if m in sys.modules]\n"
+            "print(json.dumps({'seconds': elapsed, 'heavy': heavy}))\n"
+        )
+        result = subprocess.run([sys.executable, '-c', script], cwd=self.PROJECT_ROOT,
+                                capture_output=True, text=True, check=True)
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        self.assertEqual(report['heavy'], [])
+        self.assertLess(report['seconds'], self.IMPORT_BUDGET_SECONDS)
+
+    def test_intent_chatbot_loads_bundled_lexicon_on_first_use(self):
+        bot = IntentChatbot(name='Lazy')
+        self.assertIsNone(bot._analyzer)
+        self.assertTrue(bot.user_is_happy('What a wonderful, lovely day'))
+        self.assertIsNotNone(bot._analyzer)
+
+    def test_artifacts_load_on_first_use_or_warmup(self):
+        with tempfile.TemporaryDirectory() as root:
+            csv_path = os.path.join(root, 'perfumes.csv')
+            keywords_path = os.path.join(root, 'keywords.json')
+            pd.DataFrame(data).to_csv(csv_path, index=False)
+            with open(keywords_path, 'w', encoding='utf-8') as f:
+                json.dump({'rose': ['rose']}, f)
+            bot = PerfumeChatbot.from_files(name='Lazy', csv_path=csv_path, keywords_path=keywords_path,
+                                            artifact_root=os.path.join(root, 'artifacts'))
+            self.assertFalse(os.path.exists(os.path.join(root, 'artifacts')))
+            self.assertNotIn('snapshot', bot.__dict__)
+            bot.warmup()
+            self.assertIn('snapshot', bot.__dict__)
+            self.assertIn('Rose Delight', bot.process_input('I like rose'))
+
+class TestBatch(unittest.TestCase):
+    def test_read_queries_accepts_jsonl_and_plain_text(self):
+        stream = io.StringIO('I like rose\n\n{"id": "a1", "query": "citrus please"}\n{"text": "hello"}\n{not json\n')
+        records = list(read_queries(stream))
+        self.assertEqual([r['query'] for r in records], ['I like rose', 'citrus please', 'hello', '{not json'])
+        self.assertEqual([r['line'] for r in records], [1, 3, 4, 5])
+        self.assertEqual(records[1]['id'], 'a1')
+
+    def test_seeded_batch_is_reproducible_across_worker_counts(self):
+        lines = ['I like rose', 'citrus please', 'tell me a joke', 'hello'] * 10
+        outputs = []
+        for workers in (1, 2):
+            output = io.StringIO()
+            stats = run_batch(read_queries(io.StringIO('\n'.join(lines))), output, make_toy_bot,
+                              workers=workers, seed=3, chunk_size=4, report=None)
+            self.assertEqual(stats.queries, len(lines))
+            # Loading and warming up the workers is not counted against throughput
+            self.assertGreater(stats.startup_seconds, 0)
+            outputs.append(output.getvalue())
+        self.assertEqual(outputs[0], outputs[1])
+        results = [json.loads(line) for line in outputs[0].splitlines()]
+        self.assertEqual([r['line'] for r in results], list(range(1, len(lines) + 1)))
+        self.assertIn('Rose Delight', results[0]['response'])
+
+    def test_seeding_leaves_the_global_random_state_alone(self):
+        random.seed(1)
+        expected = random.random()
+        random.seed(1)
+        run_batch(read_queries(io.StringIO('I like rose\nhello')), io.StringIO(), make_toy_bot, seed=3, report=None)
+        self.assertEqual(random.random(), expected)
+
+    def test_worker_that_cannot_start_raises(self):
+        started = time.monotonic()
+        with self.assertRaisesRegex(RuntimeError, 'no catalog'):
+            run_batch(read_queries(io.StringIO('I like rose')), io.StringIO(), make_broken_bot, workers=2,
+                      report=None, startup_timeout=30)
+        self.assertLess(time.monotonic() - started, 30)
+
+def make_broken_bot():
+    raise FileNotFoundError('no catalog')
+
+class SlowEchoBot:
+    calls = 0
+    closed = 0
+    lock = threading.Lock()
+
+    def warmup(self):
+        pass
+
+    def close(self):
+        SlowEchoBot.closed += 1
+
+    def farewell_message(self):
+        return 'Bye'
+
+    def process_input(self, text):
+        if text == 'boom':
+            raise RuntimeError(text)
+        with SlowEchoBot.lock:
+            SlowEchoBot.calls += 1
+        time.sleep(0.2)
+        return f'echo {text}'
+
+    def process_turn(self, text, page=None):
+        # The page counts the session's turns
+        return self.process_input(text), (page or 0) + 1
+
+    def recommend_many(self, query, k):
+        return [Perfume(f'{query} {i}', 'Echo', '') for i in range(k)]
+
+async def post_json(port, payload, path='/chat'):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = json.dumps(payload).encode('utf-8')
+    writer.write(f'POST {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n'.encode('latin-1')
+                 + f'Content-Length: {len(body)}\r\n\r\n'.encode('latin-1') + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(payload)
+
+class TestChatServer(unittest.TestCase):
+    def run_with_server(self, scenario):
+        async def main():
+            server = ChatServer(SlowEchoBot, port=0, workers=4)
+            await server.start()
+            try:
+                return await scenario(server)
+            finally:
+                await server.close()
+        return asyncio.run(main())
+
+    def test_identical_inflight_queries_are_coalesced(self):
+        SlowEchoBot.calls = 0
+        async def scenario(server):
+            replies = await asyncio.gather(*[
+                post_json(server.port, {'session': f's{i}', 'message': 'Rose'}) for i in range(5)])
+            return server, replies
+        server, replies = self.run_with_server(scenario)
+        self.assertEqual({reply['response'] for _, reply in replies}, {'echo rose'})
+        self.assertEqual(SlowEchoBot.calls, 1)
+        self.assertEqual((server.computed, server.coalesced), (1, 4))
+        self.assertEqual(len(server.sessions), 5)
+
+    def test_session_state_and_errors(self):
+        async def scenario(server):
+            first = await post_json(server.port, {'session': 'abc', 'message': 'hello'})
+            bye = await post_json(server.port, {'session': 'abc', 'message': ' Bye '})
+            bad = await post_json(server.port, {'session': 'abc'})
+            return first, bye, bad, server.sessions.get('abc').conversation_is_active
+        first, bye, bad, active = self.run_with_server(scenario)
+        self.assertEqual(first, (200, {'session': 'abc', 'response': 'echo hello', 'active': True}))
+        self.assertEqual(bye, (200, {'session': 'abc', 'response': 'Bye', 'active': False}))
+        self.assertEqual(bad[0], 400)
+        self.assertFalse(active)
+
+    def test_turns_of_one_session_are_serialized(self):
+        async def scenario(server):
+            await asyncio.gather(*[post_json(server.port, {'session': 'same', 'message': f'm{i}'}) for i in range(3)])
+            return server.sessions.get('same').recommendations
+        self.assertEqual(self.run_with_server(scenario), 3)
+
+    def test_malformed_requests_and_handler_errors(self):
+        async def send_raw(port, request):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(request)
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+            return int(response.split()[1])
+
+        async def scenario(server):
+            bad_length = await send_raw(server.port, b'POST /chat HTTP/1.1\r\nContent-Length: ten\r\n\r\n')
+            failed = await post_json(server.port, {'session': 'abc', 'message': 'boom'})
+            return bad_length, failed
+        SlowEchoBot.closed = 0
+        bad_length, failed = self.run_with_server(scenario)
+        self.assertEqual(bad_length, 400)
+        self.assertEqual(failed, (500, {'error': 'internal error'}))
+        # Closing the server closes its chatbot
+        self.assertEqual(SlowEchoBot.closed, 1)
+
+    def test_recommend_endpoint(self):
+        async def scenario(server):
+            return (await post_json(server.port, {'query': 'rose', 'k': 2}, '/recommend'),
+                    await post_json(server.port, {'query': 'rose', 'k': 0}, '/recommend'))
+        ok, bad = self.run_with_server(scenario)
+        self.assertEqual(ok, (200, {'perfumes': [{'Name': 'rose 0', 'Brand': 'Echo', 'Notes': ''},
+                                                 {'Name': 'rose 1', 'Brand': 'Echo', 'Notes': ''}]}))
+        self.assertEqual(bad[0], 400)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file